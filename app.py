@@ -2,11 +2,13 @@ import streamlit as st
 import pandas as pd
 from dotenv import load_dotenv
 import os
-import matplotlib.pyplot as plt
-from src.preparar_datos import cargar_y_unir_datos
-from src.entrenar_modelo import entrenar_modelo_caudal
-from src.predecir_nivel import predecir_nivel
-from src.recomendaciones_ia import generar_recomendaciones_operativas
+from src.almacen_modelos import clave_vigente, obtener_pronostico
+from src.backtest import ARCHIVO_REPORTE, metricas_backtest
+from src.estaciones import cargar_estaciones, estacion_predeterminada
+from src.pronosticos import cargar_pronostico_publicado, version_vigente
+from src.instrumentacion import iniciar_servidor_metricas, tramo
+from src.grafico import serie_grafico
+from src.esquema import asignar, compactar, recortar
 from datetime import datetime, timedelta
 
 
@@ -15,26 +17,159 @@ from datetime import datetime, timedelta
 st.set_page_config(page_title="Predicción H44", layout="wide")
 st.title("🔵 Predicción del Nivel de Agua – Estación Antisana")
 
+# /metricas en texto de Prometheus si INSTRUMENTACION=1 e INSTRUMENTACION_PUERTO están definidos
+iniciar_servidor_metricas()
+
+def preparar_forecast(forecast):
+    # Limitar forecast completo hasta 2025 incluyendo columnas de confianza
+    # (esquema compacto en float32; el recorte es una vista, no una copia)
+    forecast = compactar(recortar(forecast, hasta="2026-01-01"))
+
+    # Eliminar columnas fuera del rango también si existen
+    recientes = forecast["ds"] >= pd.to_datetime("2024-01-01")
+    for columna in ("yhat_lower", "yhat_upper"):
+        if columna in forecast.columns:
+            asignar(forecast, columna, forecast[columna].where(~recientes))
+    return forecast
+
+
+# Lo normal es servir el último pronóstico publicado por `python main.py --lote`
+# (solo se lee un Parquet); si aún no hay ninguno, se recurre al almacén de
+# modelos, que entrena solo si cambian los datos o los hiperparámetros.
+# cache_resource: un único forecast preparado por versión, compartido entre
+# sesiones y reruns (cache_data devolvería una copia deserializada cada vez)
+@st.cache_resource(show_spinner=False)
+def cargar_publicado(version):
+    return preparar_forecast(cargar_pronostico_publicado(version)[0])
+
+
+@st.cache_resource(show_spinner=False)
+def cargar_pronostico(clave):
+    forecast, modelo, modelo_nivel = obtener_pronostico()
+    return preparar_forecast(forecast), modelo, modelo_nivel
+
+
 # Cargar y procesar datos
-with st.spinner("Entrenando modelo y generando predicción..."):
-    df = cargar_y_unir_datos()
-    forecast, modelo = entrenar_modelo_caudal(df)
-    forecast = predecir_nivel(forecast, df)
+version_publicada = version_vigente()
+if version_publicada is not None:
+    forecast = cargar_publicado(version_publicada)
+    clave_forecast = version_publicada
+else:
+    clave_forecast = clave_vigente()[0]
+    with st.spinner("Entrenando modelo y generando predicción..."):
+        forecast, modelo, modelo_nivel = cargar_pronostico(clave_forecast)
+
+
+# RMSE del último backtest (reportes/backtest.json): comprobar que corresponde a
+# los datos hashea los CSV, así que se hace una vez por versión y por reporte
+@st.cache_data(show_spinner=False)
+def metricas(version, reporte_modificado):
+    return metricas_backtest()
+
+
+reporte_modificado = os.path.getmtime(ARCHIVO_REPORTE) if os.path.exists(ARCHIVO_REPORTE) else None
+forecast.attrs.update(metricas(clave_forecast, reporte_modificado))
+
+
+# El HTML del mapa y la imagen en base64 no cambian entre reruns: una vez por proceso
+@st.cache_resource(show_spinner=False)
+def construir_mapa_html():
+    import folium
+
+    principal = estacion_predeterminada()
+    mapa = folium.Map(location=[principal.lat, principal.lon], zoom_start=11)
+
+    # 🟢 Estaciones del registro (estaciones.json)
+    for est in cargar_estaciones().values():
+        folium.Marker(
+            location=[est.lat, est.lon],
+            popup=f"Estación {est.nombre}" if est.codigo == principal.codigo else est.nombre,
+            tooltip=est.etiqueta or est.nombre,
+            icon=folium.Icon(color="green", icon="leaf")
+        ).add_to(mapa)
+
+    # 🔵 Embalse La Mica
+    folium.CircleMarker(
+        location=[-0.53806, -78.21015],
+        radius=12,
+        popup="Embalse La Mica",
+        color="red",
+        fill=True,
+        fill_opacity=0.5
+    ).add_to(mapa)
+
+    # 💧 Río Diguchi
+    folium.Marker(
+    location=[-0.5683880379564397, -78.2398390801277],
+    popup="Río Diguchi - Estación H44 DJ Diguchi",
+    tooltip="Río Diguchi (H44 DJ Diguchi)",
+    icon=folium.Icon(color="blue", icon="tint")
+    ).add_to(mapa)
+
+
+    # 💧 Río Antisana
+    folium.Marker(
+        location=[-0.5783880379564397, -78.2298390801277],
+        popup="Río Antisana",
+        tooltip="Río Antisana",
+        icon=folium.Icon(color="blue", icon="tint")
+    ).add_to(mapa)
+
+    # 💧 Río Jatunyacu
+    folium.Marker(
+        location=[-0.4935, -78.1810],
+        popup="Río Jatunyacu",
+        tooltip="Río Jatunyacu",
+        icon=folium.Icon(color="blue", icon="tint")
+    ).add_to(mapa)
+
+        # 🏭 Planta de tratamiento El Troje
+    folium.Marker(
+        location=[-0.33343, -78.52261],
+        popup="Planta de tratamiento El Troje",
+        tooltip="El Troje",
+        icon=folium.Icon(color="darkred", icon="industry", prefix='fa')
+    ).add_to(mapa)
+
+
+    # Renderizar mapa
+    mapa.get_root().html.add_child(folium.Element("""
+        <style>
+        html, body, #map { width: 100%; height: 100%; margin: 0; padding: 0; }
+        </style>
+    """))
+    with tramo("mapa"):
+        return mapa.get_root().render()
+
 
-    # Limitar forecast completo hasta 2023 incluyendo columnas de confianza
-forecast = forecast.loc[forecast["ds"] < pd.to_datetime("2026-01-01")].copy()
+@st.cache_data(show_spinner=False, max_entries=32)
+def csv_rango(version, desde, hasta):
+    serie = serie_grafico(forecast, version)
+    return serie.tabla(desde, hasta).to_csv(index=False).encode("utf-8")
 
-# Eliminar columnas fuera del rango también si existen
-if "yhat_lower" in forecast.columns:
-    forecast["yhat_lower"] = forecast["yhat_lower"].where(forecast["ds"] < pd.to_datetime("2024-01-01"))
-if "yhat_upper" in forecast.columns:
-    forecast["yhat_upper"] = forecast["yhat_upper"].where(forecast["ds"] < pd.to_datetime("2024-01-01"))
 
+# Índices de superación por versión del forecast: no se rehacen en cada rerun
+@st.cache_resource(show_spinner=False)
+def motor_alertas(version, estacion):
+    from src.alertas import MotorAlertas
+    alertas = MotorAlertas()
+    alertas.actualizar(estacion, forecast)
+    return alertas
 
-# Tabs
-tab1, tab2, tab3 = st.tabs(["📈 Visualización", "🌍 Mapa de la estación", "🧠 Recomendación con IA"])
 
-with tab1:
+@st.cache_resource(show_spinner=False)
+def imagen_flujo_base64():
+    import base64
+    with open("images/flujo_antisana_troje.png", "rb") as file:
+        return base64.b64encode(file.read()).decode()
+
+
+# Secciones: a diferencia de st.tabs, solo se ejecuta la elegida (y solo ella
+# importa matplotlib, folium o el SDK de Gemini)
+SECCIONES = ["📈 Visualización", "🌍 Mapa de la estación", "🧠 Recomendación con IA"]
+seccion = st.radio("Sección", SECCIONES, horizontal=True, label_visibility="collapsed")
+
+if seccion == SECCIONES[0]:
     st.subheader("📊 Resumen de predicción")
 
     nivel_actual = forecast["nivel_estimado"].iloc[-1]
@@ -52,6 +187,21 @@ with tab1:
     if rmse is not None:
         st.metric("📉 Error del modelo (RMSE)", f"{rmse:.2f} m")
 
+    # 🚨 Próxima superación del nivel crítico según el forecast (y sus bandas)
+    estacion = estacion_predeterminada().codigo
+    alertas = motor_alertas(clave_forecast, estacion)
+    hoy = pd.Timestamp(datetime.now().date())
+    for certeza, serie in (("segura", "nivel_estimado_lower"), ("probable", "nivel_estimado"), ("posible", "nivel_estimado_upper")):
+        indice = alertas.indice(estacion, "critico", serie)
+        if indice is None:
+            continue
+        proxima = indice.proxima(hoy)
+        if proxima is not None:
+            tramo_alerta = indice.entre(proxima, proxima)[0]
+            st.warning(f"🚨 Superación {certeza} del nivel crítico desde {proxima.date()} hasta {tramo_alerta[1].date()} "
+                       f"(en {indice.dias_hasta_proxima(hoy)} días, máx {tramo_alerta[2]:.2f} m)")
+            break
+
     st.subheader("📅 Selecciona el rango de fechas")
     fecha_min = pd.to_datetime(forecast["ds"].min()).date()
     fecha_max = pd.to_datetime(forecast["ds"].max()).date()
@@ -68,26 +218,20 @@ with tab1:
 
     rango_inicio = pd.to_datetime(rango[0])
     rango_fin = pd.to_datetime(rango[1])
-    df_filtrado = forecast[(forecast["ds"] >= rango_inicio) & (forecast["ds"] <= rango_fin)].copy()
-
-    # Suavizar la serie estimada
-    df_filtrado["nivel_estimado"] = df_filtrado["nivel_estimado"].rolling(window=7, min_periods=1).mean()
-
-    # Suavizar también los intervalos de confianza si existen
-    if "nivel_estimado_lower" in df_filtrado.columns and "nivel_estimado_upper" in df_filtrado.columns:
-        df_filtrado["nivel_estimado_lower"] = df_filtrado["nivel_estimado_lower"].rolling(window=7, min_periods=1).mean()
-        df_filtrado["nivel_estimado_upper"] = df_filtrado["nivel_estimado_upper"].rolling(window=7, min_periods=1).mean()
 
+    # Series ya suavizadas (7 días) una vez por versión; aquí solo se corta el
+    # rango y se reduce a un número fijo de puntos
+    serie = serie_grafico(forecast, clave_forecast)
+    linea, banda = serie.puntos(rango_inicio, rango_fin)
 
     st.subheader("📈 Nivel de Agua Estimado")
 
-    # Aplicar suavizado directamente en nueva columna
-    df_filtrado["nivel_estimado"] = df_filtrado["nivel_estimado"].rolling(window=7, min_periods=1).mean()
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots(figsize=(14, 6))
     ax.plot(
-        df_filtrado["ds"],
-        df_filtrado["nivel_estimado"],
+        linea["ds"],
+        linea["nivel_estimado"],
         label="Nivel estimado (suavizado)",
         color="#1f77b4",
         linewidth=2,
@@ -100,11 +244,11 @@ with tab1:
     ax.axhline(y=nivel_critico, color='red', linestyle='--', label=f'Alerta crítica ({nivel_critico} m)')
 
     # ✅ Intervalo de confianza real del nivel estimado (si existe)
-    if "nivel_estimado_lower" in df_filtrado.columns and "nivel_estimado_upper" in df_filtrado.columns:
+    if banda is not None:
         ax.fill_between(
-            df_filtrado["ds"],
-            df_filtrado["nivel_estimado_lower"],
-            df_filtrado["nivel_estimado_upper"],
+            banda["ds"],
+            banda["inferior"],
+            banda["superior"],
             color="#1f77b4",
             alpha=0.2,
             label="Intervalo de confianza"
@@ -116,25 +260,25 @@ with tab1:
     ax.set_xlim(left=rango_inicio, right=rango_fin)
     ax.grid()
     ax.legend()
-    st.pyplot(fig)
+    with tramo("grafico_nivel", filas=len(linea["ds"])):
+        st.pyplot(fig)
+    plt.close(fig)
 
-    # 💾 Agregar botón de descarga para CSV filtrado
-    csv_filtrado = df_filtrado[["ds", "nivel_estimado"]].to_csv(index=False).encode("utf-8")
+    # 💾 Agregar botón de descarga para CSV filtrado (resolución completa, se
+    # genera una vez por versión y rango)
     st.download_button(
         label="📥 Descargar predicción filtrada como CSV",
-        data=csv_filtrado,
+        data=csv_rango(clave_forecast, rango_inicio, rango_fin),
         file_name="prediccion_nivel_filtrada.csv",
         mime="text/csv"
     )
 
 
-with tab2:
+if seccion == SECCIONES[1]:
 
  # Imagen del flujo de agua
-    import base64
     st.markdown("### 🗺️ Flujo del agua hacia la planta El Troje")
-    with open("images/flujo_antisana_troje.png", "rb") as file:
-        encoded = base64.b64encode(file.read()).decode()
+    encoded = imagen_flujo_base64()
     st.markdown(f"""
         <div style="display: flex; justify-content: center;">
             <img src="data:image/png;base64,{encoded}" style="max-width: 90%; border-radius: 8px;" />
@@ -158,92 +302,17 @@ with tab2:
 Este sistema conjunto permite comprender la dinámica hídrica que garantiza el abastecimiento de agua potable a Quito mediante el embalse **La Mica** y la planta **El Troje**.
     """)
 
-    import folium
     import streamlit.components.v1 as components
 
-    mapa = folium.Map(location=[-0.568, -78.229], zoom_start=11)
-
-        # 🟩 Estación principal (ahora con mismo estilo que las otras)
-    folium.Marker(
-        location=[-0.5683880379564397, -78.2298390801277],
-        popup="Estación H44 Antisana DJ Diguchi",
-        tooltip="H44 DJ Diguchi",
-        icon=folium.Icon(color="green", icon="leaf")
-    ).add_to(mapa)
-
-    # 🟢 Otras estaciones
-    estaciones_adicionales = [
-        {"nombre": "Estación Antisana Diguchi", "lat": -0.6022867145410288, "lon": -78.1986689291808},
-        {"nombre": "Estación Río Antisana AC", "lat": -0.5934839659614135, "lon": -78.20825370752031},
-    ]
-
-
-    for est in estaciones_adicionales:
-        folium.Marker(
-            location=[est["lat"], est["lon"]],
-            popup=est["nombre"],
-            tooltip=est["nombre"],
-            icon=folium.Icon(color="green", icon="leaf")
-        ).add_to(mapa)
-
-    # 🔵 Embalse La Mica
-    folium.CircleMarker(
-        location=[-0.53806, -78.21015],
-        radius=12,
-        popup="Embalse La Mica",
-        color="red",
-        fill=True,
-        fill_opacity=0.5
-    ).add_to(mapa)
-
-    # 💧 Río Diguchi
-    folium.Marker(
-    location=[-0.5683880379564397, -78.2398390801277],
-    popup="Río Diguchi - Estación H44 DJ Diguchi",
-    tooltip="Río Diguchi (H44 DJ Diguchi)",
-    icon=folium.Icon(color="blue", icon="tint")
-    ).add_to(mapa)
-
-
-    # 💧 Río Antisana
-    folium.Marker(
-        location=[-0.5783880379564397, -78.2298390801277],
-        popup="Río Antisana",
-        tooltip="Río Antisana",
-        icon=folium.Icon(color="blue", icon="tint")
-    ).add_to(mapa)
-
-    # 💧 Río Jatunyacu
-    folium.Marker(
-        location=[-0.4935, -78.1810],
-        popup="Río Jatunyacu",
-        tooltip="Río Jatunyacu",
-        icon=folium.Icon(color="blue", icon="tint")
-    ).add_to(mapa)
-
-        # 🏭 Planta de tratamiento El Troje
-    folium.Marker(
-        location=[-0.33343, -78.52261],
-        popup="Planta de tratamiento El Troje",
-        tooltip="El Troje",
-        icon=folium.Icon(color="darkred", icon="industry", prefix='fa')
-    ).add_to(mapa)
-
-
-    # Renderizar mapa
-    mapa.get_root().html.add_child(folium.Element("""
-        <style>
-        html, body, #map { width: 100%; height: 100%; margin: 0; padding: 0; }
-        </style>
-    """))
-    mapa_html = mapa.get_root().render()
+    mapa_html = construir_mapa_html()
     components.html(f"""
         <div style="width: 100%; height: 600px;">
             {mapa_html}
         </div>
     """, height=600)
 
-    with tab3:
+if seccion == SECCIONES[2]:
+    with st.container():
         col1, col2 = st.columns(2)
 
         # 👉 Columna izquierda: Análisis de Riesgo
@@ -253,7 +322,8 @@ Este sistema conjunto permite comprender la dinámica hídrica que garantiza el
             try:
                 if "analisis_riesgo_automatizado" not in st.session_state:
                     with st.spinner("🔎 Generando análisis de riesgo..."):
-                        from src.recomendaciones_ia import modelo
+                        from src.recomendaciones_ia import obtener_cliente, version_forecast
+                        from src.contexto_llm import resumir_pronostico
                         from datetime import datetime, timedelta
 
                         # Calcular la fecha hace 1 año desde el último dato disponible
@@ -263,8 +333,8 @@ Este sistema conjunto permite comprender la dinámica hídrica que garantiza el
                         # Filtrar el DataFrame para obtener solo los datos del último año
                         ultimo_anio = forecast[(forecast["ds"] >= fecha_inicio) & (forecast["ds"] <= fecha_final)]
 
-                        # Crear el resumen a pasar al prompt
-                        contexto_riesgo = ultimo_anio[["ds", "nivel_estimado"]].to_string(index=False)
+                        # Resumen compacto (estadísticos, tramos críticos y detalle mensual) en vez de 365 filas
+                        contexto_riesgo = resumir_pronostico(ultimo_anio)
 
 
                         prompt_riesgo = f"""
@@ -285,7 +355,8 @@ Datos:
 
     Análisis de riesgo:
     """
-                        st.session_state.analisis_riesgo_automatizado = modelo.generate_content(prompt_riesgo).text.strip()
+                        st.session_state.analisis_riesgo_automatizado = obtener_cliente().generar(
+                            prompt_riesgo, version_forecast(forecast))
 
                 st.markdown(st.session_state.analisis_riesgo_automatizado)
 
@@ -313,14 +384,15 @@ Datos:
 
             if pregunta_usuario:
                 with st.spinner("🧠 Analizando y generando respuesta..."):
-                    from src.recomendaciones_ia import modelo, generar_recomendaciones_operativas
+                    from src.recomendaciones_ia import obtener_cliente, prompt_recomendaciones_operativas, version_forecast
+                    from src.contexto_llm import resumir_pronostico
 
                     from datetime import timedelta
 
                     # Calcular el contexto del último año
                     fecha_final = pd.to_datetime(forecast["ds"].max())
                     fecha_inicio = fecha_final - timedelta(days=365)
-                    contexto = forecast[(forecast["ds"] >= fecha_inicio) & (forecast["ds"] <= fecha_final)][["ds", "nivel_estimado"]].to_string(index=False)
+                    contexto = resumir_pronostico(forecast[(forecast["ds"] >= fecha_inicio) & (forecast["ds"] <= fecha_final)])
 
                     prompt = f"""
                     Eres un experto en hidrología y gestión operativa del sistema hídrico del Antisana. 
@@ -334,8 +406,10 @@ Datos:
                     Responde de forma técnica, clara y específica:
                     """
 
-                    respuesta = modelo.generate_content(prompt).text.strip()
-                    analisis_riesgo = generar_recomendaciones_operativas(forecast)
+                    # Respuesta y recomendaciones son independientes: salen en paralelo, y
+                    # las recomendaciones (mismo forecast) se sirven de la caché
+                    respuesta, analisis_riesgo = obtener_cliente().generar_varios(
+                        [prompt, prompt_recomendaciones_operativas(forecast)], version_forecast(forecast))
 
                     st.session_state.chat_history.append(("👤 Tú", pregunta_usuario))
                     st.session_state.chat_history.append(("🤖 IA", respuesta))
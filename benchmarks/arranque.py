@@ -0,0 +1,126 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Benchmark del arranque en frío de la app. Cada medición corre en un intérprete
+# nuevo (como un contenedor recién levantado):
+#   - importaciones de primer nivel de app.py: lo que se paga antes del primer
+#     pintado, y qué módulos pesados arrastran
+#   - coste de importar cada módulo pesado por separado
+#   - si streamlit está instalado, la primera ejecución completa de app.py con
+#     AppTest para cada sección, y un rerun en caliente
+#   python benchmarks/arranque.py [--repeticiones 3] [--json salida.json]
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PESADOS = ["prophet", "sklearn", "matplotlib", "folium", "google.generativeai", "pyarrow"]
+
+
+def _en_proceso_nuevo(codigo):
+    salida = subprocess.run([sys.executable, "-W", "ignore", "-c", codigo], cwd=RAIZ,
+                            capture_output=True, text=True)
+    if salida.returncode != 0:
+        return {"error": salida.stderr.strip().splitlines()[-1] if salida.stderr.strip() else "error"}
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def importaciones_app(ruta=os.path.join(RAIZ, "app.py")):
+    # Sentencias import del nivel superior de app.py (las de dentro de secciones no cuentan)
+    with open(ruta, encoding="utf-8") as f:
+        arbol = ast.parse(f.read())
+    lineas = []
+    for nodo in arbol.body:
+        if isinstance(nodo, (ast.Import, ast.ImportFrom)):
+            lineas.append(ast.unparse(nodo))
+    return lineas
+
+
+def medir_importacion(lineas):
+    codigo = f"""
+import json, sys, time
+inicio = time.perf_counter()
+{chr(10).join(lineas)}
+segundos = time.perf_counter() - inicio
+pesados = [m for m in {PESADOS!r} if m in sys.modules]
+print(json.dumps({{"segundos": segundos, "pesados": pesados}}))
+"""
+    return _en_proceso_nuevo(codigo)
+
+
+def medir_seccion(seccion):
+    codigo = f"""
+import json, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=600)
+inicio = time.perf_counter()
+app.run()
+if {seccion} > 0:
+    app.radio[0].set_value(app.radio[0].options[{seccion}]).run()
+frio = time.perf_counter() - inicio
+inicio = time.perf_counter()
+app.run()
+print(json.dumps({{"frio": frio, "caliente": time.perf_counter() - inicio, "excepciones": len(app.exception)}}))
+"""
+    return _en_proceso_nuevo(codigo)
+
+
+def _mejor(resultados, clave):
+    validos = [r[clave] for r in resultados if clave in r]
+    return min(validos) if validos else None
+
+
+def ejecutar(repeticiones=3):
+    reporte = {"python": sys.version.split()[0], "importaciones_app": {}, "modulos": {}, "secciones": {}}
+
+    lineas = [l for l in importaciones_app() if "streamlit" not in l or _hay_streamlit()]
+    medidas = [medir_importacion(lineas) for _ in range(repeticiones)]
+    reporte["importaciones_app"] = {"segundos": _mejor(medidas, "segundos"), "pesados": medidas[0].get("pesados"),
+                                    "error": medidas[0].get("error")}
+
+    for modulo in PESADOS:
+        medidas = [medir_importacion([f"import {modulo}"]) for _ in range(repeticiones)]
+        reporte["modulos"][modulo] = _mejor(medidas, "segundos")
+
+    if _hay_streamlit():
+        for i in range(3):
+            medidas = [medir_seccion(i) for _ in range(repeticiones)]
+            reporte["secciones"][i] = {"frio": _mejor(medidas, "frio"), "caliente": _mejor(medidas, "caliente")}
+    return reporte
+
+
+def _hay_streamlit():
+    try:
+        import streamlit  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del arranque en frío de app.py")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--json", default=None, help="Guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    reporte = ejecutar(args.repeticiones)
+
+    imp = reporte["importaciones_app"]
+    print(f"🚀 Importaciones de primer nivel de app.py: {imp['segundos']:.3f} s" if imp["segundos"] is not None
+          else f"🚀 Importaciones de app.py: {imp['error']}")
+    print(f"   módulos pesados cargados al arrancar: {', '.join(imp['pesados'] or []) or 'ninguno'}")
+    for modulo, segundos in reporte["modulos"].items():
+        print(f"   import {modulo}: " + (f"{segundos:.3f} s" if segundos is not None else "no instalado"))
+    if reporte["secciones"]:
+        for i, medida in reporte["secciones"].items():
+            print(f"📄 Sección {i}: primera ejecución {medida['frio']:.2f} s, rerun {medida['caliente']:.2f} s")
+    else:
+        print("📄 streamlit no está instalado: se omite la ejecución completa de app.py")
+    print(f"⏱️ benchmark: {time.perf_counter() - inicio:.1f} s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2)
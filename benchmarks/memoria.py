@@ -0,0 +1,121 @@
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.esquema import memoria_bytes
+from src.entrenar_modelo import FECHA_FINAL, ajustar_modelo_caudal, pronosticar_caudal
+from src.grafico import SerieGrafico
+from src.motores import motor_configurado
+from src.preparar_datos import cargar_y_unir_datos
+from src.predecir_nivel import ajustar_modelo_nivel, aplicar_modelo_nivel
+
+# Benchmark de memoria del forecast por estación:
+#   - "ancho":    como circulaba antes, todas las columnas de predict() (tendencia,
+#                 estacionalidades, regresores y sus bandas) en float64 más el nivel
+#   - "compacto": el esquema de src.esquema (ds + 7 columnas en float32)
+# Mide los bytes de cada DataFrame, el pico de memoria de las etapas caudal →
+# nivel y lo que crece un proceso que mantiene N estaciones en caché (el forecast
+# más su SerieGrafico, como la app).
+#   python benchmarks/memoria.py [--estaciones 50] [--motor numpy] [--json salida.json]
+
+
+def _future(modelo, df, fecha_final=FECHA_FINAL):
+    # Mismas fechas y regresores que pronosticar_caudal
+    future = modelo.make_future_dataframe(periods=max(0, (fecha_final - modelo.history["ds"].max()).days))
+    precipitacion = df[["fecha", "precipitacion"]].rename(columns={"fecha": "ds"})
+    future = future.merge(precipitacion, on="ds", how="left")
+    future["precipitacion"] = future["precipitacion"].fillna(df["precipitacion"].mean())
+    future["precipitacion_lag1"] = future["precipitacion"].shift(1).fillna(df["precipitacion"].mean())
+    return future
+
+
+def forecast_ancho(modelo_caudal, modelo_nivel, fecha_inicio, df):
+    forecast = modelo_caudal.predict(_future(modelo_caudal, df))
+    forecast = forecast[forecast["ds"] <= FECHA_FINAL].copy()
+    forecast = aplicar_modelo_nivel(modelo_nivel, forecast, fecha_inicio)
+    for columna in ("nivel_estimado", "nivel_estimado_lower", "nivel_estimado_upper"):
+        forecast[columna] = forecast[columna].astype(np.float64)
+    return forecast
+
+
+def forecast_compacto(modelo_caudal, modelo_nivel, fecha_inicio, df):
+    forecast = pronosticar_caudal(modelo_caudal, df)
+    return aplicar_modelo_nivel(modelo_nivel, forecast, fecha_inicio)
+
+
+def pico_mb(funcion, *args):
+    tracemalloc.start()
+    try:
+        resultado = funcion(*args)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, pico / 2**20
+
+
+def estaciones_en_cache(forecast, n, con_grafico=True):
+    # Memoria retenida por n estaciones distintas (copias profundas del mismo forecast)
+    tracemalloc.start()
+    try:
+        cache = []
+        for _ in range(n):
+            copia = copy.deepcopy(forecast)
+            cache.append((copia, SerieGrafico(copia) if con_grafico else None))
+        actual, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return actual / 2**20 / n
+
+
+def ejecutar(n_estaciones=50, motor=None):
+    df = cargar_y_unir_datos()
+    modelo_caudal = ajustar_modelo_caudal(df, motor=motor)
+    modelo_nivel, fecha_inicio = ajustar_modelo_nivel(df)
+
+    reporte = {"motor": motor_configurado(motor), "estaciones": n_estaciones, "variantes": {}}
+    for nombre, construir in (("ancho", forecast_ancho), ("compacto", forecast_compacto)):
+        inicio = time.perf_counter()
+        forecast, pico = pico_mb(construir, modelo_caudal, modelo_nivel, fecha_inicio, df)
+        segundos = time.perf_counter() - inicio
+        reporte["variantes"][nombre] = {
+            "filas": len(forecast),
+            "columnas": len(forecast.columns),
+            "forecast_mb": memoria_bytes(forecast) / 2**20,
+            "pico_etapas_mb": pico,
+            "segundos_etapas": segundos,
+            "mb_por_estacion": estaciones_en_cache(forecast, n_estaciones),
+        }
+    # Lo que ocupa el esquema compacto frente a las mismas columnas en float64
+    reporte["compacto_vs_float64"] = memoria_bytes(forecast) / memoria_bytes(
+        forecast.astype({c: np.float64 for c in forecast.columns if c != "ds"}))
+    return reporte
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de memoria del forecast por estación")
+    parser.add_argument("--estaciones", type=int, default=50)
+    parser.add_argument("--motor", default=None, help="prophet o numpy (por defecto MOTOR_PRONOSTICO)")
+    parser.add_argument("--json", default=None, help="Guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    reporte = ejecutar(args.estaciones, args.motor)
+    print(f"🧮 Motor {reporte['motor']}, {reporte['estaciones']} estaciones en caché")
+    for nombre, v in reporte["variantes"].items():
+        print(f"   {nombre:9s} {v['filas']} filas × {v['columnas']} columnas: "
+              f"forecast {v['forecast_mb']:.2f} MB, pico caudal→nivel {v['pico_etapas_mb']:.1f} MB, "
+              f"{v['mb_por_estacion']:.2f} MB por estación en caché")
+    ancho, compacto = reporte["variantes"]["ancho"], reporte["variantes"]["compacto"]
+    print(f"📉 Por estación: {ancho['mb_por_estacion'] / compacto['mb_por_estacion']:.1f}× menos memoria "
+          f"(float32 ocupa {reporte['compacto_vs_float64']:.0%} de las mismas columnas en float64)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2)
@@ -1,43 +1,114 @@
+import argparse
+import os
+
 import matplotlib.pyplot as plt
 from src.preparar_datos import cargar_y_unir_datos
-from src.entrenar_modelo import entrenar_modelo_caudal
+from src.entrenar_modelo import entrenar_modelo_caudal, FECHA_FINAL, PARAMETROS_CAUDAL
 from src.predecir_nivel import predecir_nivel
 from src.predecir_precipitacion import predecir_precipitacion  # NUEVA IMPORTACIÓN
+from src.pipeline import Etapa, ejecutar_etapas
+from src.almacen_modelos import cargar_estado_previo, cargar_mejores_parametros
+from src.alertas import MotorAlertas, describir
+from src.estaciones import estacion_predeterminada
+from src.pronosticos import publicar_pronostico, ARCHIVO_ALERTAS, DIRECTORIO_PRONOSTICOS
+from src.esquema import agregar_columnas
+
+
+def unir_y_predecir_nivel(resultado_caudal, forecast_precip, df):
+    forecast, modelo = resultado_caudal
+    # Como un merge por "ds", pero añadiendo la columna sin copiar el forecast
+    forecast = agregar_columnas(forecast, forecast_precip, ["precipitacion_estimada"])
+    return predecir_nivel(forecast, df)
+
+
+def ejecutar_pipeline(max_procesos=None):
+    # Paso 1: Cargar y preparar datos
+    df = cargar_y_unir_datos()
+
+    # Solo se conservan las fechas del forecast de caudal, así que basta con
+    # predecir la precipitación hasta la misma fecha final
+    dias_precipitacion = max(1, (FECHA_FINAL - df["fecha"].max()).days)
+
+    # Igual que obtener_pronostico: hiperparámetros de src.ajuste (si los hay) y
+    # arranque en caliente desde el último artefacto de esta carpeta
+    parametros_caudal = {**PARAMETROS_CAUDAL, **cargar_mejores_parametros()}
+    estado_previo = cargar_estado_previo()
+
+    etapas = [
+        # Pasos 2 y 3: caudal y precipitación son ajustes independientes sobre el
+        # mismo df, así que corren a la vez en procesos separados
+        Etapa("caudal", entrenar_modelo_caudal,
+              kwargs={"df": df, "parametros": parametros_caudal, "estado_previo": estado_previo}),
+        Etapa("precipitacion", predecir_precipitacion, kwargs={"df": df, "dias": dias_precipitacion}),
+        # Paso 4: unir ambos forecasts y predecir el nivel del agua
+        Etapa("nivel", unir_y_predecir_nivel, dependencias=("caudal", "precipitacion"),
+              kwargs={"df": df}, local=True),
+    ]
+    # ejecutar_etapas ya informa el tiempo de cada etapa
+    resultados, _ = ejecutar_etapas(etapas, max_procesos=max_procesos)
+    return resultados["nivel"]
+
+
+def graficar_nivel(forecast, ruta=None):
+    # Paso 5: Visualizar predicción de nivel
+    plt.figure(figsize=(12,6))
+
+    # Línea del nivel estimado
+    plt.plot(forecast["ds"], forecast["nivel_estimado"], label="Nivel estimado", color="royalblue")
 
-# Paso 1: Cargar y preparar datos
-df = cargar_y_unir_datos()
+    # Intervalo de confianza (usa los valores de Prophet antes de predecir nivel, si quieres, o crea unos artificiales alrededor del nivel estimado)
+    # Aquí generamos uno aproximado de ±10% para visualización
+    confianza_inferior = forecast["nivel_estimado"] * 0.9
+    confianza_superior = forecast["nivel_estimado"] * 1.1
+    plt.fill_between(forecast["ds"], confianza_inferior, confianza_superior, color="skyblue", alpha=0.3, label="Intervalo de confianza")
 
-# Paso 2: Entrenar modelo y predecir caudal hasta 2026
-forecast, modelo = entrenar_modelo_caudal(df)
+    # Línea de alerta crítica
+    plt.axhline(y=5.0, color="red", linestyle="--", label="Alerta crítica (5.0 m)")
 
-# Paso 3: Predecir precipitación futura y unirla
-forecast_precip = predecir_precipitacion(df, dias=len(forecast))  # NUEVA LÍNEA
-forecast = forecast.merge(forecast_precip, on="ds", how="left")   # NUEVA LÍNEA
+    # Personalización
+    plt.title(f"Predicción del Nivel de Agua ({forecast['ds'].min().date()} a {forecast['ds'].max().date()})")
+    plt.xlabel("Fecha")
+    plt.ylabel("Nivel estimado (m)")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
 
-# Paso 4: Predecir nivel del agua usando caudal y precipitación estimados
-forecast = predecir_nivel(forecast, df)
+    if ruta is None:
+        plt.show()
+    else:
+        plt.savefig(ruta, dpi=120)
+        plt.close()
 
-# Paso 5: Visualizar predicción de nivel
-plt.figure(figsize=(12,6))
 
-# Línea del nivel estimado
-plt.plot(forecast["ds"], forecast["nivel_estimado"], label="Nivel estimado", color="royalblue")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline de predicción del nivel de agua")
+    parser.add_argument("--lote", action="store_true",
+                        help="Modo sin pantalla: publica el pronóstico en Parquet + manifiesto en vez de mostrar el gráfico")
+    parser.add_argument("--graficos", action="store_true", help="En modo lote, guardar también el gráfico en PNG")
+    parser.add_argument("--salida", default=DIRECTORIO_PRONOSTICOS, help="Carpeta de pronósticos publicados")
+    parser.add_argument("--conservar", type=int, default=None, help="Mantener solo las N versiones más recientes")
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args()
 
-# Intervalo de confianza (usa los valores de Prophet antes de predecir nivel, si quieres, o crea unos artificiales alrededor del nivel estimado)
-# Aquí generamos uno aproximado de ±10% para visualización
-confianza_inferior = forecast["nivel_estimado"] * 0.9
-confianza_superior = forecast["nivel_estimado"] * 1.1
-plt.fill_between(forecast["ds"], confianza_inferior, confianza_superior, color="skyblue", alpha=0.3, label="Intervalo de confianza")
+    if args.lote:
+        plt.switch_backend("Agg")
 
-# Línea de alerta crítica
-plt.axhline(y=5.0, color="red", linestyle="--", label="Alerta crítica (5.0 m)")
+    forecast = ejecutar_pipeline(max_procesos=args.procesos)
 
-# Personalización
-plt.title(f"Predicción del Nivel de Agua ({forecast['ds'].min().date()} a {forecast['ds'].max().date()})")
-plt.xlabel("Fecha")
-plt.ylabel("Nivel estimado (m)")
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.show()
+    # Tramos en los que el forecast supera el nivel crítico, comparados con los
+    # del último pronóstico publicado: solo se informa lo que cambió
+    ruta_alertas = os.path.join(args.salida, ARCHIVO_ALERTAS)
+    alertas = MotorAlertas.cargar(ruta_alertas)
+    for evento in alertas.actualizar(estacion_predeterminada().codigo, forecast):
+        print(describir(evento))
 
+    if args.lote:
+        manifiesto = publicar_pronostico(
+            forecast, directorio=args.salida, conservar=args.conservar,
+            graficos={"nivel.png": graficar_nivel} if args.graficos else None,
+        )
+        # El estado avanza solo con lo publicado
+        alertas.guardar(ruta_alertas)
+        print(f"📦 Pronóstico {manifiesto['version']} publicado en {os.path.join(args.salida, manifiesto['version'])}")
+    else:
+        graficar_nivel(forecast)
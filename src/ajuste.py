@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from multiprocessing import Pool, TimeoutError as TiempoAgotado
+
+import numpy as np
+import pandas as pd
+
+from src.preparar_datos import cargar_y_unir_datos, DIRECTORIO_DATOS
+from src.entrenar_modelo import ajustar_modelo_caudal, pronosticar_caudal
+from src.almacen_modelos import huella_datos, guardar_mejores_parametros, DIRECTORIO_MODELOS
+from src.estaciones import obtener_estacion
+from src.motores import motor_configurado, parametros_admitidos
+
+# Búsqueda de hiperparámetros del modelo de caudal con validación cruzada
+# temporal (se entrena hasta cada corte y se evalúa el caudal de los días
+# siguientes). Cada combinación se evalúa en un proceso del pool y su resultado
+# se memoriza en disco por (huella de datos, parámetros), también si falla de
+# forma que se repetiría (parámetros inválidos, errores numéricos): una búsqueda
+# interrumpida o repetida nunca reajusta dos veces la misma combinación. Los
+# fallos transitorios (OSError, memoria, procesos terminados) no se memorizan y
+# se reintentan en la siguiente búsqueda. El espacio se reduce a los parámetros que el motor usa (el motor
+# numpy ignora seasonality_mode, por ejemplo). La mejor configuración se guarda
+# para que el almacén de modelos la use.
+
+ESPACIO = {
+    "changepoint_prior_scale": [0.01, 0.05, 0.1, 0.5],
+    "seasonality_prior_scale": [0.1, 1.0, 10.0],
+    "seasonality_mode": ["additive", "multiplicative"],
+}
+# Fallos que dan lo mismo con los mismos datos y parámetros (LinAlgError es un ValueError)
+FALLOS_DETERMINISTAS = (ValueError, TypeError, ArithmeticError)
+
+
+def _clave_parametros(parametros):
+    return hashlib.sha256(json.dumps(parametros, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _ruta_memo(directorio_memo, huella, parametros):
+    return os.path.join(directorio_memo, huella[:16], f"{_clave_parametros(parametros)}.json")
+
+
+def _leer_memo(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_memo(ruta, resultado):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(resultado, f, sort_keys=True)
+    os.replace(ruta + ".tmp", ruta)
+
+
+def espacio_motor(espacio=ESPACIO, motor=None):
+    admitidos = parametros_admitidos(motor)
+    return {n: v for n, v in espacio.items() if admitidos is None or n in admitidos}
+
+
+def combinaciones(espacio=ESPACIO, n_aleatorias=None, semilla=0):
+    nombres = sorted(espacio)
+    todas = [dict(zip(nombres, valores)) for valores in itertools.product(*(espacio[n] for n in nombres))]
+    if n_aleatorias is not None and n_aleatorias < len(todas):
+        return random.Random(semilla).sample(todas, n_aleatorias)
+    return todas
+
+
+def evaluar_parametros(df, parametros, cortes, horizonte, motor=None):
+    errores = []
+    for corte in cortes:
+        entrenamiento = df[df["fecha"] <= corte].reset_index(drop=True)
+        modelo = ajustar_modelo_caudal(entrenamiento, motor=motor, parametros=parametros)
+        # Solo se compara yhat: sin intervalos
+        forecast = pronosticar_caudal(modelo, entrenamiento, corte + pd.Timedelta(days=horizonte), incertidumbre="ninguna")
+
+        futuro = forecast.loc[forecast["ds"] > corte, ["ds", "yhat"]]
+        comparacion = futuro.merge(df[["fecha", "caudal"]], left_on="ds", right_on="fecha", how="inner")
+        errores.append((comparacion["yhat"] - comparacion["caudal"]).to_numpy())
+
+    errores = np.concatenate(errores)
+    return {
+        "parametros": parametros,
+        "rmse": float(np.sqrt(np.mean(errores ** 2))),
+        "mae": float(np.mean(np.abs(errores))),
+        "n": int(len(errores)),
+    }
+
+
+def _evaluar_y_memorizar(df, parametros, cortes, horizonte, motor, ruta_memo):
+    try:
+        resultado = evaluar_parametros(df, parametros, cortes, horizonte, motor)
+    except FALLOS_DETERMINISTAS as e:
+        # Este fallo también se memoriza: la combinación no se vuelve a intentar
+        _escribir_memo(ruta_memo, {"parametros": parametros, "error": repr(e)})
+        raise
+    _escribir_memo(ruta_memo, resultado)
+    return resultado
+
+
+def _evaluar_tarea(argumentos):
+    return _evaluar_y_memorizar(*argumentos)
+
+
+def buscar(directorio_datos=DIRECTORIO_DATOS, espacio=ESPACIO, n_aleatorias=None, n_cortes=3,
+           paso_dias=180, horizonte=90, max_procesos=None, presupuesto_min=None, motor=None,
+           directorio=DIRECTORIO_MODELOS, informar=print):
+    df = cargar_y_unir_datos(directorio_datos)
+    df = pd.DataFrame({c: np.asarray(df[c]) for c in df.columns})  # sin memmap, para enviar a los procesos
+    ultimo = df["fecha"].max() - pd.Timedelta(days=horizonte)
+    cortes = [ultimo - pd.Timedelta(days=paso_dias * i) for i in reversed(range(n_cortes))]
+
+    # La memoria distingue también la validación usada y el motor
+    huella = hashlib.sha256(json.dumps({
+        "datos": huella_datos(directorio_datos),
+        "cortes": [c.isoformat() for c in cortes],
+        "horizonte": horizonte,
+        "motor": motor_configurado(motor),
+    }, sort_keys=True).encode("utf-8")).hexdigest()
+    directorio_memo = os.path.join(directorio, "ajuste")
+
+    rutas = [(parametros, _ruta_memo(directorio_memo, huella, parametros))
+             for parametros in combinaciones(espacio_motor(espacio, motor), n_aleatorias)]
+    pendientes = [(parametros, ruta) for parametros, ruta in rutas if _leer_memo(ruta) is None]
+    informar(f"🔎 {len(rutas) - len(pendientes)} combinaciones ya evaluadas, {len(pendientes)} por evaluar")
+
+    limite = time.monotonic() + presupuesto_min * 60 if presupuesto_min else None
+    tareas = [(df, parametros, cortes, horizonte, motor, ruta) for parametros, ruta in pendientes]
+    # Al salir del with, terminate() detiene sin esperar los ajustes aún en
+    # curso (no llegan a memorizarse)
+    with Pool(max_procesos) as pool:
+        evaluaciones = pool.imap_unordered(_evaluar_tarea, tareas, chunksize=1)
+        for _ in tareas:
+            try:
+                resultado = evaluaciones.next(None if limite is None else max(0, limite - time.monotonic()))
+            except TiempoAgotado:
+                informar("⏳ Presupuesto de tiempo agotado; lo evaluado queda memorizado")
+                break
+            except Exception as e:
+                # Una combinación que no converge no detiene la búsqueda
+                informar(f"  ❌ {e!r}")
+                continue
+            informar(f"  RMSE {resultado['rmse']:.4f} ← {resultado['parametros']}")
+
+    # Releer la memoria: incluye lo evaluado antes y lo que terminó al agotarse el tiempo
+    memorizados = [r for r in (_leer_memo(ruta) for _, ruta in rutas) if r is not None]
+    resultados = [r for r in memorizados if "error" not in r]
+    if len(resultados) < len(memorizados):
+        informar(f"⚠️ {len(memorizados) - len(resultados)} combinaciones fallidas (memorizadas, no se reintentan)")
+    if not resultados:
+        return None
+
+    mejor = min(resultados, key=lambda r: r["rmse"])
+    guardar_mejores_parametros(
+        mejor["parametros"], {"rmse": mejor["rmse"], "mae": mejor["mae"], "n": mejor["n"], "evaluadas": len(resultados),
+         "motor": motor_configurado(motor)},
+        directorio, directorio_datos,
+    )
+    return mejor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ajuste de hiperparámetros del modelo de caudal")
+    parser.add_argument("--estacion", help="Código de estación del registro (por defecto, la carpeta datos/)")
+    parser.add_argument("--aleatorias", type=int, default=None, help="Evaluar solo N combinaciones al azar")
+    parser.add_argument("--cortes", type=int, default=3)
+    parser.add_argument("--horizonte", type=int, default=90)
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--presupuesto-min", type=float, default=None, help="Minutos máximos de búsqueda")
+    parser.add_argument("--motor", default=None)
+    args = parser.parse_args()
+
+    directorio_datos = obtener_estacion(args.estacion).directorio if args.estacion else DIRECTORIO_DATOS
+    mejor = buscar(directorio_datos, n_aleatorias=args.aleatorias, n_cortes=args.cortes, horizonte=args.horizonte,
+                   max_procesos=args.procesos, presupuesto_min=args.presupuesto_min, motor=args.motor)
+    if mejor is None:
+        print("❌ No se evaluó ninguna combinación")
+    else:
+        print(f"🏆 Mejor RMSE {mejor['rmse']:.4f} con {mejor['parametros']}")
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.contexto_llm import NIVEL_CRITICO, tramos_superacion
+
+# Motor de alertas sobre la salida de predecir_nivel. Para cada estación,
+# umbral y serie (nivel_estimado y sus bandas) se precalculan los tramos en
+# que el nivel está en o sobre el umbral. Como los tramos de una serie son
+# disjuntos, sus inicios y fines quedan ordenados a la vez y las consultas
+# ("¿hay alertas entre A y B?", "¿cuánto falta para la próxima?") son dos
+# búsquedas binarias. Al llegar un forecast nuevo se comparan los tramos con
+# los anteriores y solo se emiten los eventos que cambiaron.
+
+UMBRALES = {"critico": NIVEL_CRITICO}
+
+# Certeza de la alerta según la serie que supera el umbral
+SERIES = {
+    "nivel_estimado_lower": "segura",
+    "nivel_estimado": "probable",
+    "nivel_estimado_upper": "posible",
+}
+
+ARCHIVO_ESTADO = os.path.join("modelos", "alertas.json")
+
+
+@dataclass(frozen=True)
+class EventoAlerta:
+    estacion: str
+    umbral: str
+    valor_umbral: float
+    certeza: str
+    tipo: str  # "nueva", "modificada" o "cancelada"
+    inicio: pd.Timestamp
+    fin: pd.Timestamp
+    maximo: float
+
+
+class IndiceSuperacion:
+    def __init__(self, tramos):
+        self.inicios = np.array([t[0] for t in tramos], dtype="datetime64[ns]")
+        self.fines = np.array([t[1] for t in tramos], dtype="datetime64[ns]")
+        self.maximos = np.array([t[2] for t in tramos], dtype=float)
+
+    @classmethod
+    def desde_serie(cls, fechas, valores, umbral):
+        valores = np.asarray(valores, dtype=float)
+        validos = ~np.isnan(valores)
+        return cls(tramos_superacion(np.asarray(fechas)[validos], valores[validos], umbral))
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def tramos(self):
+        return [(pd.Timestamp(a), pd.Timestamp(b), float(m))
+                for a, b, m in zip(self.inicios, self.fines, self.maximos)]
+
+    def entre(self, desde, hasta):
+        # Tramos que se solapan con [desde, hasta]: fin >= desde e inicio <= hasta
+        i = np.searchsorted(self.fines, np.datetime64(pd.Timestamp(desde), "ns"), side="left")
+        j = np.searchsorted(self.inicios, np.datetime64(pd.Timestamp(hasta), "ns"), side="right")
+        return [(pd.Timestamp(self.inicios[k]), pd.Timestamp(self.fines[k]), float(self.maximos[k]))
+                for k in range(i, max(i, j))]
+
+    def hay_alerta(self, desde, hasta):
+        i = np.searchsorted(self.fines, np.datetime64(pd.Timestamp(desde), "ns"), side="left")
+        return i < len(self) and self.inicios[i] <= np.datetime64(pd.Timestamp(hasta), "ns")
+
+    def proxima(self, desde):
+        # Primer día en o sobre el umbral a partir de `desde` (el propio día si ya está en alerta)
+        desde = np.datetime64(pd.Timestamp(desde), "ns")
+        i = np.searchsorted(self.fines, desde, side="left")
+        if i == len(self):
+            return None
+        return pd.Timestamp(max(self.inicios[i], desde))
+
+    def dias_hasta_proxima(self, desde):
+        proxima = self.proxima(desde)
+        return None if proxima is None else (proxima - pd.Timestamp(desde)).days
+
+
+class MotorAlertas:
+    def __init__(self, umbrales=None, series=None):
+        self.umbrales = dict(umbrales or UMBRALES)
+        self.series = dict(series or SERIES)
+        self.indices = {}  # (estacion, umbral, serie) -> IndiceSuperacion
+
+    def indice(self, estacion, umbral="critico", serie="nivel_estimado"):
+        return self.indices.get((estacion, umbral, serie))
+
+    def calcular(self, forecast):
+        fechas = forecast["ds"].to_numpy(dtype="datetime64[ns]")
+        indices = {}
+        for serie in self.series:
+            if serie not in forecast.columns:
+                continue
+            valores = forecast[serie].to_numpy(dtype=float)
+            for nombre, valor in self.umbrales.items():
+                indices[(nombre, serie)] = IndiceSuperacion.desde_serie(fechas, valores, valor)
+        return indices
+
+    def actualizar(self, estacion, forecast):
+        # Sustituye los índices de la estación y devuelve solo los eventos que cambian
+        eventos = []
+        for (nombre, serie), nuevo in self.calcular(forecast).items():
+            clave = (estacion, nombre, serie)
+            anterior = self.indices.get(clave)
+            eventos += self._diferencias(estacion, nombre, serie, anterior.tramos() if anterior else [], nuevo.tramos())
+            self.indices[clave] = nuevo
+        return sorted(eventos, key=lambda e: (e.inicio, e.estacion, e.umbral, e.certeza))
+
+    def _diferencias(self, estacion, nombre, serie, anteriores, nuevos):
+        def evento(tipo, tramo):
+            inicio, fin, maximo = tramo
+            return EventoAlerta(estacion, nombre, self.umbrales[nombre], self.series[serie], tipo, inicio, fin, maximo)
+
+        previos = set((a, b) for a, b, _ in anteriores)
+        actuales = set((a, b) for a, b, _ in nuevos)
+        eventos = []
+        for tramo in nuevos:
+            if (tramo[0], tramo[1]) in previos:
+                continue
+            solapa = any(a <= tramo[1] and tramo[0] <= b for a, b, _ in anteriores)
+            eventos.append(evento("modificada" if solapa else "nueva", tramo))
+        for tramo in anteriores:
+            if (tramo[0], tramo[1]) in actuales:
+                continue
+            if not any(a <= tramo[1] and tramo[0] <= b for a, b, _ in nuevos):
+                eventos.append(evento("cancelada", tramo))
+        return eventos
+
+    def alertas_entre(self, desde, hasta, estaciones=None):
+        resultado = []
+        for (estacion, nombre, serie), indice in self.indices.items():
+            if estaciones is not None and estacion not in estaciones:
+                continue
+            resultado += [(estacion, nombre, self.series[serie], a, b, m) for a, b, m in indice.entre(desde, hasta)]
+        return sorted(resultado, key=lambda r: r[3])
+
+    # Persistencia de los tramos, para emitir eventos también entre ejecuciones
+    def guardar(self, ruta=ARCHIVO_ESTADO):
+        datos = [
+            {"estacion": e, "umbral": n, "serie": s,
+             "tramos": [[a.isoformat(), b.isoformat(), m] for a, b, m in indice.tramos()]}
+            for (e, n, s), indice in self.indices.items()
+        ]
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"umbrales": self.umbrales, "indices": datos}, f, indent=2)
+        os.replace(ruta + ".tmp", ruta)
+
+    @classmethod
+    def cargar(cls, ruta=ARCHIVO_ESTADO, umbrales=None):
+        motor = cls(umbrales)
+        if not os.path.exists(ruta):
+            return motor
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        for entrada in datos["indices"]:
+            if entrada["umbral"] not in motor.umbrales or entrada["serie"] not in motor.series:
+                continue
+            tramos = [(pd.Timestamp(a), pd.Timestamp(b), m) for a, b, m in entrada["tramos"]]
+            motor.indices[(entrada["estacion"], entrada["umbral"], entrada["serie"])] = IndiceSuperacion(tramos)
+        return motor
+
+
+def describir(evento):
+    icono = {"nueva": "🚨", "modificada": "🔁", "cancelada": "✅"}[evento.tipo]
+    return (f"{icono} {evento.estacion} · {evento.umbral} ({evento.valor_umbral} m, {evento.certeza}) "
+            f"{evento.tipo}: {evento.inicio.date()} a {evento.fin.date()} (máx {evento.maximo:.2f} m)")
+
+
+if __name__ == "__main__":
+    from src.almacen_modelos import obtener_pronostico
+    from src.estaciones import cargar_estaciones
+
+    parser = argparse.ArgumentParser(description="Alertas de nivel a partir del último pronóstico")
+    parser.add_argument("--estaciones", nargs="*", help="Códigos de estación (por defecto, todas las que tienen datos)")
+    parser.add_argument("--umbral", action="append", default=[], metavar="NOMBRE=VALOR",
+                        help="Umbral adicional en metros, p. ej. --umbral preventivo=4.5")
+    parser.add_argument("--estado", default=ARCHIVO_ESTADO)
+    args = parser.parse_args()
+
+    umbrales = dict(UMBRALES)
+    for texto in args.umbral:
+        nombre, valor = texto.split("=", 1)
+        umbrales[nombre] = float(valor)
+
+    estaciones = [e for e in cargar_estaciones().values() if e.tiene_datos]
+    if args.estaciones:
+        estaciones = [e for e in estaciones if e.codigo in args.estaciones]
+
+    motor = MotorAlertas.cargar(args.estado, umbrales)
+    for estacion in estaciones:
+        forecast, _, _ = obtener_pronostico(directorio_datos=estacion.directorio)
+        for evento in motor.actualizar(estacion.codigo, forecast):
+            print(describir(evento))
+    motor.guardar(args.estado)
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import pandas as pd
+
+from src.preparar_datos import cargar_y_unir_datos, DIRECTORIO_DATOS, FUENTES
+from src.entrenar_modelo import entrenar_modelo_caudal, estado_caudal, PARAMETROS_CAUDAL
+from src.motores import incertidumbre_configurada, motor_configurado
+from src.predecir_nivel import predecir_nivel, PARAMETROS_NIVEL
+from src.caracteristicas import FEATURES
+from src.bosque_compacto import cargar_bosque, exportar_bosque
+from src.esquema import compactar
+
+# Almacén en disco de los modelos ajustados y del pronóstico resultante.
+# Cada artefacto vive en modelos/<clave>/, donde la clave es un hash del contenido
+# de datos/*.csv más los hiperparámetros de ambos modelos: si cambia cualquiera de
+# los dos se entrena de nuevo, si no, se carga directamente desde disco.
+# Junto al modelo de caudal se guardan sus parámetros de Stan (estado_caudal.json)
+# para que el siguiente reentrenamiento de la misma carpeta parta en caliente.
+# El bosque de nivel se guarda solo compilado (bosque_nivel.npy/.json): al
+# cargar se abre con memoria mapeada en lugar de deshacer el pickle de sklearn
+# (modelo_nivel.pkl solo se lee en artefactos antiguos). El modelo de caudal no
+# se deshace al cargar (importaría Prophet y deserializaría Stan): se entrega un
+# ModeloDiferido que lo lee del pickle la primera vez que alguien lo usa.
+
+DIRECTORIO_MODELOS = "modelos"
+
+
+def archivos_datos(directorio_datos=DIRECTORIO_DATOS):
+    return [os.path.join(directorio_datos, archivo) for archivo in FUENTES.values()]
+
+
+def huella_datos(directorio_datos=DIRECTORIO_DATOS):
+    h = hashlib.sha256()
+    for ruta in archivos_datos(directorio_datos):
+        h.update(os.path.basename(ruta).encode("utf-8"))
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+    return h.hexdigest()
+
+
+def clave_artefacto(directorio_datos=DIRECTORIO_DATOS, parametros_caudal=None, parametros_nivel=None, motor=None):
+    parametros = {
+        "motor": motor_configurado(motor),
+        "incertidumbre": incertidumbre_configurada(),
+        "caudal": parametros_caudal or PARAMETROS_CAUDAL,
+        "nivel": parametros_nivel or PARAMETROS_NIVEL,
+    }
+    h = hashlib.sha256()
+    h.update(huella_datos(directorio_datos).encode("utf-8"))
+    h.update(json.dumps(parametros, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class ModeloDiferido:
+    # Modelo de caudal de un artefacto, leído del pickle en el primer acceso
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._modelo = None
+
+    def cargar(self):
+        if self._modelo is None:
+            with open(self.ruta, "rb") as f:
+                self._modelo = pickle.load(f)
+        return self._modelo
+
+    def __getattr__(self, nombre):
+        # Solo llega aquí lo que no es atributo propio (predict, history, ...)
+        if nombre.startswith("__") or nombre == "_modelo":
+            raise AttributeError(nombre)
+        return getattr(self.cargar(), nombre)
+
+
+def cargar_artefacto(clave, directorio=DIRECTORIO_MODELOS):
+    ruta = os.path.join(directorio, clave)
+    ruta_caudal = os.path.join(ruta, "modelo_caudal.pkl")
+    if not os.path.isfile(ruta_caudal):
+        return None
+
+    modelo_caudal = ModeloDiferido(ruta_caudal)
+    try:
+        if os.path.isfile(os.path.join(ruta, "bosque_nivel.json")):
+            modelo_nivel = cargar_bosque(os.path.join(ruta, "bosque_nivel"))
+        else:
+            # Artefactos anteriores al bosque compilado
+            with open(os.path.join(ruta, "modelo_nivel.pkl"), "rb") as f:
+                modelo_nivel = pickle.load(f)
+        # Los artefactos anteriores al esquema compacto se compactan al leerlos
+        forecast = compactar(pd.read_pickle(os.path.join(ruta, "forecast.pkl")))
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        # Artefacto incompleto o corrupto: se tratará como inexistente
+        return None
+
+    return forecast, modelo_caudal, modelo_nivel
+
+
+def guardar_artefacto(clave, forecast, modelo_caudal, modelo_nivel, directorio=DIRECTORIO_MODELOS, estado=None):
+    os.makedirs(directorio, exist_ok=True)
+
+    # Escribir en un directorio temporal y renombrar al final, así un proceso que
+    # lea en paralelo nunca ve un artefacto a medio escribir
+    temporal = tempfile.mkdtemp(prefix=f".{clave}-", dir=directorio)
+    try:
+        if isinstance(modelo_caudal, ModeloDiferido):
+            modelo_caudal = modelo_caudal.cargar()
+        with open(os.path.join(temporal, "modelo_caudal.pkl"), "wb") as f:
+            pickle.dump(modelo_caudal, f, protocol=pickle.HIGHEST_PROTOCOL)
+        exportar_bosque(modelo_nivel, os.path.join(temporal, "bosque_nivel"), FEATURES)
+        forecast.to_pickle(os.path.join(temporal, "forecast.pkl"))
+        if estado is not None:
+            with open(os.path.join(temporal, "estado_caudal.json"), "w", encoding="utf-8") as f:
+                json.dump(estado, f)
+
+        destino = os.path.join(directorio, clave)
+        if os.path.isdir(destino):
+            shutil.rmtree(destino)
+        os.replace(temporal, destino)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+
+def _sufijo_datos(directorio_datos):
+    return hashlib.sha1(os.path.abspath(directorio_datos).encode("utf-8")).hexdigest()[:12]
+
+
+def _ruta_ultimo(directorio, directorio_datos):
+    # Puntero al último artefacto entrenado para una carpeta de datos
+    return os.path.join(directorio, f"ultimo-{_sufijo_datos(directorio_datos)}.txt")
+
+
+def _ruta_mejores(directorio, directorio_datos):
+    return os.path.join(directorio, f"mejores-{_sufijo_datos(directorio_datos)}.json")
+
+
+def cargar_mejores_parametros(directorio=DIRECTORIO_MODELOS, directorio_datos=DIRECTORIO_DATOS, motor=None):
+    # Hiperparámetros de caudal elegidos por src.ajuste para esta carpeta y este
+    # motor ({} si no hay)
+    try:
+        with open(_ruta_mejores(directorio, directorio_datos), encoding="utf-8") as f:
+            mejores = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if mejores.get("metricas", {}).get("motor") != motor_configurado(motor):
+        return {}
+    return mejores.get("parametros", {})
+
+
+def guardar_mejores_parametros(parametros, metricas, directorio=DIRECTORIO_MODELOS, directorio_datos=DIRECTORIO_DATOS):
+    os.makedirs(directorio, exist_ok=True)
+    ruta = _ruta_mejores(directorio, directorio_datos)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"parametros": parametros, "metricas": metricas}, f, indent=2, sort_keys=True)
+    os.replace(ruta + ".tmp", ruta)
+
+
+def cargar_estado_previo(directorio=DIRECTORIO_MODELOS, directorio_datos=DIRECTORIO_DATOS):
+    try:
+        with open(_ruta_ultimo(directorio, directorio_datos), encoding="utf-8") as f:
+            clave = f.read().strip()
+        with open(os.path.join(directorio, clave, "estado_caudal.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _registrar_ultimo(clave, directorio, directorio_datos):
+    ruta = _ruta_ultimo(directorio, directorio_datos)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        f.write(clave)
+    os.replace(ruta + ".tmp", ruta)
+
+
+def clave_vigente(directorio=DIRECTORIO_MODELOS, directorio_datos=DIRECTORIO_DATOS, motor=None):
+    # Clave con la que obtener_pronostico buscará el artefacto ahora mismo
+    parametros_caudal = {**PARAMETROS_CAUDAL, **cargar_mejores_parametros(directorio, directorio_datos, motor)}
+    return clave_artefacto(directorio_datos, parametros_caudal=parametros_caudal, motor=motor), parametros_caudal
+
+
+def obtener_pronostico(directorio=DIRECTORIO_MODELOS, directorio_datos=DIRECTORIO_DATOS, motor=None):
+    clave, parametros_caudal = clave_vigente(directorio, directorio_datos, motor)
+
+    artefacto = cargar_artefacto(clave, directorio)
+    if artefacto is not None:
+        return artefacto
+
+    # No hay artefacto para estos datos e hiperparámetros: entrenar (en caliente
+    # desde el último artefacto de esta carpeta, si lo hay) y guardar
+    df = cargar_y_unir_datos(directorio_datos)
+    forecast, modelo_caudal = entrenar_modelo_caudal(
+        df, estado_previo=cargar_estado_previo(directorio, directorio_datos), motor=motor, parametros=parametros_caudal)
+    forecast, modelo_nivel = predecir_nivel(forecast, df, devolver_modelo=True)
+
+    guardar_artefacto(clave, forecast, modelo_caudal, modelo_nivel, directorio, estado=estado_caudal(modelo_caudal))
+    _registrar_ultimo(clave, directorio, directorio_datos)
+    return forecast, modelo_caudal, modelo_nivel
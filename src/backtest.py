@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from src.preparar_datos import cargar_y_unir_datos, DIRECTORIO_DATOS
+from src.entrenar_modelo import ajustar_modelo_caudal, pronosticar_caudal, PARAMETROS_CAUDAL
+from src.predecir_nivel import ajustar_modelo_nivel, aplicar_modelo_nivel, PARAMETROS_NIVEL
+from src.almacen_modelos import cargar_mejores_parametros, huella_datos
+from src.instrumentacion import rss_pico_bytes
+
+# Backtest walk-forward: en cada fecha de corte se reentrena el caudal y el
+# nivel solo con la historia hasta ese día, se predice hacia adelante y se
+# compara con el nivel observado. El caudal usa los hiperparámetros ajustados
+# por src.ajuste, como el pipeline. Además de RMSE/MAE por horizonte se mide el
+# tiempo (real y de CPU) y la memoria pico de cada etapa, en dos pasadas para
+# que una medición no contamine a la otra:
+#   - precisión y memoria: cada corte en un proceso nuevo (en paralelo), con
+#     RMSE/MAE de todos los horizontes y el RSS pico del proceso (ru_maxrss) al
+#     terminar cada etapa; cuenta también lo que reservan sklearn y NumPy en C,
+#     no el proceso de cmdstan que lanza Prophet
+#   - tiempos: los cortes uno tras otro en este proceso, sin instrumentar la
+#     memoria (se omite con --sin-tiempos)
+# El reporte JSON sirve para comparar versiones y detectar regresiones de
+# precisión o de rendimiento.
+
+HORIZONTES = (7, 30, 90)
+ARCHIVO_REPORTE = os.path.join("reportes", "backtest.json")
+
+
+def _medir_tiempo(funcion, *args, **kwargs):
+    inicio_real, inicio_cpu = time.perf_counter(), time.process_time()
+    resultado = funcion(*args, **kwargs)
+    return resultado, {"segundos": time.perf_counter() - inicio_real,
+                       "cpu_segundos": time.process_time() - inicio_cpu}
+
+
+def _medir_memoria(funcion, *args, **kwargs):
+    # RSS pico del proceso hasta el final de la etapa (incluye las anteriores)
+    resultado = funcion(*args, **kwargs)
+    pico = rss_pico_bytes()
+    return resultado, {"memoria_pico_mb": None if pico is None else pico / 2**20}
+
+
+def _sin_medir(funcion, *args, **kwargs):
+    return funcion(*args, **kwargs), {}
+
+
+def evaluar_corte(df, corte, horizontes=HORIZONTES, medir=_medir_tiempo, parametros_caudal=None):
+    entrenamiento = df[df["fecha"] <= corte].reset_index(drop=True)
+    fecha_final = corte + pd.Timedelta(days=max(horizontes))
+
+    etapas = {}
+    modelo_caudal, etapas["caudal_ajuste"] = medir(ajustar_modelo_caudal, entrenamiento, parametros=parametros_caudal)
+    forecast, etapas["caudal_prediccion"] = medir(pronosticar_caudal, modelo_caudal, entrenamiento, fecha_final)
+    (modelo_nivel, fecha_inicio), etapas["nivel_ajuste"] = medir(ajustar_modelo_nivel, entrenamiento)
+    forecast, etapas["nivel_prediccion"] = medir(aplicar_modelo_nivel, modelo_nivel, forecast, fecha_inicio)
+
+    # Comparar solo los días futuros que tienen nivel observado
+    futuro = forecast.loc[forecast["ds"] > corte, ["ds", "nivel_estimado"]]
+    observado = df[["fecha", "nivel"]].rename(columns={"fecha": "ds"})
+    comparacion = futuro.merge(observado, on="ds", how="inner")
+    comparacion["dia"] = (comparacion["ds"] - corte).dt.days
+
+    errores = {}
+    for h in horizontes:
+        e = (comparacion.loc[comparacion["dia"] <= h, "nivel_estimado"]
+             - comparacion.loc[comparacion["dia"] <= h, "nivel"]).to_numpy()
+        # Se guardan sumas para poder agregar cortes sin promediar promedios
+        errores[h] = {"n": int(len(e)), "suma_cuadrados": float(np.sum(e ** 2)), "suma_abs": float(np.sum(np.abs(e)))}
+
+    return {"corte": corte.date().isoformat(), "errores": errores, "etapas": etapas}
+
+
+def _evaluar_en_proceso(argumentos):
+    df, corte, horizontes, parametros_caudal, medir_memoria = argumentos
+    medir = _medir_memoria if medir_memoria else _sin_medir
+    return evaluar_corte(df, corte, horizontes, medir, parametros_caudal)
+
+
+def generar_cortes(df, n_cortes=6, paso_dias=90, horizontes=HORIZONTES):
+    # El último corte deja por delante el horizonte más largo con datos observados
+    ultimo = df["fecha"].max() - pd.Timedelta(days=max(horizontes))
+    return [ultimo - pd.Timedelta(days=paso_dias * i) for i in reversed(range(n_cortes))]
+
+
+def _agregar(precision, tiempos, horizontes):
+    # precision: resultados de la pasada en procesos (errores y memoria);
+    # tiempos: los de la pasada secuencial (vacía con --sin-tiempos)
+    metricas = {}
+    for h in horizontes:
+        n = sum(r["errores"][h]["n"] for r in precision)
+        sc = sum(r["errores"][h]["suma_cuadrados"] for r in precision)
+        sa = sum(r["errores"][h]["suma_abs"] for r in precision)
+        metricas[str(h)] = {
+            "n": n,
+            "rmse": float(np.sqrt(sc / n)) if n else None,
+            "mae": sa / n if n else None,
+        }
+
+    etapas = {}
+    for nombre in precision[0]["etapas"]:
+        segundos = [r["etapas"][nombre]["segundos"] for r in tiempos]
+        cpu = [r["etapas"][nombre]["cpu_segundos"] for r in tiempos]
+        picos = [r["etapas"][nombre]["memoria_pico_mb"] for r in precision
+                 if r["etapas"][nombre].get("memoria_pico_mb") is not None]
+        etapas[nombre] = {
+            "segundos_medio": float(np.mean(segundos)) if segundos else None,
+            "segundos_max": float(np.max(segundos)) if segundos else None,
+            "cpu_segundos_medio": float(np.mean(cpu)) if cpu else None,
+            "memoria_pico_mb": float(np.max(picos)) if picos else None,
+        }
+    return metricas, etapas
+
+
+def ejecutar_backtest(directorio_datos=DIRECTORIO_DATOS, n_cortes=6, paso_dias=90,
+                      horizontes=HORIZONTES, max_procesos=None, medir_memoria=True, medir_tiempos=True):
+    horizontes = tuple(sorted(horizontes))
+    df = cargar_y_unir_datos(directorio_datos)
+    df = pd.DataFrame({c: np.asarray(df[c]) for c in df.columns})  # sin memmap, para enviar a los procesos
+    cortes = generar_cortes(df, n_cortes, paso_dias, horizontes)
+    parametros_caudal = {**PARAMETROS_CAUDAL, **cargar_mejores_parametros(directorio_datos=directorio_datos)}
+
+    # Precisión y memoria: un proceso nuevo por corte (spawn y maxtasksperchild=1)
+    # para que el pico no arrastre lo de otros cortes. Va antes de los tiempos:
+    # en Linux el hijo hereda el RSS pico que tenía este proceso al lanzarlo
+    inicio = time.perf_counter()
+    tareas = [(df, corte, horizontes, parametros_caudal, medir_memoria) for corte in cortes]
+    with get_context("spawn").Pool(max_procesos, maxtasksperchild=1) as pool:
+        precision = pool.map(_evaluar_en_proceso, tareas, chunksize=1)
+    segundos_precision = time.perf_counter() - inicio
+
+    # Tiempos: un corte a la vez, sin competir por CPU con otros procesos
+    tiempos = []
+    inicio = time.perf_counter()
+    if medir_tiempos:
+        tiempos = [evaluar_corte(df, corte, horizontes, parametros_caudal=parametros_caudal) for corte in cortes]
+    total = time.perf_counter() - inicio
+
+    metricas, etapas = _agregar(precision, tiempos, horizontes)
+    return {
+        "generado": datetime.now().isoformat(timespec="seconds"),
+        "huella_datos": huella_datos(directorio_datos),
+        "parametros": {"caudal": parametros_caudal, "nivel": PARAMETROS_NIVEL},
+        "entorno": {"python": platform.python_version(), "maquina": platform.machine(), "nucleos": os.cpu_count()},
+        "cortes": [r["corte"] for r in precision],
+        "horizontes": metricas,
+        "etapas": etapas,
+        "segundos_precision": segundos_precision,
+        "segundos_total": total if medir_tiempos else None,
+    }
+
+
+def guardar_reporte(reporte, ruta=ARCHIVO_REPORTE):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+
+
+def cargar_reporte(ruta=ARCHIVO_REPORTE):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def metricas_backtest(directorio_datos=DIRECTORIO_DATOS, ruta=ARCHIVO_REPORTE):
+    # RMSE del backtest para forecast.attrs ({} si el reporte no corresponde a estos datos)
+    reporte = cargar_reporte(ruta)
+    if reporte is None or reporte.get("huella_datos") != huella_datos(directorio_datos):
+        return {}
+
+    horizontes = reporte["horizontes"]
+    mayor = max(horizontes, key=int)
+    return {
+        "rmse_nivel": horizontes[mayor]["rmse"],
+        "rmse_nivel_por_horizonte": {int(h): m["rmse"] for h, m in horizontes.items()},
+    }
+
+
+def comparar_reportes(base, nuevo, tolerancia=0.10):
+    # Devuelve las métricas que empeoraron más de la tolerancia relativa
+    regresiones = []
+    for h, m in base["horizontes"].items():
+        for metrica in ("rmse", "mae"):
+            antes, despues = m.get(metrica), nuevo["horizontes"].get(h, {}).get(metrica)
+            if antes and despues and despues > antes * (1 + tolerancia):
+                regresiones.append(f"{metrica} h={h}: {antes:.4f} → {despues:.4f}")
+    for etapa, m in base["etapas"].items():
+        antes, despues = m["segundos_medio"], nuevo["etapas"].get(etapa, {}).get("segundos_medio")
+        if antes and despues and despues > antes * (1 + tolerancia):
+            regresiones.append(f"tiempo {etapa}: {antes:.2f} s → {despues:.2f} s")
+    return regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest walk-forward y benchmark del pipeline")
+    parser.add_argument("--cortes", type=int, default=6)
+    parser.add_argument("--paso", type=int, default=90, help="Días entre cortes")
+    parser.add_argument("--horizontes", type=int, nargs="+", default=list(HORIZONTES))
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos para la pasada de precisión y memoria")
+    parser.add_argument("--sin-memoria", action="store_true", help="No medir la memoria pico")
+    parser.add_argument("--sin-tiempos", action="store_true", help="Omitir la pasada secuencial de tiempos")
+    parser.add_argument("--salida", default=ARCHIVO_REPORTE)
+    parser.add_argument("--comparar", help="Reporte anterior contra el que buscar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    args = parser.parse_args()
+
+    reporte = ejecutar_backtest(n_cortes=args.cortes, paso_dias=args.paso,
+                                horizontes=args.horizontes, max_procesos=args.procesos,
+                                medir_memoria=not args.sin_memoria, medir_tiempos=not args.sin_tiempos)
+    guardar_reporte(reporte, args.salida)
+
+    for h, m in reporte["horizontes"].items():
+        if m["n"]:
+            print(f"📉 h={h:>3} días: RMSE {m['rmse']:.3f} m · MAE {m['mae']:.3f} m (n={m['n']})")
+        else:
+            print(f"📉 h={h:>3} días: sin observaciones")
+    for etapa, m in reporte["etapas"].items():
+        memoria = "" if m["memoria_pico_mb"] is None else f"RSS pico {m['memoria_pico_mb']:.0f} MB"
+        if m["segundos_medio"] is None:
+            print(f"⏱️ {etapa}: {memoria or 'sin mediciones'}")
+            continue
+        memoria = memoria and f", {memoria}"
+        print(f"⏱️ {etapa}: {m['segundos_medio']:.2f} s (CPU {m['cpu_segundos_medio']:.2f} s, "
+              f"máx {m['segundos_max']:.2f} s{memoria})")
+    print(f"💾 Reporte guardado en {args.salida}")
+
+    if args.comparar:
+        base = cargar_reporte(args.comparar)
+        if base is None:
+            sys.exit(f"No se pudo leer {args.comparar}")
+        regresiones = comparar_reportes(base, reporte, args.tolerancia)
+        for r in regresiones:
+            print(f"⚠️ Regresión: {r}")
+        sys.exit(1 if regresiones else 0)
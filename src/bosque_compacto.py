@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# Bosque de nivel compilado a un único arreglo de nodos. Todos los árboles se
+# concatenan en un arreglo estructurado (hijo, variable, umbral, valor) y se
+# guarda como .npy: cargarlo es abrirlo con memoria mapeada, sin reconstruir
+# objetos de sklearn. Dentro de cada árbol los nodos van por niveles y los dos
+# hijos de un nodo quedan contiguos, así que el siguiente nodo es
+# hijo + (x > umbral); las hojas apuntan a sí mismas (umbral +inf).
+# La predicción recorre todos los árboles a la vez sobre los pares (árbol, fila)
+# que aún no llegaron a una hoja: se avanzan varios niveles seguidos sin ramas y
+# cada PASOS_POR_COMPACTACION se descartan los que ya no se mueven. De una sola
+# pasada salen la media (sumada árbol a árbol, como RandomForestRegressor.predict,
+# así que coincide bit a bit) y la dispersión entre árboles.
+#   python -m src.bosque_compacto   → compila el bosque del artefacto vigente y lo compara con sklearn
+#                                     (si el artefacto ya no trae modelo_nivel.pkl, reajusta el bosque)
+
+FORMATO = 1
+NODO = np.dtype([
+    ("hijo", "<i8"),           # índice global del hijo izquierdo (el derecho es el siguiente)
+    ("variable", "<i8"),
+    ("umbral", "<f8"),         # float64 como en sklearn: X (float32) se compara promovido a float64
+    ("valor", "<f8"),
+    ("nan_izquierda", "u1"),   # a dónde van los NaN (missing_go_to_left de sklearn)
+], align=True)  # registros de 40 bytes alineados: casi el doble de rápido que empaquetados
+FILAS_POR_BLOQUE = 4096
+PASOS_POR_COMPACTACION = 3
+
+
+class BosqueCompacto:
+    def __init__(self, nodos, raices, n_variables, variables=None):
+        # Vista ndarray simple: indexar un np.memmap pasa por Python en cada acceso
+        self.nodos = nodos = nodos.view(np.ndarray)
+        self.raices = np.asarray(raices, dtype=np.int64)
+        self.n_variables = int(n_variables)
+        self.variables = list(variables) if variables is not None else None
+        # Vistas por campo sobre el mismo búfer (no copian aunque esté mapeado)
+        self.hijo = nodos["hijo"]
+        self.variable = nodos["variable"]
+        self.umbral = nodos["umbral"]
+        self.valor = nodos["valor"]
+        self.nan_izquierda = nodos["nan_izquierda"]
+
+    @property
+    def n_arboles(self):
+        return len(self.raices)
+
+    def hojas(self, X):
+        # Índice global de la hoja a la que llega cada fila en cada árbol: (árboles, filas)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_variables:
+            raise ValueError(f"Se esperaban {self.n_variables} variables, llegaron {X.shape[-1]}")
+        n = X.shape[0]
+        plano = X.ravel()
+        con_nan = bool(np.isnan(plano).any())
+        actual = np.repeat(self.raices, n)
+        desplazamiento = np.tile(np.arange(n, dtype=np.int64) * self.n_variables, self.n_arboles)
+
+        pendientes = np.arange(actual.size)
+        nodo = actual
+        while pendientes.size:
+            for _ in range(PASOS_POR_COMPACTACION):
+                anterior = nodo
+                x = plano[desplazamiento + self.variable[nodo]]
+                # x > umbral es falso para NaN: van a la izquierda salvo que el nodo diga lo contrario
+                derecha = x > self.umbral[nodo]
+                if con_nan:
+                    derecha |= np.isnan(x) & (self.nan_izquierda[nodo] == 0)
+                nodo = self.hijo[nodo] + derecha
+            actual[pendientes] = nodo
+            # Un nodo interno siempre lleva a otro distinto: los que no se movieron están en su hoja
+            siguen = nodo != anterior
+            pendientes, nodo, desplazamiento = pendientes[siguen], nodo[siguen], desplazamiento[siguen]
+        return actual.reshape(self.n_arboles, n)
+
+    def predicciones_arboles(self, X):
+        # (árboles, filas), en el orden de estimators_
+        return self.valor[self.hojas(X)]
+
+    def predecir(self, X, filas_por_bloque=FILAS_POR_BLOQUE):
+        # (media, desviación entre árboles) de una sola pasada, por bloques de filas
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        media = np.empty(X.shape[0])
+        desviacion = np.empty(X.shape[0])
+        for inicio in range(0, X.shape[0], filas_por_bloque):
+            bloque = slice(inicio, inicio + filas_por_bloque)
+            predicciones = self.predicciones_arboles(X[bloque])
+            suma = np.zeros(predicciones.shape[1])
+            for prediccion in predicciones:
+                suma += prediccion
+            media[bloque] = suma / self.n_arboles
+            desviacion[bloque] = predicciones.std(axis=0)
+        return media, desviacion
+
+    def predict(self, X):
+        # Misma firma que RandomForestRegressor.predict
+        return self.predecir(X)[0]
+
+
+def _por_niveles(izquierdo, derecho):
+    # Orden de los nodos de un árbol: la raíz y luego, nivel a nivel, las parejas (izquierdo, derecho)
+    orden = [np.zeros(1, dtype=np.int64)]
+    frontera = orden[0]
+    while True:
+        internos = frontera[izquierdo[frontera] >= 0]
+        if internos.size == 0:
+            break
+        frontera = np.column_stack([izquierdo[internos], derecho[internos]]).ravel()
+        orden.append(frontera)
+    orden = np.concatenate(orden)
+    posicion = np.empty_like(orden)
+    posicion[orden] = np.arange(len(orden))
+    return orden, posicion
+
+
+def compilar_bosque(modelo, variables=None):
+    arboles = [estimador.tree_ for estimador in modelo.estimators_]
+    tamanos = np.array([arbol.node_count for arbol in arboles], dtype=np.int64)
+    raices = np.concatenate([[0], np.cumsum(tamanos)[:-1]])
+
+    nodos = np.empty(int(tamanos.sum()), dtype=NODO)
+    for raiz, tamano, arbol in zip(raices, tamanos, arboles):
+        orden, posicion = _por_niveles(arbol.children_left, arbol.children_right)
+        hoja = arbol.children_left[orden] < 0
+        destino = nodos[raiz:raiz + tamano]
+        destino["hijo"] = raiz + np.where(hoja, np.arange(tamano), posicion[np.maximum(arbol.children_left[orden], 0)])
+        destino["variable"] = np.where(hoja, 0, arbol.feature[orden])
+        destino["umbral"] = np.where(hoja, np.inf, arbol.threshold[orden])
+        destino["valor"] = arbol.value[orden, 0, 0]
+        missing = getattr(arbol, "missing_go_to_left", None)
+        # Las hojas se quedan en su sitio aunque la variable que "miran" sea NaN
+        destino["nan_izquierda"] = np.where(hoja, 1, 0 if missing is None else missing[orden])
+    return BosqueCompacto(nodos, raices, modelo.n_features_in_, variables)
+
+
+def _rutas(ruta):
+    base = ruta[:-4] if ruta.endswith(".npy") else ruta
+    return base + ".npy", base + ".json"
+
+
+def exportar_bosque(modelo, ruta, variables=None):
+    # ruta sin extensión: escribe <ruta>.npy (nodos) y <ruta>.json (raíces y metadatos)
+    bosque = modelo if isinstance(modelo, BosqueCompacto) else compilar_bosque(modelo, variables)
+    ruta_nodos, ruta_meta = _rutas(ruta)
+    np.save(ruta_nodos, bosque.nodos)
+    with open(ruta_meta, "w", encoding="utf-8") as f:
+        json.dump({
+            "formato": FORMATO,
+            "arboles": bosque.n_arboles,
+            "nodos": int(len(bosque.nodos)),
+            "n_variables": bosque.n_variables,
+            "variables": bosque.variables,
+            "raices": bosque.raices.tolist(),
+        }, f)
+    return bosque
+
+
+def cargar_bosque(ruta, mmap=True):
+    ruta_nodos, ruta_meta = _rutas(ruta)
+    with open(ruta_meta, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("formato") != FORMATO:
+        raise ValueError(f"Formato de bosque no soportado: {meta.get('formato')!r}")
+    nodos = np.load(ruta_nodos, mmap_mode="r" if mmap else None)
+    if nodos.dtype != NODO or len(nodos) != meta["nodos"]:
+        raise ValueError(f"{ruta_nodos} no corresponde a {ruta_meta}")
+    return BosqueCompacto(nodos, meta["raices"], meta["n_variables"], meta.get("variables"))
+
+
+if __name__ == "__main__":
+    import pickle
+    import tempfile
+
+    from src.almacen_modelos import DIRECTORIO_MODELOS, clave_vigente
+    from src.caracteristicas import FEATURES, matriz_entrenamiento
+    from src.predecir_nivel import ajustar_modelo_nivel
+    from src.preparar_datos import cargar_y_unir_datos
+
+    parser = argparse.ArgumentParser(description="Compila el bosque de nivel del artefacto vigente y lo compara con sklearn")
+    parser.add_argument("--directorio", default=DIRECTORIO_MODELOS)
+    args = parser.parse_args()
+
+    df = cargar_y_unir_datos()
+    ruta = os.path.join(args.directorio, clave_vigente(args.directorio)[0])
+    ruta_pickle = os.path.join(ruta, "modelo_nivel.pkl")
+    inicio = time.perf_counter()
+    if os.path.isfile(ruta_pickle):
+        # Artefacto antiguo: se compila en su carpeta
+        with open(ruta_pickle, "rb") as f:
+            modelo = pickle.load(f)
+        destino = os.path.join(ruta, "bosque_nivel")
+    else:
+        # Los artefactos nuevos ya solo guardan el bosque: se reajusta (mismos
+        # parámetros y semilla, mismo bosque) para comparar contra sklearn
+        modelo, _ = ajustar_modelo_nivel(df)
+        destino = os.path.join(tempfile.mkdtemp(prefix="bosque-"), "bosque_nivel")
+        ruta_pickle = destino + ".pkl"
+        with open(ruta_pickle, "wb") as f:
+            pickle.dump(modelo, f, protocol=pickle.HIGHEST_PROTOCOL)
+        inicio = time.perf_counter()
+        with open(ruta_pickle, "rb") as f:
+            modelo = pickle.load(f)
+    t_pickle = time.perf_counter() - inicio
+
+    bosque = exportar_bosque(modelo, destino, FEATURES)
+    inicio = time.perf_counter()
+    bosque = cargar_bosque(destino)
+    t_mmap = time.perf_counter() - inicio
+
+    X = np.asarray(matriz_entrenamiento(df)[0])
+    inicio = time.perf_counter()
+    esperado = modelo.predict(X)
+    t_sklearn = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    media, _ = bosque.predecir(X)
+    t_compacto = time.perf_counter() - inicio
+
+    print(f"🌲 {bosque.n_arboles} árboles, {len(bosque.nodos)} nodos, "
+          f"{os.path.getsize(destino + '.npy') / 2**20:.1f} MB (pickle: {os.path.getsize(ruta_pickle) / 2**20:.1f} MB)")
+    print(f"   carga: pickle {t_pickle * 1e3:.1f} ms, mmap {t_mmap * 1e3:.2f} ms")
+    print(f"   predicción de {len(X)} filas: sklearn {t_sklearn * 1e3:.1f} ms, compacto {t_compacto * 1e3:.1f} ms")
+    print(f"   idénticas: {np.array_equal(esperado, media)} (máx. diferencia {np.abs(esperado - media).max():.2e})")
@@ -0,0 +1,122 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Variables de entrada del bosque de nivel, construidas una sola vez para el
+# entrenamiento y para el forecast. Todo se calcula con NumPy sobre las columnas
+# (sin copiar el DataFrame) y se escribe directamente en una matriz float32
+# contigua, el formato con el que trabajan los árboles de sklearn. La matriz de
+# entrenamiento se guarda en memoria por versión del conjunto de datos.
+
+FEATURES = ["caudal", "precipitacion", "mes", "semana", "año", "dias_desde_inicio",
+            "caudal_lag1", "precipitacion_lag1", "caudal_x_mes", "precipitacion_x_semana"]
+COLUMNA = {nombre: i for i, nombre in enumerate(FEATURES)}
+
+MAX_MATRICES_CACHE = 4
+
+_cache = OrderedDict()
+_candado = threading.Lock()
+
+
+def calendario(fechas):
+    # Mes, semana ISO y año como isocalendar(), pero vectorizado sobre datetime64
+    dias = np.asarray(fechas, dtype="datetime64[D]")
+    anio = dias.astype("datetime64[Y]")
+    mes = (dias.astype("datetime64[M]") - anio.astype("datetime64[M]")).astype(np.int64) + 1
+
+    # La semana ISO es la del jueves de esa semana (lunes = 0)
+    dia_semana = (dias.astype(np.int64) + 3) % 7
+    jueves = dias - dia_semana.astype("timedelta64[D]") + np.timedelta64(3, "D")
+    inicio_anio_iso = jueves.astype("datetime64[Y]").astype("datetime64[D]")
+    semana = (jueves - inicio_anio_iso).astype(np.int64) // 7 + 1
+
+    return mes, semana, anio.astype(np.int64) + 1970
+
+
+def _dias_desde(fechas, fecha_inicio):
+    return (np.asarray(fechas, dtype="datetime64[ns]") - np.datetime64(fecha_inicio, "ns")) // np.timedelta64(1, "D")
+
+
+def _rezago(valores, primero=np.nan):
+    rezago = np.empty_like(valores)
+    rezago[0] = primero
+    rezago[1:] = valores[:-1]
+    return rezago
+
+
+def _llenar(X, caudal, precipitacion, precipitacion_lag1, fechas, fecha_inicio, caudal_lag1):
+    mes, semana, anio = calendario(fechas)
+    # Cada columna se calcula en float64 y se redondea a float32 al escribirla,
+    # igual que hacía sklearn al convertir el DataFrame
+    X[:, COLUMNA["caudal"]] = caudal
+    X[:, COLUMNA["precipitacion"]] = precipitacion
+    X[:, COLUMNA["mes"]] = mes
+    X[:, COLUMNA["semana"]] = semana
+    X[:, COLUMNA["año"]] = anio
+    X[:, COLUMNA["dias_desde_inicio"]] = _dias_desde(fechas, fecha_inicio)
+    X[:, COLUMNA["caudal_lag1"]] = caudal_lag1
+    X[:, COLUMNA["precipitacion_lag1"]] = precipitacion_lag1
+    X[:, COLUMNA["caudal_x_mes"]] = caudal * mes
+    X[:, COLUMNA["precipitacion_x_semana"]] = precipitacion * semana
+    return X
+
+
+def version_datos(df):
+    h = hashlib.sha1()
+    for columna in ("fecha", "caudal", "nivel", "precipitacion"):
+        if columna in df.columns:
+            h.update(columna.encode("utf-8"))
+            h.update(np.ascontiguousarray(df[columna].to_numpy()).tobytes())
+    return h.hexdigest()
+
+
+def _construir_entrenamiento(df):
+    fechas = df["fecha"].to_numpy(dtype="datetime64[ns]")
+    caudal = df["caudal"].to_numpy(dtype=float)
+    nivel = df["nivel"].to_numpy(dtype=float)
+    precipitacion = (df["precipitacion"].to_numpy(dtype=float) if "precipitacion" in df.columns
+                     else np.zeros(len(df)))
+
+    # Fechas relativas al primer día de la historia; las filas con nulos (el
+    # primer rezago) se descartan después, como hacía df.dropna()
+    X = _llenar(np.empty((len(df), len(FEATURES)), dtype=np.float32), caudal, precipitacion,
+                _rezago(precipitacion), fechas, fechas.min(), _rezago(caudal))
+    validas = ~np.isnan(X).any(axis=1) & ~np.isnan(nivel)
+
+    X = np.ascontiguousarray(X[validas])
+    y = nivel[validas]
+    X.flags.writeable = False
+    y.flags.writeable = False
+    # Referencia para "dias_desde_inicio" en el forecast: la primera fecha que
+    # sobrevive al descarte, no la del entrenamiento (se conserva tal cual)
+    return X, y, fechas[validas].min()
+
+
+def matriz_entrenamiento(df, version=None):
+    # Devuelve (X, y, fecha_inicio); X e y son de solo lectura porque se comparten
+    version = version or version_datos(df)
+    with _candado:
+        if version in _cache:
+            _cache.move_to_end(version)
+            return _cache[version]
+
+    resultado = _construir_entrenamiento(df)
+    with _candado:
+        _cache[version] = resultado
+        while len(_cache) > MAX_MATRICES_CACHE:
+            _cache.popitem(last=False)
+    return resultado
+
+
+def matriz_forecast(fechas, caudal, fecha_inicio, precipitacion=0.0, precipitacion_lag1=0.0):
+    # Escenario por defecto: sin precipitación en todo el horizonte
+    fechas = np.asarray(fechas, dtype="datetime64[ns]")
+    caudal = np.asarray(caudal, dtype=float)
+    X = _llenar(np.empty((len(fechas), len(FEATURES)), dtype=np.float32), caudal,
+                np.broadcast_to(np.asarray(precipitacion, dtype=float), caudal.shape),
+                precipitacion_lag1, fechas, fecha_inicio, _rezago(caudal, primero=0.0))
+    # Mismo criterio que fillna(0) sobre el forecast
+    X[np.isnan(X)] = 0
+    return X
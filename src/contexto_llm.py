@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+# Contexto compacto para los prompts del LLM: en lugar de volcar el forecast
+# fila a fila, se resume una ventana en estadísticos (mín/máx con fecha,
+# tendencia), tramos en los que se supera el nivel crítico y una tabla
+# agregada cuyo detalle (diario, semanal o mensual) se elige según el
+# presupuesto de tokens. El presupuesto vale para el texto completo: si no
+# cabe, primero se baja el detalle de la tabla y luego se quita; solo después
+# se listan menos tramos (las fechas críticas son lo último que se pierde). Un
+# año sale en ~250 tokens (mensual), unas 10 veces menos que el to_string() de
+# las 365 filas.
+
+NIVEL_CRITICO = 5.0
+CARACTERES_POR_TOKEN = 4
+PRESUPUESTO_TOKENS = 250
+MAX_TRAMOS = 4  # tramos listados si no caben todos: los primeros y los últimos, el resto se cuenta
+DETALLES = (("diario", None), ("semanal", "W-MON"), ("mensual", "MS"))
+
+
+def estimar_tokens(texto):
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def tramos_superacion(fechas, valores, umbral):
+    # Tramos contiguos con valor >= umbral, como (inicio, fin, máximo)
+    sobre = np.asarray(valores) >= umbral
+    if not sobre.any():
+        return []
+    bordes = np.diff(np.concatenate([[False], sobre, [False]]).astype(np.int8))
+    inicios = np.flatnonzero(bordes == 1)
+    fines = np.flatnonzero(bordes == -1) - 1
+    valores = np.asarray(valores)
+    return [
+        (fechas[i], fechas[f], float(valores[i:f + 1].max()))
+        for i, f in zip(inicios, fines)
+    ]
+
+
+def _lineas_tramos(tramos, maximo):
+    # Como mucho `maximo` tramos (la mitad del principio y la del final) y una línea con los omitidos
+    formatear = lambda t: f"  {pd.Timestamp(t[0]):%Y-%m-%d} a {pd.Timestamp(t[1]):%Y-%m-%d} (máx {t[2]:.2f})"
+    if maximo == 0:
+        return []
+    if len(tramos) <= maximo:
+        return [formatear(t) for t in tramos]
+    primeros, ultimos = tramos[:(maximo + 1) // 2], tramos[len(tramos) - maximo // 2:]
+    omitidos = tramos[len(primeros):len(tramos) - len(ultimos)]
+    return ([formatear(t) for t in primeros]
+            + [f"  … {len(omitidos)} tramo(s) más (máx {max(t[2] for t in omitidos):.2f})"]
+            + [formatear(t) for t in ultimos])
+
+
+def _tabla(df, columna, frecuencia, con_precipitacion):
+    if frecuencia is None:
+        filas = [f"{d:%Y-%m-%d} {v:.2f}" for d, v in zip(df["ds"], df[columna])]
+        if con_precipitacion:
+            filas = [f"{fila} {p:.1f}" for fila, p in zip(filas, df["precipitacion"])]
+        return filas
+
+    agregados = {columna: ["mean", "min", "max"]}
+    if con_precipitacion:
+        agregados["precipitacion"] = ["sum"]
+    grupos = df.set_index("ds").resample(frecuencia, label="left", closed="left").agg(agregados).dropna()
+    filas = []
+    for inicio, fila in grupos.iterrows():
+        texto = f"{inicio:%Y-%m-%d} {fila[(columna, 'mean')]:.2f} ({fila[(columna, 'min')]:.2f}–{fila[(columna, 'max')]:.2f})"
+        if con_precipitacion:
+            texto += f" {fila[('precipitacion', 'sum')]:.1f}"
+        filas.append(texto)
+    return filas
+
+
+def resumir_pronostico(df, umbral=NIVEL_CRITICO, presupuesto_tokens=PRESUPUESTO_TOKENS, columna="nivel_estimado", detalle=None):
+    df = df.loc[df[columna].notna()]
+    if df.empty:
+        return "Sin datos de predicción en la ventana."
+
+    fechas = df["ds"].to_numpy()
+    valores = df[columna].to_numpy(dtype=float)
+    con_precipitacion = "precipitacion" in df.columns
+
+    i_min, i_max = int(np.argmin(valores)), int(np.argmax(valores))
+    dias = (fechas - fechas[0]) / np.timedelta64(1, "D")
+    pendiente = float(np.polyfit(dias, valores, 1)[0]) if len(valores) > 1 else 0.0
+
+    lineas = [
+        f"Periodo: {pd.Timestamp(fechas[0]):%Y-%m-%d} a {pd.Timestamp(fechas[-1]):%Y-%m-%d} ({len(valores)} días)",
+        f"Nivel (m): medio {valores.mean():.2f}, mínimo {valores[i_min]:.2f} el {pd.Timestamp(fechas[i_min]):%Y-%m-%d}, "
+        f"máximo {valores[i_max]:.2f} el {pd.Timestamp(fechas[i_max]):%Y-%m-%d}",
+        f"Tendencia: {pendiente * 30:+.3f} m/mes; cambio total {valores[-1] - valores[0]:+.2f} m",
+    ]
+
+    tramos = tramos_superacion(fechas, valores, umbral)
+    if tramos:
+        lineas.append(f"Superación del nivel crítico ({umbral} m): {len(tramos)} tramo(s), "
+                      f"{int((valores >= umbral).sum())} días")
+    else:
+        lineas.append(f"Sin superación del nivel crítico ({umbral} m)")
+
+    # Del texto más detallado al más corto: para cada número de tramos listados,
+    # la tabla diaria, semanal, mensual y ninguna; solo entonces se listan menos tramos
+    maximos = sorted({len(tramos), min(len(tramos), MAX_TRAMOS), 2, 0}, reverse=True)
+    listas_tramos = [_lineas_tramos(tramos, n) for n in maximos]
+    tablas = []
+    for nombre, frecuencia in DETALLES:
+        if detalle is not None and nombre != detalle:
+            continue
+        cabecera = {"diario": "Fecha nivel", "semanal": "Semana nivel_medio (mín–máx)",
+                    "mensual": "Mes nivel_medio (mín–máx)"}[nombre]
+        if con_precipitacion:
+            cabecera += " precipitación_mm"
+        tablas.append([f"Detalle {nombre}:", cabecera] + _tabla(df, columna, frecuencia, con_precipitacion))
+    # Con un detalle pedido la tabla se mantiene aunque no quepa
+    if detalle is None:
+        tablas.append([])
+    candidatos = [lineas + lista + tabla for lista in listas_tramos for tabla in tablas]
+    for candidato in candidatos:
+        texto = "\n".join(candidato)
+        if estimar_tokens(texto) <= presupuesto_tokens:
+            return texto
+    return texto
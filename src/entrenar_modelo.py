@@ -1,8 +1,69 @@
-from prophet import Prophet
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from src.motores import crear_modelo, motor_configurado, predecir
+from src.instrumentacion import medir
+from src.esquema import compactar, recortar
 
-def entrenar_modelo_caudal(df):
+# Hiperparámetros del modelo de caudal (también forman parte de la clave del almacén de modelos)
+PARAMETROS_CAUDAL = {
+    "yearly_seasonality": True,
+    "weekly_seasonality": False,
+    "daily_seasonality": False,
+    "changepoint_prior_scale": 0.1,
+}
+
+# Última fecha del horizonte de predicción
+FECHA_FINAL = datetime(2025, 12, 31)
+
+# Inicio en caliente: si desde el ajuste anterior solo llegaron unos pocos días
+# nuevos, la optimización de Stan parte de los parámetros anteriores (k, m,
+# delta, beta, sigma_obs). Si los datos cambiaron demasiado, ajuste en frío.
+MAX_FRACCION_NUEVA = 0.05
+MAX_CAMBIO_ESCALA = 0.05
+
+
+def estado_caudal(modelo):
+    # Solo Prophet (Stan) admite inicio en caliente
+    if not hasattr(modelo, "stan_backend"):
+        return None
+    from prophet.utilities import warm_start_params
+
+    # Parámetros del ajuste más lo necesario para decidir si sirven de inicio
+    parametros = warm_start_params(modelo)
+    return {
+        "parametros": {nombre: np.asarray(valor).tolist() for nombre, valor in parametros.items()},
+        "inicio": modelo.history["ds"].min().isoformat(),
+        "fin": modelo.history["ds"].max().isoformat(),
+        "filas": int(len(modelo.history)),
+        "y_scale": float(modelo.y_scale),
+    }
+
+
+def _inicio_caliente(estado, df_prophet):
+    if not estado:
+        return None
+
+    # La historia nueva debe ser la anterior más unos pocos días al final
+    if df_prophet["ds"].min() != pd.Timestamp(estado["inicio"]) or df_prophet["ds"].max() < pd.Timestamp(estado["fin"]):
+        return None
+    nuevas = len(df_prophet) - estado["filas"]
+    if nuevas < 0 or nuevas > MAX_FRACCION_NUEVA * estado["filas"]:
+        return None
+
+    # Prophet escala y por su máximo absoluto; los parámetros lineales se
+    # reescalan a la escala nueva y un salto grande obliga a ajustar en frío
+    proporcion = estado["y_scale"] / float(df_prophet["y"].abs().max())
+    if abs(proporcion - 1) > MAX_CAMBIO_ESCALA:
+        return None
+
+    return {
+        nombre: np.asarray(valor, dtype=float) * proporcion if nombre in ("delta", "beta") else float(valor) * proporcion
+        for nombre, valor in estado["parametros"].items()
+    }
+
+@medir("caudal_ajuste", filas_entrada=True)
+def ajustar_modelo_caudal(df, estado_previo=None, motor=None, parametros=None):
     # Usar caudal y precipitación
     df_prophet = df[["fecha", "caudal", "precipitacion"]].copy()
     df_prophet.columns = ["ds", "y", "precipitacion"]
@@ -13,22 +74,28 @@ def entrenar_modelo_caudal(df):
     # Eliminar filas con valores nulos por el shift
     df_prophet = df_prophet.dropna()
 
-    # Crear modelo Prophet con regresores
-    modelo = Prophet(
-        yearly_seasonality=True,
-        weekly_seasonality=False,
-        daily_seasonality=False,
-        changepoint_prior_scale=0.1
-    )
+    # Crear modelo (Prophet u otro motor configurado) con regresores
+    motor = motor_configurado(motor)
+    # parametros (p. ej. los del ajuste de hiperparámetros) reemplazan a los predeterminados
+    modelo = crear_modelo(motor, **{**PARAMETROS_CAUDAL, **(parametros or {})})
     modelo.add_regressor("precipitacion")
     modelo.add_regressor("precipitacion_lag1")
 
-    # Entrenar modelo
-    modelo.fit(df_prophet)
+    # Entrenar modelo (en caliente si el estado previo sigue siendo válido)
+    inicio = _inicio_caliente(estado_previo, df_prophet) if motor == "prophet" else None
+    if inicio is not None:
+        modelo.fit(df_prophet, init=inicio)
+    else:
+        modelo.fit(df_prophet)
+    modelo.inicio_caliente = inicio is not None
 
+    return modelo
+
+
+@medir("caudal_prediccion", filas=len)
+def pronosticar_caudal(modelo, df, fecha_final=FECHA_FINAL, incertidumbre=None):
     # Definir fecha final de predicción
-    fecha_final = datetime(2025, 12, 31)
-    dias_extra = (fecha_final - df_prophet["ds"].max()).days
+    dias_extra = (fecha_final - modelo.history["ds"].max()).days
     dias_extra = max(0, dias_extra)
 
     # Generar fechas futuras
@@ -41,16 +108,23 @@ def entrenar_modelo_caudal(df):
     future = future.merge(df_precip, on="ds", how="left")
 
     # Rellenar precipitación faltante con promedio
-    future["precipitacion"].fillna(df["precipitacion"].mean(), inplace=True)
+    future["precipitacion"] = future["precipitacion"].fillna(df["precipitacion"].mean())
 
     # ➕ Agregar lag de precipitación en fechas futuras
     future["precipitacion_lag1"] = future["precipitacion"].shift(1)
-    future["precipitacion_lag1"].fillna(df["precipitacion"].mean(), inplace=True)
+    future["precipitacion_lag1"] = future["precipitacion_lag1"].fillna(df["precipitacion"].mean())
+
+    # Predecir caudal (historia incluida: la usan el modelo de nivel y la app);
+    # solo ds/yhat/yhat_lower/yhat_upper, con el modo de incertidumbre configurado
+    forecast = predecir(modelo, future, incertidumbre)
 
-    # Predecir caudal futuro
-    forecast = modelo.predict(future)
+    # Limitar explícitamente hasta la fecha final (2025-12-31 por defecto) y
+    # pasar al esquema compacto (float32, solo las columnas del forecast)
+    return compactar(recortar(forecast, hasta=fecha_final, incluir_hasta=True))
 
-    # Limitar explícitamente hasta 2025-12-31
-    forecast = forecast[forecast["ds"] <= "2025-12-31"]
 
+def entrenar_modelo_caudal(df, fecha_final=FECHA_FINAL, estado_previo=None, motor=None, parametros=None,
+                           incertidumbre=None):
+    modelo = ajustar_modelo_caudal(df, estado_previo, motor, parametros)
+    forecast = pronosticar_caudal(modelo, df, fecha_final, incertidumbre)
     return forecast, modelo
@@ -0,0 +1,165 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+
+from src.contexto_llm import NIVEL_CRITICO
+from src.caracteristicas import COLUMNA, matriz_entrenamiento, matriz_forecast
+from src.intervalos import contar_arboles, predicciones_por_arbol
+
+# Escenarios Monte Carlo de precipitación para el bosque de nivel. En lugar del
+# único escenario seco (precipitación 0 en todo el horizonte) se muestrean
+# miles de trayectorias y se pasan todas por el bosque como un solo lote:
+#   - "climatologia": bootstrap por bloques de la historia; cada bloque de días
+#     copia los mismos días del calendario de un año observado al azar, así se
+#     conservan la estacionalidad y la persistencia dentro del bloque
+#   - "pronostico":   precipitacion_estimada de predecir_precipitacion más
+#     anomalías históricas remuestreadas del mismo modo (recortado en 0)
+# Todos los escenarios se evalúan como un único lote de filas (deduplicadas, en
+# bloques de memoria acotada y en hilos) y se resumen en probabilidades diarias
+# de superar cada umbral y bandas de cuantiles.
+
+ORIGENES = ("climatologia", "pronostico")
+CUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+_COLUMNAS_PRECIPITACION = [COLUMNA[c] for c in ("precipitacion", "precipitacion_lag1", "precipitacion_x_semana")]
+
+
+def _matriz_anual(df):
+    # Precipitación observada como (años × día del año); los huecos quedan en NaN
+    dia = df["fecha"].dt.dayofyear.to_numpy() - 1
+    anios, fila = np.unique(df["fecha"].dt.year.to_numpy(), return_inverse=True)
+    matriz = np.full((len(anios), 366), np.nan)
+    matriz[fila, dia] = df["precipitacion"].to_numpy(dtype=float)
+
+    # Día sin ningún año observado (p. ej. 29 de febrero): media de los vecinos
+    media = np.nanmean(matriz, axis=0)
+    media = pd.Series(media).interpolate(limit_direction="both").to_numpy()
+    return matriz, media
+
+
+def muestrear_precipitacion(df, fechas, n_escenarios=1000, bloque_dias=7, origen="climatologia",
+                            forecast_precip=None, semilla=0):
+    if origen not in ORIGENES:
+        raise ValueError(f"Origen de escenarios desconocido: {origen!r} (usa uno de {ORIGENES})")
+
+    rng = np.random.default_rng(semilla)
+    matriz, media = _matriz_anual(df)
+    dias = pd.DatetimeIndex(fechas).dayofyear.to_numpy() - 1
+
+    # Un año al azar por (escenario, bloque) y se leen sus mismos días del calendario
+    n_bloques = -(-len(dias) // bloque_dias)
+    anios = rng.integers(0, matriz.shape[0], size=(n_escenarios, n_bloques))
+    anios = np.repeat(anios, bloque_dias, axis=1)[:, : len(dias)]
+    muestras = matriz[anios, dias[None, :]]
+    huecos = np.isnan(muestras)
+    muestras[huecos] = np.broadcast_to(media[dias], muestras.shape)[huecos]
+
+    if origen == "pronostico":
+        if forecast_precip is None:
+            raise ValueError("El origen 'pronostico' necesita forecast_precip (salida de predecir_precipitacion)")
+        estimada = (forecast_precip.set_index("ds")["precipitacion_estimada"]
+                    .reindex(pd.DatetimeIndex(fechas)).fillna(0).to_numpy())
+        muestras = estimada[None, :] + (muestras - media[dias][None, :])
+
+    return np.clip(muestras, 0, None).astype(np.float32)
+
+
+def _filas_unicas(precipitacion):
+    # Cada trayectoria sale de unos pocos años observados, así que por día hay muy
+    # pocas parejas (precipitación, lag) distintas aunque haya miles de escenarios:
+    # el bosque solo evalúa esas y el resultado se reparte a todos los escenarios
+    actual = precipitacion[:, 1:].view(np.uint32).astype(np.uint64)
+    previa = precipitacion[:, :-1].view(np.uint32).astype(np.uint64)
+    claves = (actual << np.uint64(32)) | previa
+
+    dias, valores, inversos = [], [], np.empty(claves.shape, dtype=np.int64)
+    desplazamiento = 0
+    for d in range(claves.shape[1]):
+        unicas, inverso = np.unique(claves[:, d], return_inverse=True)
+        inversos[:, d] = inverso + desplazamiento
+        desplazamiento += len(unicas)
+        dias.append(np.full(len(unicas), d))
+        valores.append(unicas)
+    valores = np.concatenate(valores)
+    pares = np.stack([(valores >> np.uint64(32)).astype(np.uint32), (valores & np.uint64(0xFFFFFFFF)).astype(np.uint32)], axis=1)
+    return np.concatenate(dias), pares.view(np.float32), inversos
+
+
+def _predecir_lote(modelo, base, semanas, dias, pares):
+    X = base[dias]
+    X[:, _COLUMNAS_PRECIPITACION[0]] = pares[:, 0]
+    X[:, _COLUMNAS_PRECIPITACION[1]] = pares[:, 1]
+    X[:, _COLUMNAS_PRECIPITACION[2]] = pares[:, 0] * semanas[dias]
+
+    suma = np.zeros(X.shape[0])
+    for prediccion in predicciones_por_arbol(modelo, X):
+        suma += prediccion
+    return (suma / contar_arboles(modelo)).astype(np.float32)
+
+
+def simular_escenarios(modelo, forecast, df, n_escenarios=1000, umbrales=(NIVEL_CRITICO,), cuantiles=CUANTILES,
+                       origen="climatologia", forecast_precip=None, bloque_dias=7, fecha_inicio=None,
+                       n_jobs=-1, semilla=0, filas_por_lote=200_000):
+    # Solo el horizonte futuro: en la historia la precipitación ya es conocida
+    en_horizonte = (forecast["ds"] > df["fecha"].max()).to_numpy()
+    futuro = forecast.loc[en_horizonte].reset_index(drop=True)
+    if futuro.empty:
+        return pd.DataFrame(columns=["ds"])
+    if fecha_inicio is None:
+        fecha_inicio = matriz_entrenamiento(df)[2]
+
+    # La matriz se arma sobre el forecast completo y después se recorta: el lag de
+    # caudal del primer día del horizonte es el yhat del día anterior, no 0
+    base = matriz_forecast(forecast["ds"], forecast["yhat"], fecha_inicio)[en_horizonte]
+    semanas = base[:, COLUMNA["semana"]]
+
+    # Se muestrea también el día anterior al horizonte, que da el lag del primer día
+    fechas = pd.DatetimeIndex([futuro["ds"].iloc[0] - pd.Timedelta(days=1)]).append(pd.DatetimeIndex(futuro["ds"]))
+    precipitacion = muestrear_precipitacion(df, fechas, n_escenarios, bloque_dias, origen, forecast_precip, semilla)
+
+    # Filas únicas en lotes de filas_por_lote (memoria acotada, al menos un lote por
+    # núcleo), en hilos porque tree.predict libera el GIL
+    dias, pares, inversos = _filas_unicas(precipitacion)
+    tamano = max(1, min(filas_por_lote, -(-len(dias) // effective_n_jobs(n_jobs))))
+    lotes = [slice(i, min(i + tamano, len(dias))) for i in range(0, len(dias), tamano)]
+    predicciones = np.concatenate(Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(_predecir_lote)(modelo, base, semanas, dias[lote], pares[lote]) for lote in lotes
+    ))
+    niveles = predicciones[inversos]
+
+    resumen = pd.DataFrame({"ds": futuro["ds"].to_numpy()})
+    for q, valores in zip(cuantiles, np.quantile(niveles, cuantiles, axis=0)):
+        resumen[f"nivel_p{round(q * 100):02d}"] = valores
+    resumen["nivel_medio"] = niveles.mean(axis=0)
+    for umbral in umbrales:
+        resumen[f"prob_superar_{umbral:g}"] = (niveles >= umbral).mean(axis=0)
+    resumen["precipitacion_media"] = precipitacion[:, 1:].mean(axis=0)
+    resumen.attrs["n_escenarios"] = n_escenarios
+    resumen.attrs["origen"] = origen
+    return resumen
+
+
+if __name__ == "__main__":
+    from src.almacen_modelos import obtener_pronostico
+    from src.preparar_datos import cargar_y_unir_datos
+
+    parser = argparse.ArgumentParser(description="Escenarios Monte Carlo de precipitación para el nivel")
+    parser.add_argument("--escenarios", type=int, default=1000)
+    parser.add_argument("--bloque", type=int, default=7, help="Días por bloque del bootstrap")
+    parser.add_argument("--umbral", type=float, action="append", default=None)
+    parser.add_argument("--salida", default=None, help="CSV con probabilidades y cuantiles")
+    args = parser.parse_args()
+
+    df = cargar_y_unir_datos()
+    forecast, _, modelo_nivel = obtener_pronostico()
+
+    inicio = time.perf_counter()
+    resumen = simular_escenarios(modelo_nivel, forecast, df, n_escenarios=args.escenarios,
+                                 umbrales=tuple(args.umbral or (NIVEL_CRITICO,)), bloque_dias=args.bloque)
+    print(f"⏱️ {args.escenarios} escenarios × {len(resumen)} días en {time.perf_counter() - inicio:.2f} s")
+    print(resumen.iloc[:: max(1, len(resumen) // 12)].to_string(index=False))
+    if args.salida:
+        resumen.to_csv(args.salida, index=False)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+# Esquema compacto del forecast que pasa de etapa en etapa (caudal → nivel →
+# almacén/publicación → app): solo las columnas que alguien lee, "ds" como
+# datetime64[ns] y los valores en float32 (la mitad de memoria; el bosque de
+# nivel ya trabaja en float32). Las funciones de aquí evitan copias: compactar
+# reutiliza los arreglos que ya tienen el tipo correcto, agregar_columnas añade
+# columnas alineadas por fecha sin rehacer el DataFrame (a diferencia de merge)
+# y recortar devuelve una vista por posición sobre las fechas ordenadas.
+
+COLUMNAS_FORECAST = {
+    "ds": "datetime64[ns]",
+    "yhat": "float32",
+    "yhat_lower": "float32",
+    "yhat_upper": "float32",
+    "precipitacion_estimada": "float32",
+    "nivel_estimado": "float32",
+    "nivel_estimado_lower": "float32",
+    "nivel_estimado_upper": "float32",
+}
+
+
+def compactar(forecast, columnas=None):
+    # Columnas del esquema presentes en forecast (o las pedidas), en su orden y tipo
+    columnas = [c for c in (columnas or COLUMNAS_FORECAST) if c in forecast.columns]
+    compacto = pd.DataFrame({
+        columna: forecast[columna].to_numpy(dtype=COLUMNAS_FORECAST.get(columna), copy=False)
+        for columna in columnas
+    }, copy=False)
+    compacto.attrs.update(forecast.attrs)
+    return compacto
+
+
+def asignar(forecast, columna, valores):
+    # Columna nueva con el tipo del esquema (sin copia si ya lo tiene)
+    forecast[columna] = np.asarray(valores, dtype=COLUMNAS_FORECAST.get(columna))
+    return forecast
+
+
+def agregar_columnas(forecast, otro, columnas):
+    # Como forecast.merge(otro[["ds", *columnas]], on="ds", how="left"), pero
+    # añadiendo las columnas in situ; las fechas de forecast sin pareja quedan en NaN
+    posiciones = pd.Index(otro["ds"]).get_indexer(forecast["ds"])
+    encontradas = posiciones >= 0
+    for columna in columnas:
+        valores = np.full(len(forecast), np.nan, dtype=COLUMNAS_FORECAST.get(columna, "float64"))
+        valores[encontradas] = otro[columna].to_numpy()[posiciones[encontradas]]
+        forecast[columna] = valores
+    return forecast
+
+
+def recortar(forecast, desde=None, hasta=None, incluir_hasta=False):
+    # Filas con desde <= ds < hasta (o <= hasta) como vista; forecast ordenado por "ds"
+    fechas = forecast["ds"].to_numpy(dtype="datetime64[ns]")
+    i = 0 if desde is None else int(np.searchsorted(fechas, np.datetime64(pd.Timestamp(desde), "ns"), "left"))
+    j = len(fechas) if hasta is None else int(np.searchsorted(
+        fechas, np.datetime64(pd.Timestamp(hasta), "ns"), "right" if incluir_hasta else "left"))
+    return forecast.iloc[i:max(i, j)]
+
+
+def memoria_bytes(forecast):
+    return int(forecast.memory_usage(index=True, deep=True).sum())
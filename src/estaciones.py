@@ -0,0 +1,42 @@
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+# Registro de estaciones: nombre, coordenadas y carpeta con sus CSV
+# (caudal.csv, nivel.csv, precipitacion.csv). Las estaciones sin carpeta de
+# datos solo se muestran en el mapa y no entran en los lotes de predicción.
+
+ARCHIVO_ESTACIONES = "estaciones.json"
+
+
+@dataclass(frozen=True)
+class Estacion:
+    codigo: str
+    nombre: str
+    lat: float
+    lon: float
+    directorio: Optional[str] = None
+    etiqueta: Optional[str] = None
+
+    @property
+    def tiene_datos(self):
+        return self.directorio is not None
+
+
+def cargar_estaciones(ruta=ARCHIVO_ESTACIONES):
+    with open(ruta, encoding="utf-8") as f:
+        registro = json.load(f)
+    return {e["codigo"]: Estacion(**e) for e in registro["estaciones"]}
+
+
+def estacion_predeterminada(ruta=ARCHIVO_ESTACIONES):
+    with open(ruta, encoding="utf-8") as f:
+        registro = json.load(f)
+    return cargar_estaciones(ruta)[registro["predeterminada"]]
+
+
+def obtener_estacion(codigo, ruta=ARCHIVO_ESTACIONES):
+    estaciones = cargar_estaciones(ruta)
+    if codigo not in estaciones:
+        raise KeyError(f"Estación desconocida: {codigo!r} (disponibles: {', '.join(estaciones)})")
+    return estaciones[codigo]
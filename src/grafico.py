@@ -0,0 +1,161 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Capa de datos del gráfico de nivel. Se construye una vez por versión del
+# pronóstico: ordena por fecha y suaviza (media móvil de 7 días) el nivel y sus
+# límites sobre la serie completa. Cada redibujado solo corta el rango con
+# búsqueda binaria sobre "ds" (vistas, sin copiar) y reduce los puntos a un
+# presupuesto fijo antes de pasarlos a matplotlib, así que dibujar un mes o
+# quince años cuesta lo mismo.
+#   minmax: por cubeta, el mínimo y el máximo del nivel (conserva los picos que
+#           cruzan el nivel crítico)
+#   lttb:   Largest-Triangle-Three-Buckets, un punto por cubeta
+# La banda de confianza se reduce aparte: mínimo del límite inferior y máximo
+# del superior por cubeta, para que nunca se estreche al decimar.
+
+VENTANA_SUAVIZADO = 7
+PUNTOS_GRAFICO = 1500
+SERIES = ["nivel_estimado", "nivel_estimado_lower", "nivel_estimado_upper"]
+METODOS = ("minmax", "lttb")
+
+MAX_SERIES_CACHE = 4
+
+_cache = OrderedDict()
+_candado = threading.Lock()
+
+
+class SerieGrafico:
+    def __init__(self, forecast, columnas=SERIES, ventana=VENTANA_SUAVIZADO):
+        ordenado = forecast.sort_values("ds", kind="stable")
+        self.fechas = ordenado["ds"].to_numpy(dtype="datetime64[ns]")
+        self.ventana = ventana
+        self.series = {}
+        for columna in columnas:
+            if columna in ordenado.columns:
+                suavizada = ordenado[columna].astype(float).rolling(window=ventana, min_periods=1).mean()
+                # float32 como el forecast compacto: es lo que ocupa memoria por estación
+                self.series[columna] = suavizada.to_numpy(dtype=np.float32)
+        self.tiene_banda = "nivel_estimado_lower" in self.series and "nivel_estimado_upper" in self.series
+
+    def __len__(self):
+        return len(self.fechas)
+
+    def indices(self, desde=None, hasta=None):
+        # [i, j) de las filas con desde <= ds <= hasta
+        i = 0 if desde is None else int(np.searchsorted(self.fechas, np.datetime64(pd.Timestamp(desde), "ns"), "left"))
+        j = len(self.fechas) if hasta is None else int(
+            np.searchsorted(self.fechas, np.datetime64(pd.Timestamp(hasta), "ns"), "right"))
+        return i, max(i, j)
+
+    def rango(self, desde=None, hasta=None, columnas=None):
+        # Vistas de solo lectura sobre las series suavizadas (resolución completa)
+        i, j = self.indices(desde, hasta)
+        datos = {"ds": self.fechas[i:j]}
+        for columna in columnas or self.series:
+            datos[columna] = self.series[columna][i:j]
+        for valores in datos.values():
+            valores.flags.writeable = False
+        return datos
+
+    def tabla(self, desde=None, hasta=None, columnas=("nivel_estimado",)):
+        return pd.DataFrame(self.rango(desde, hasta, list(columnas)))
+
+    def puntos(self, desde=None, hasta=None, presupuesto=PUNTOS_GRAFICO, metodo="minmax", columna="nivel_estimado"):
+        # Devuelve (linea, banda): linea = {"ds", columna} decimada; banda =
+        # {"ds", "inferior", "superior"} o None si el forecast no trae límites
+        if metodo not in METODOS:
+            raise ValueError(f"Método de decimación desconocido: {metodo!r} (usa uno de {', '.join(METODOS)})")
+        i, j = self.indices(desde, hasta)
+        n = j - i
+        valores = self.series[columna][i:j]
+
+        if n <= presupuesto:
+            seleccion = np.arange(n)
+        elif metodo == "minmax":
+            seleccion = _minmax(valores, max(1, presupuesto // 2 - 1))
+        else:
+            dias = (self.fechas[i:j] - self.fechas[i]) / np.timedelta64(1, "D")
+            seleccion = _lttb(dias, valores, presupuesto)
+        linea = {"ds": self.fechas[i:j][seleccion], columna: valores[seleccion]}
+
+        banda = None
+        if self.tiene_banda and n:
+            banda = _banda(self.fechas[i:j], self.series["nivel_estimado_lower"][i:j],
+                           self.series["nivel_estimado_upper"][i:j], presupuesto)
+        return linea, banda
+
+
+def _cubetas(n, cubetas):
+    # Límites de cubetas contiguas de tamaño casi igual que cubren [0, n)
+    return np.linspace(0, n, cubetas + 1).astype(np.int64)
+
+
+def _minmax(valores, cubetas):
+    n = len(valores)
+    tam = -(-n // cubetas)
+    relleno = tam * cubetas - n
+    # Los NaN y el relleno no ganan nunca: se sustituyen por ±inf para argmin/argmax
+    bajos = np.concatenate([np.where(np.isnan(valores), np.inf, valores), np.full(relleno, np.inf)])
+    altos = np.concatenate([np.where(np.isnan(valores), -np.inf, valores), np.full(relleno, -np.inf)])
+    base = np.arange(cubetas) * tam
+    minimos = base + bajos.reshape(cubetas, tam).argmin(axis=1)
+    maximos = base + altos.reshape(cubetas, tam).argmax(axis=1)
+    # Se conservan también los extremos del rango para que la línea llegue a los bordes
+    return np.unique(np.concatenate([[0, n - 1], np.minimum(minimos, n - 1), np.minimum(maximos, n - 1)]))
+
+
+def _lttb(x, y, presupuesto):
+    n = len(y)
+    limites = _cubetas(n - 2, presupuesto - 2) + 1
+    # Promedios de cada cubeta, calculados de una vez (los NaN cuentan como el último valor válido)
+    y_relleno = pd.Series(y).ffill().bfill().to_numpy()
+    tamanos = np.diff(limites)
+    x_medio = np.add.reduceat(x, limites[:-1]) / tamanos
+    y_medio = np.add.reduceat(y_relleno, limites[:-1]) / tamanos
+
+    seleccion = np.empty(presupuesto, dtype=np.int64)
+    seleccion[0], seleccion[-1] = 0, n - 1
+    anterior = 0
+    for k in range(presupuesto - 2):
+        a, b = limites[k], limites[k + 1]
+        # Punto de referencia siguiente: promedio de la próxima cubeta o el último punto
+        x_sig, y_sig = (x_medio[k + 1], y_medio[k + 1]) if k + 1 < len(x_medio) else (x[-1], y_relleno[-1])
+        areas = np.abs((x[anterior] - x_sig) * (y_relleno[a:b] - y_relleno[anterior])
+                       - (x[anterior] - x[a:b]) * (y_sig - y_relleno[anterior]))
+        anterior = a + int(areas.argmax())
+        seleccion[k + 1] = anterior
+    return seleccion
+
+
+def _banda(fechas, inferior, superior, presupuesto):
+    n = len(fechas)
+    if n <= presupuesto:
+        return {"ds": fechas, "inferior": inferior, "superior": superior}
+    # Envolvente por cubeta, dibujada al inicio y al final de cada una
+    limites = _cubetas(n, max(1, presupuesto // 2))
+    inicios, finales = limites[:-1], limites[1:] - 1
+    minimos = np.fmin.reduceat(inferior, inicios)
+    maximos = np.fmax.reduceat(superior, inicios)
+    return {
+        "ds": np.column_stack([fechas[inicios], fechas[finales]]).ravel(),
+        "inferior": np.repeat(minimos, 2),
+        "superior": np.repeat(maximos, 2),
+    }
+
+
+def serie_grafico(forecast, version):
+    # Una SerieGrafico por versión del pronóstico (la app la pide en cada rerun)
+    with _candado:
+        if version in _cache:
+            _cache.move_to_end(version)
+            return _cache[version]
+
+    serie = SerieGrafico(forecast)
+    with _candado:
+        _cache[version] = serie
+        while len(_cache) > MAX_SERIES_CACHE:
+            _cache.popitem(last=False)
+    return serie
@@ -0,0 +1,238 @@
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from src.instrumentacion import tramo
+from src.preparar_datos import FUENTES
+
+# Ingesta en streaming de telemetría sub-diaria (lecturas cada 5–15 minutos).
+# Cada feed crudo se lee por bloques de tamaño fijo y se agrega al vuelo en
+# intervalos (diarios por defecto): por intervalo se acumulan lecturas, lecturas
+# válidas, suma, máximo y mínimo. En cuanto empieza un intervalo nuevo, los
+# anteriores se escriben al CSV de salida y se olvidan, así que la memoria no
+# depende de cuántos años de historia se procesen: solo del tamaño del bloque.
+# La salida usa el mismo esquema que datos/*.csv, de modo que
+# cargar_y_unir_datos(salida) entrega fecha/caudal/nivel/precipitacion:
+#   fecha,valor,max_abs,min_abs,completo_mediciones,completo_umbral
+# (precipitación sin max_abs/min_abs, y con la suma del día en vez de la media).
+#   completo_mediciones: % de lecturas recibidas sobre las esperadas
+#   completo_umbral:     % de lecturas dentro de los límites físicos
+# Si completo_umbral no llega a COMPLETITUD_MINIMA, el valor del día queda
+# vacío, como en los datos originales. Las lecturas que llegan después de que
+# su intervalo ya se escribió se descartan y se cuentan como tardías.
+#   python -m src.ingesta --caudal crudo/caudal.csv --nivel crudo/nivel.csv \
+#       --precipitacion crudo/lluvia.csv --salida datos_telemetria --intervalo 15min
+
+FILAS_POR_BLOQUE = 200_000
+COMPLETITUD_MINIMA = 75.0
+AGREGACION = {"caudal": "media", "nivel": "media", "precipitacion": "suma"}
+LIMITES = {"caudal": (0.0, None), "nivel": (0.0, None), "precipitacion": (0.0, None)}
+DECIMALES = {"caudal": 6, "nivel": 6, "precipitacion": 2}
+PARCIALES = ["lecturas", "validas", "suma", "maximo", "minimo"]
+
+
+def columnas_salida(variable):
+    if AGREGACION[variable] == "suma":
+        return ["fecha", "valor", "completo_mediciones", "completo_umbral"]
+    return ["fecha", "valor", "max_abs", "min_abs", "completo_mediciones", "completo_umbral"]
+
+
+def _parciales(fechas, valores, frecuencia, limites):
+    # Acumuladores por intervalo de un bloque; las lecturas fuera de límites
+    # cuentan como recibidas pero no como válidas
+    minimo, maximo = limites
+    validos = np.isfinite(valores)
+    if minimo is not None:
+        validos &= valores >= minimo
+    if maximo is not None:
+        validos &= valores <= maximo
+
+    bloque = pd.DataFrame({
+        "intervalo": fechas.dt.floor(frecuencia),
+        "valor": np.where(validos, valores, np.nan),
+    })
+    agrupado = bloque.groupby("intervalo", sort=True)["valor"]
+    return pd.DataFrame({
+        "lecturas": agrupado.size(),
+        "validas": agrupado.count(),
+        "suma": agrupado.sum(),
+        "maximo": agrupado.max(),
+        "minimo": agrupado.min(),
+    })
+
+
+def _combinar(pendientes, nuevos):
+    if pendientes is None or pendientes.empty:
+        return nuevos
+    juntos = pd.concat([pendientes, nuevos]).groupby(level=0, sort=True)
+    return pd.DataFrame({
+        "lecturas": juntos["lecturas"].sum(),
+        "validas": juntos["validas"].sum(),
+        "suma": juntos["suma"].sum(),
+        "maximo": juntos["maximo"].max(),
+        "minimo": juntos["minimo"].min(),
+    })
+
+
+def _filas_salida(cerrados, variable, esperadas, completitud_minima, desde, frecuencia):
+    # Intervalos sin ninguna lectura también se escriben (vacíos), para que la
+    # salida sea continua como los CSV diarios originales
+    indice = pd.date_range(desde if desde is not None else cerrados.index[0], cerrados.index[-1], freq=frecuencia)
+    cerrados = cerrados.reindex(indice, fill_value=0).astype(float)
+    cerrados.loc[cerrados["validas"] == 0, ["maximo", "minimo"]] = np.nan
+
+    completo_mediciones = np.minimum(100.0, 100.0 * cerrados["lecturas"] / esperadas)
+    completo_umbral = np.minimum(100.0, 100.0 * cerrados["validas"] / esperadas)
+    if AGREGACION[variable] == "suma":
+        valor = cerrados["suma"]
+    else:
+        valor = cerrados["suma"] / cerrados["validas"].where(cerrados["validas"] > 0)
+    valor = valor.where(completo_umbral >= completitud_minima)
+
+    salida = pd.DataFrame({
+        "fecha": indice,
+        "valor": valor.to_numpy(),
+        "max_abs": cerrados["maximo"].where(completo_umbral >= completitud_minima).to_numpy(),
+        "min_abs": cerrados["minimo"].where(completo_umbral >= completitud_minima).to_numpy(),
+        "completo_mediciones": completo_mediciones.round(1).to_numpy(),
+        "completo_umbral": completo_umbral.round(1).to_numpy(),
+    })
+    return salida[columnas_salida(variable)]
+
+
+def _escribir(f, filas, variable, frecuencia):
+    formato_fecha = "%Y/%m/%d" if pd.Timedelta(frecuencia) % pd.Timedelta("1D") == pd.Timedelta(0) else "%Y/%m/%d %H:%M:%S"
+    filas = filas.copy()
+    filas["fecha"] = filas["fecha"].dt.strftime(formato_fecha)
+    decimales = DECIMALES.get(variable, 6)
+    for columna in ("valor", "max_abs", "min_abs"):
+        if columna in filas.columns:
+            filas[columna] = filas[columna].map(lambda v: "" if np.isnan(v) else f"{v:.{decimales}f}")
+    filas.to_csv(f, header=False, index=False, float_format="%.1f", lineterminator="\n")
+
+
+def _inferir_intervalo(fechas):
+    pasos = np.diff(np.unique(fechas.dropna().to_numpy(dtype="datetime64[ns]")))
+    if len(pasos) == 0:
+        raise ValueError("No se puede inferir el intervalo de muestreo: indica --intervalo")
+    return pd.Timedelta(np.median(pasos))
+
+
+def ingerir_feed(origen, destino, variable, frecuencia="1D", intervalo=None, columna_fecha="fecha",
+                 columna_valor="valor", columna_sensor=None, sensor=None, limites=None,
+                 completitud_minima=COMPLETITUD_MINIMA, filas_por_bloque=FILAS_POR_BLOQUE, formato_fecha=None):
+    # Agrega un feed crudo (CSV con fecha y valor, opcionalmente varias
+    # estaciones mezcladas en columna_sensor) en un CSV diario en destino
+    if variable not in AGREGACION:
+        raise ValueError(f"Variable desconocida: {variable!r} (usa una de {', '.join(AGREGACION)})")
+    frecuencia = pd.tseries.frequencies.to_offset(frecuencia)
+    if not isinstance(frecuencia, pd.tseries.offsets.Tick):
+        raise ValueError("La frecuencia de agregación debe ser de duración fija (p. ej. 1D, 6h, 1h)")
+    limites = limites or LIMITES[variable]
+    intervalo = pd.Timedelta(intervalo) if intervalo is not None else None
+
+    usecols = [columna_fecha, columna_valor] + ([columna_sensor] if columna_sensor else [])
+    resumen = {"variable": variable, "lecturas": 0, "sin_fecha": 0, "tardias": 0, "intervalos": 0, "esperadas": None}
+    pendientes = None
+    ultimo_escrito = None
+
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(prefix=".ingesta-", suffix=".csv", dir=os.path.dirname(os.path.abspath(destino)))
+    try:
+        with tramo("ingesta", variable=variable) as t, os.fdopen(descriptor, "w", encoding="utf-8", newline="") as f:
+            f.write(",".join(columnas_salida(variable)) + "\n")
+            for bloque in pd.read_csv(origen, usecols=usecols, chunksize=filas_por_bloque,
+                                      dtype={columna_valor: "string"}):
+                if columna_sensor:
+                    bloque = bloque[bloque[columna_sensor].astype(str) == str(sensor)]
+                fechas = pd.to_datetime(bloque[columna_fecha], errors="coerce", format=formato_fecha)
+                valores = pd.to_numeric(bloque[columna_valor], errors="coerce").to_numpy(dtype=float)
+                resumen["lecturas"] += len(bloque)
+
+                con_fecha = fechas.notna().to_numpy()
+                resumen["sin_fecha"] += int((~con_fecha).sum())
+                fechas, valores = fechas[con_fecha], valores[con_fecha]
+                if len(fechas) == 0:
+                    continue
+                if intervalo is None:
+                    intervalo = _inferir_intervalo(fechas)
+
+                parciales = _parciales(fechas.reset_index(drop=True), valores, frecuencia, limites)
+                if ultimo_escrito is not None:
+                    tardios = parciales.index <= ultimo_escrito
+                    resumen["tardias"] += int(parciales.loc[tardios, "lecturas"].sum())
+                    parciales = parciales[~tardios]
+                pendientes = _combinar(pendientes, parciales)
+                if pendientes.empty:
+                    continue
+
+                # Todo lo anterior al último intervalo del bloque ya está cerrado
+                # (el feed llega en orden; lo que no, cuenta como tardío)
+                abierto = pendientes.index[-1]
+                cerrados, pendientes = pendientes[pendientes.index < abierto], pendientes[pendientes.index >= abierto]
+                if not cerrados.empty:
+                    esperadas = pd.Timedelta(frecuencia) / intervalo
+                    desde = None if ultimo_escrito is None else ultimo_escrito + frecuencia
+                    filas = _filas_salida(cerrados, variable, esperadas, completitud_minima, desde, frecuencia)
+                    _escribir(f, filas, variable, frecuencia)
+                    resumen["intervalos"] += len(filas)
+                    ultimo_escrito = cerrados.index[-1]
+
+            if pendientes is not None and not pendientes.empty:
+                esperadas = pd.Timedelta(frecuencia) / intervalo
+                desde = None if ultimo_escrito is None else ultimo_escrito + frecuencia
+                filas = _filas_salida(pendientes, variable, esperadas, completitud_minima, desde, frecuencia)
+                _escribir(f, filas, variable, frecuencia)
+                resumen["intervalos"] += len(filas)
+            t.filas = resumen["lecturas"]
+
+        os.replace(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    resumen["esperadas"] = None if intervalo is None else float(pd.Timedelta(frecuencia) / intervalo)
+    return resumen
+
+
+def ingerir_feeds(feeds, directorio_salida, **opciones):
+    # feeds: {variable: ruta del feed crudo}; escribe caudal.csv, nivel.csv y
+    # precipitacion.csv en directorio_salida, listos para cargar_y_unir_datos()
+    return {
+        variable: ingerir_feed(origen, os.path.join(directorio_salida, FUENTES[variable]), variable, **opciones)
+        for variable, origen in feeds.items()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agrega feeds de telemetría sub-diaria en CSV diarios")
+    for variable in AGREGACION:
+        parser.add_argument(f"--{variable}", default=None, help=f"Feed crudo de {variable}")
+    parser.add_argument("--salida", required=True, help="Carpeta donde escribir los CSV agregados")
+    parser.add_argument("--frecuencia", default="1D", help="Tamaño del intervalo de agregación")
+    parser.add_argument("--intervalo", default=None, help="Intervalo de muestreo del sensor (se infiere si falta)")
+    parser.add_argument("--columna-fecha", default="fecha")
+    parser.add_argument("--columna-valor", default="valor")
+    parser.add_argument("--columna-sensor", default=None)
+    parser.add_argument("--sensor", default=None)
+    parser.add_argument("--completitud-minima", type=float, default=COMPLETITUD_MINIMA)
+    parser.add_argument("--filas-por-bloque", type=int, default=FILAS_POR_BLOQUE)
+    args = parser.parse_args()
+
+    feeds = {variable: getattr(args, variable) for variable in AGREGACION if getattr(args, variable)}
+    if not feeds:
+        parser.error("Indica al menos un feed (--caudal, --nivel o --precipitacion)")
+
+    resumenes = ingerir_feeds(
+        feeds, args.salida, frecuencia=args.frecuencia, intervalo=args.intervalo,
+        columna_fecha=args.columna_fecha, columna_valor=args.columna_valor,
+        columna_sensor=args.columna_sensor, sensor=args.sensor,
+        completitud_minima=args.completitud_minima, filas_por_bloque=args.filas_por_bloque,
+    )
+    for variable, r in resumenes.items():
+        print(f"📥 {variable}: {r['lecturas']} lecturas → {r['intervalos']} intervalos "
+              f"({r['sin_fecha']} sin fecha, {r['tardias']} tardías)")
@@ -0,0 +1,270 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage, el RSS pico queda sin medir
+    resource = None
+
+# Instrumentación por tramos de las etapas del pipeline (carga de datos, ajuste
+# de Prophet, bosque de nivel, gráficos, llamadas al LLM). Cada tramo registra
+# tiempo real, tiempo de CPU, RSS pico del proceso y filas procesadas, y se
+# exporta como líneas JSON y/o como texto de Prometheus.
+# Se activa por entorno; desactivada, un tramo cuesta una comprobación booleana:
+#   INSTRUMENTACION=1              activa el registro
+#   INSTRUMENTACION_LOG=ruta       añade cada tramo como una línea JSON (o "-" para stderr)
+#   INSTRUMENTACION_PERFIL=carpeta guarda un volcado de cProfile por tramo (.prof)
+#   INSTRUMENTACION_PUERTO=9101    sirve /metricas en texto de Prometheus
+
+
+class _Configuracion:
+    def __init__(self):
+        self.activa = os.getenv("INSTRUMENTACION", "") not in ("", "0")
+        self.log = os.getenv("INSTRUMENTACION_LOG") or None
+        self.perfil = os.getenv("INSTRUMENTACION_PERFIL") or None
+
+
+_config = _Configuracion()
+_candado = threading.Lock()
+_agregados = {}   # etapa -> {"llamadas", "segundos", "cpu_segundos", "filas", "errores"}
+_capturas = threading.local()
+_perfilando = threading.Lock()
+
+
+def activar(log=None, perfil=None):
+    _config.activa = True
+    _config.log = log or _config.log
+    _config.perfil = perfil or _config.perfil
+
+
+def desactivar():
+    _config.activa = False
+
+
+def activa():
+    return _config.activa
+
+
+def rss_pico_bytes():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB y macOS en bytes
+    return pico if sys.platform == "darwin" else pico * 1024
+
+
+class Tramo:
+    __slots__ = ("nombre", "filas", "atributos")
+
+    def __init__(self, nombre, filas=None, **atributos):
+        self.nombre = nombre
+        self.filas = filas
+        self.atributos = atributos
+
+
+class _TramoNulo:
+    # Lo que se entrega con la instrumentación apagada: asignar filas no hace nada
+    __slots__ = ()
+    filas = None
+    atributos = {}
+
+    def __setattr__(self, nombre, valor):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+_TRAMO_NULO = _TramoNulo()
+
+
+def _acumular(registro):
+    with _candado:
+        agregado = _agregados.setdefault(registro["etapa"], {
+            "llamadas": 0, "segundos": 0.0, "cpu_segundos": 0.0, "filas": 0, "errores": 0,
+        })
+        agregado["llamadas"] += 1
+        agregado["segundos"] += registro["segundos"]
+        agregado["cpu_segundos"] += registro["cpu_segundos"]
+        agregado["filas"] += registro["filas"] or 0
+        agregado["errores"] += int(registro["error"] is not None)
+
+
+def _registrar(registro):
+    _acumular(registro)
+
+    for captura in getattr(_capturas, "pilas", ()):
+        captura.append(registro)
+
+    if _config.log:
+        linea = json.dumps(registro, ensure_ascii=False, default=str)
+        if _config.log == "-":
+            print(linea, file=sys.stderr)
+        else:
+            with _candado, open(_config.log, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+
+
+def tramo(nombre, filas=None, **atributos):
+    # Apagada: un único objeto nulo, sin generador ni lecturas de reloj
+    if not _config.activa:
+        return _TRAMO_NULO
+    return _tramo_activo(nombre, filas, atributos)
+
+
+@contextmanager
+def _tramo_activo(nombre, filas, atributos):
+    actual = Tramo(nombre, filas, **atributos)
+    perfil = None
+    # Un solo perfilador a la vez: los tramos anidados quedan dentro del exterior
+    if _config.perfil and _perfilando.acquire(blocking=False):
+        perfil = cProfile.Profile()
+        perfil.enable()
+
+    inicio_real, inicio_cpu = time.perf_counter(), time.process_time()
+    error = None
+    try:
+        yield actual
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        segundos, cpu = time.perf_counter() - inicio_real, time.process_time() - inicio_cpu
+        if perfil is not None:
+            perfil.disable()
+            os.makedirs(_config.perfil, exist_ok=True)
+            perfil.dump_stats(os.path.join(
+                _config.perfil, f"{nombre}-{os.getpid()}-{datetime.now():%Y%m%dT%H%M%S%f}.prof"))
+            _perfilando.release()
+
+        _registrar({
+            "etapa": nombre,
+            "momento": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "segundos": round(segundos, 6),
+            "cpu_segundos": round(cpu, 6),
+            "rss_pico_mb": None if resource is None else round(rss_pico_bytes() / 2**20, 1),
+            "filas": actual.filas,
+            "pid": os.getpid(),
+            "error": error,
+            **actual.atributos,
+        })
+
+
+def medir(nombre=None, filas=None, filas_entrada=False):
+    # Decorador; filas(resultado) -> número de filas procesadas, o con
+    # filas_entrada=True las del primer argumento (el df de entrenamiento)
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not _config.activa:
+                return funcion(*args, **kwargs)
+            with tramo(etiqueta) as t:
+                if filas_entrada and args:
+                    t.filas = len(args[0])
+                resultado = funcion(*args, **kwargs)
+                if filas is not None:
+                    t.filas = int(filas(resultado))
+                return resultado
+
+        return envoltura
+
+    return decorador
+
+
+@contextmanager
+def capturar():
+    # Recoge los registros de los tramos cerrados dentro del bloque (p. ej. en un
+    # proceso hijo del pool, para devolverlos al proceso principal)
+    registros = []
+    pilas = getattr(_capturas, "pilas", None)
+    if pilas is None:
+        pilas = _capturas.pilas = []
+    pilas.append(registros)
+    try:
+        yield registros
+    finally:
+        pilas.remove(registros)
+
+
+def fusionar(registros):
+    # Suma al agregado local los tramos medidos en otro proceso (sin volver a escribir el log)
+    for registro in registros:
+        _acumular(registro)
+
+
+def resumen():
+    with _candado:
+        return {etapa: dict(valores) for etapa, valores in _agregados.items()}
+
+
+def reiniciar():
+    with _candado:
+        _agregados.clear()
+
+
+def metricas_prometheus(prefijo="prediccion"):
+    metricas = [
+        ("llamadas", "counter", "Tramos ejecutados por etapa"),
+        ("segundos", "counter", "Tiempo real acumulado por etapa"),
+        ("cpu_segundos", "counter", "Tiempo de CPU acumulado por etapa"),
+        ("filas", "counter", "Filas procesadas por etapa"),
+        ("errores", "counter", "Tramos terminados con excepción"),
+    ]
+    agregados = resumen()
+    lineas = []
+    for clave, tipo, ayuda in metricas:
+        nombre = f"{prefijo}_etapa_{clave}_total"
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        lineas += [f'{nombre}{{etapa="{etapa}"}} {valores[clave]}' for etapa, valores in sorted(agregados.items())]
+
+    pico = rss_pico_bytes()
+    if pico is not None:
+        nombre = f"{prefijo}_rss_pico_bytes"
+        lineas += [f"# HELP {nombre} Memoria residente pico del proceso", f"# TYPE {nombre} gauge", f"{nombre} {pico}"]
+    return "\n".join(lineas) + "\n"
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metricas":
+            self.send_error(404)
+            return
+        cuerpo = metricas_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+_servidor = None
+
+
+def iniciar_servidor_metricas(puerto=None, host="0.0.0.0"):
+    # Una vez por proceso (Streamlit vuelve a ejecutar el script en cada interacción)
+    global _servidor
+    puerto = puerto or os.getenv("INSTRUMENTACION_PUERTO")
+    if not _config.activa or not puerto or _servidor is not None:
+        return _servidor
+    with _candado:
+        if _servidor is None:
+            _servidor = ThreadingHTTPServer((host, int(puerto)), _ManejadorMetricas)
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+    return _servidor
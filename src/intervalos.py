@@ -0,0 +1,85 @@
+from statistics import NormalDist
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+
+# Motor de intervalos para bosques aleatorios: recorre los árboles una sola vez
+# por bloque de filas, en paralelo por bloques, sin materializar la matriz
+# completa (n_árboles × horizonte).
+#   - "normal":    media ± z·σ, con media y varianza acumuladas árbol a árbol
+#   - "cuantiles": cuantiles empíricos de las predicciones de los árboles;
+#                  aquí sí se guarda (n_árboles × bloque), acotado por el bloque
+# Acepta tanto el RandomForestRegressor de sklearn como el BosqueCompacto de
+# src.bosque_compacto (que recorre todos los árboles a la vez por bloque).
+
+METODOS_INTERVALO = ("normal", "cuantiles")
+
+
+def predicciones_por_arbol(modelo, X):
+    # Predicción de cada árbol sobre X, en el orden de estimators_
+    if hasattr(modelo, "predicciones_arboles"):
+        return modelo.predicciones_arboles(X)
+    return (arbol.predict(X, check_input=False) for arbol in modelo.estimators_)
+
+
+def contar_arboles(modelo):
+    return modelo.n_arboles if hasattr(modelo, "n_arboles") else len(modelo.estimators_)
+
+
+def _bloque_normal(modelo, X):
+    suma = np.zeros(X.shape[0])
+    media = np.zeros(X.shape[0])
+    m2 = np.zeros(X.shape[0])
+
+    # Welford para la varianza; la media se acumula como suma, en el mismo orden
+    # que RandomForestRegressor.predict, para que la predicción central coincida
+    for n, prediccion in enumerate(predicciones_por_arbol(modelo, X), start=1):
+        suma += prediccion
+        delta = prediccion - media
+        media += delta / n
+        m2 += delta * (prediccion - media)
+
+    return suma / n, np.sqrt(m2 / n)
+
+
+def _bloque_cuantiles(modelo, X, cuantiles):
+    predicciones = np.empty((contar_arboles(modelo), X.shape[0]))
+    suma = np.zeros(X.shape[0])
+    for i, prediccion in enumerate(predicciones_por_arbol(modelo, X)):
+        predicciones[i] = prediccion
+        suma += prediccion
+    return suma / len(predicciones), np.quantile(predicciones, cuantiles, axis=0)
+
+
+def intervalos_bosque(modelo, X, metodo="normal", nivel=0.95, n_jobs=-1, filas_por_bloque=2048):
+    if metodo not in METODOS_INTERVALO:
+        raise ValueError(f"Método de intervalo desconocido: {metodo!r} (usa uno de {METODOS_INTERVALO})")
+
+    # Los árboles de sklearn trabajan en float32 contiguo; convertir una sola vez
+    # evita que cada árbol valide y copie X por su cuenta
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n_filas = X.shape[0]
+    if n_filas == 0:
+        vacio = np.empty(0)
+        return vacio, vacio, vacio
+
+    # Al menos un bloque por núcleo, pero nunca bloques mayores que filas_por_bloque
+    n_trabajos = effective_n_jobs(n_jobs)
+    tamano = max(1, min(filas_por_bloque, -(-n_filas // n_trabajos)))
+    bloques = [slice(i, min(i + tamano, n_filas)) for i in range(0, n_filas, tamano)]
+
+    # Hilos: tree.predict libera el GIL, así no se copia el bosque a otros procesos
+    paralelo = Parallel(n_jobs=n_jobs, prefer="threads")
+
+    if metodo == "normal":
+        resultados = paralelo(delayed(_bloque_normal)(modelo, X[b]) for b in bloques)
+        media = np.concatenate([r[0] for r in resultados])
+        desviacion = np.concatenate([r[1] for r in resultados])
+        z = NormalDist().inv_cdf(0.5 + nivel / 2)
+        return media, media - z * desviacion, media + z * desviacion
+
+    cuantiles = [(1 - nivel) / 2, (1 + nivel) / 2]
+    resultados = paralelo(delayed(_bloque_cuantiles)(modelo, X[b], cuantiles) for b in bloques)
+    media = np.concatenate([r[0] for r in resultados])
+    limites = np.concatenate([r[1] for r in resultados], axis=1)
+    return media, limites[0], limites[1]
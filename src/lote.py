@@ -0,0 +1,86 @@
+import argparse
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from src.almacen_modelos import obtener_pronostico, DIRECTORIO_MODELOS
+from src.estaciones import cargar_estaciones, ARCHIVO_ESTACIONES
+from src.esquema import compactar
+
+# Predicción por lotes para varias estaciones: cada estación recorre
+# carga → caudal → nivel en su propio proceso del pool. Un fallo en una
+# estación queda registrado y no detiene a las demás; al final se entrega
+# un único DataFrame consolidado con la columna "estacion".
+
+
+def procesar_estacion(estacion, directorio_modelos=DIRECTORIO_MODELOS):
+    inicio = time.perf_counter()
+    # Pasa por el almacén de modelos: una estación cuyos datos no cambiaron no se reentrena
+    forecast, _, _ = obtener_pronostico(directorio_modelos, directorio_datos=estacion.directorio)
+    forecast = compactar(forecast, ["ds", "yhat", "nivel_estimado", "nivel_estimado_lower", "nivel_estimado_upper"])
+    forecast.insert(0, "estacion", estacion.codigo)
+    return forecast, time.perf_counter() - inicio
+
+
+def ejecutar_lote(estaciones, max_procesos=None, directorio_modelos=DIRECTORIO_MODELOS, informar=print):
+    estaciones = [e for e in estaciones if e.tiene_datos]
+    forecasts = []
+    fallos = {}
+    tiempos = {}
+    inicio = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+        futuros = {
+            pool.submit(procesar_estacion, estacion, directorio_modelos): estacion.codigo
+            for estacion in estaciones
+        }
+        for futuro in as_completed(futuros):
+            codigo = futuros[futuro]
+            try:
+                forecast, segundos = futuro.result()
+            except Exception:
+                # Aislar el fallo: se guarda la traza y el lote sigue con las demás
+                fallos[codigo] = traceback.format_exc()
+                informar(f"❌ {codigo}: falló")
+                continue
+            forecasts.append(forecast)
+            tiempos[codigo] = segundos
+            informar(f"✅ {codigo}: {segundos:.1f} s")
+
+    total = time.perf_counter() - inicio
+    resumen = {
+        "estaciones": len(estaciones),
+        "correctas": len(forecasts),
+        "fallidas": len(fallos),
+        "segundos": total,
+        "estaciones_por_hora": len(forecasts) * 3600 / total if total > 0 else 0.0,
+        "tiempos": tiempos,
+    }
+    consolidado = pd.concat(forecasts, ignore_index=True) if forecasts else pd.DataFrame()
+    return consolidado, fallos, resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predicción de nivel por lotes para varias estaciones")
+    parser.add_argument("--estaciones", nargs="*", help="Códigos a procesar (por defecto, todas las que tienen datos)")
+    parser.add_argument("--registro", default=ARCHIVO_ESTACIONES)
+    parser.add_argument("--procesos", type=int, default=None, help="Número de procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--salida", default="prediccion_lote.csv")
+    args = parser.parse_args()
+
+    registro = cargar_estaciones(args.registro)
+    desconocidas = [c for c in args.estaciones or [] if c not in registro]
+    if desconocidas:
+        parser.error(f"estaciones desconocidas: {', '.join(desconocidas)}")
+    seleccion = [registro[c] for c in args.estaciones] if args.estaciones else list(registro.values())
+
+    consolidado, fallos, resumen = ejecutar_lote(seleccion, max_procesos=args.procesos)
+    if not consolidado.empty:
+        consolidado.to_csv(args.salida, index=False)
+
+    print(f"📦 {resumen['correctas']}/{resumen['estaciones']} estaciones en {resumen['segundos']:.1f} s "
+          f"({resumen['estaciones_por_hora']:.0f} estaciones/hora) → {args.salida}")
+    for codigo, traza in fallos.items():
+        print(f"\n--- {codigo} ---\n{traza}")
@@ -0,0 +1,223 @@
+import os
+
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+# Motores de pronóstico intercambiables detrás de entrenar_modelo_caudal y
+# predecir_precipitacion. Ambos exponen el mismo subconjunto de la API de Prophet
+# (add_regressor, fit, make_future_dataframe, predict, history), así que el resto
+# del código no necesita saber cuál está usando.
+#   - "prophet": Prophet/cmdstan, el motor original
+#   - "numpy":   tendencia lineal por tramos + Fourier anual/semanal + regresores,
+#                ajustados por regresión ridge con NumPy; entrena en milisegundos
+# Se elige con el parámetro motor= o con la variable de entorno MOTOR_PRONOSTICO.
+
+MOTOR_PREDETERMINADO = "prophet"
+
+# Incertidumbre de yhat al predecir, elegida con incertidumbre= o con la variable
+# de entorno INCERTIDUMBRE_PRONOSTICO:
+#   - "ninguna":   solo yhat
+#   - "analitica": yhat ± z·σ sin muestrear; σ² suma el ruido de observación y la
+#                  varianza de los cambios de pendiente futuros que simula Prophet
+#                  (proceso de Poisson de tasa S con saltos Laplace(λ)):
+#                  2·λ²·S·(t − 1)³ / 3 más allá de la historia
+#   - "muestras":  las muestras de Prophet, pero MUESTRAS_INCERTIDUMBRE en vez de 1000
+# El motor numpy ya calcula su intervalo en forma cerrada, así que "muestras" y
+# "analitica" son lo mismo para él.
+MODOS_INCERTIDUMBRE = ("ninguna", "analitica", "muestras")
+INCERTIDUMBRE_PREDETERMINADA = "analitica"
+MUESTRAS_INCERTIDUMBRE = 200
+COLUMNAS_PRONOSTICO = ["ds", "yhat", "yhat_lower", "yhat_upper"]
+
+
+def motor_configurado(motor=None):
+    motor = motor or os.getenv("MOTOR_PRONOSTICO", MOTOR_PREDETERMINADO)
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de pronóstico desconocido: {motor!r} (usa uno de {', '.join(MOTORES)})")
+    return motor
+
+
+def crear_modelo(motor=None, **parametros):
+    return MOTORES[motor_configurado(motor)](**parametros)
+
+
+def parametros_admitidos(motor=None):
+    # Parámetros de Prophet que el motor usa de verdad (None: todos); el resto se ignora
+    return PARAMETROS_ADMITIDOS[motor_configurado(motor)]
+
+
+def incertidumbre_configurada(incertidumbre=None):
+    incertidumbre = incertidumbre or os.getenv("INCERTIDUMBRE_PRONOSTICO", INCERTIDUMBRE_PREDETERMINADA)
+    if incertidumbre not in MODOS_INCERTIDUMBRE:
+        raise ValueError(f"Modo de incertidumbre desconocido: {incertidumbre!r} "
+                         f"(usa uno de {', '.join(MODOS_INCERTIDUMBRE)})")
+    return incertidumbre
+
+
+def _desviacion_prophet(modelo, forecast):
+    # Desviación de yhat en la escala original, la misma que muestrea predict_uncertainty
+    ruido = float(np.mean(modelo.params["sigma_obs"]))
+    varianza = np.full(len(forecast), ruido ** 2)
+    if modelo.growth == "linear" and len(modelo.changepoints_t):
+        t = ((forecast["ds"] - modelo.start) / modelo.t_scale).to_numpy(dtype=float)
+        lambda_ = float(np.mean(np.abs(modelo.params["delta"]))) + 1e-8
+        futuro = np.maximum(t - 1, 0.0)
+        escala = 1 + forecast["multiplicative_terms"].to_numpy(dtype=float)
+        varianza += (escala ** 2) * 2 * lambda_ ** 2 * len(modelo.changepoints_t) * futuro ** 3 / 3
+    return np.sqrt(varianza) * modelo.y_scale
+
+
+def predecir(modelo, future, incertidumbre=None, muestras=MUESTRAS_INCERTIDUMBRE):
+    # predict() con la incertidumbre pedida; devuelve solo ds/yhat (y los límites si los hay)
+    incertidumbre = incertidumbre_configurada(incertidumbre)
+    if hasattr(modelo, "uncertainty_samples"):
+        # Prophet: sin muestras salvo en modo "muestras" (el modelo se guarda tal cual)
+        previas = modelo.uncertainty_samples
+        modelo.uncertainty_samples = muestras if incertidumbre == "muestras" else 0
+        try:
+            forecast = modelo.predict(future)
+        finally:
+            modelo.uncertainty_samples = previas
+        if incertidumbre == "analitica":
+            z = NormalDist().inv_cdf(0.5 + modelo.interval_width / 2)
+            desviacion = _desviacion_prophet(modelo, forecast)
+            forecast["yhat_lower"] = forecast["yhat"] - z * desviacion
+            forecast["yhat_upper"] = forecast["yhat"] + z * desviacion
+    else:
+        forecast = modelo.predict(future)
+
+    columnas = COLUMNAS_PRONOSTICO if incertidumbre != "ninguna" else ["ds", "yhat"]
+    return forecast[columnas].reset_index(drop=True)
+
+
+def _crear_prophet(**parametros):
+    # Importación diferida: cmdstan solo se carga si de verdad se usa Prophet
+    from prophet import Prophet
+    return Prophet(**parametros)
+
+
+def _fourier(dias, periodo, orden):
+    t = 2 * np.pi * dias[:, None] / periodo * np.arange(1, orden + 1)[None, :]
+    return np.concatenate([np.sin(t), np.cos(t)], axis=1)
+
+
+def _orden(valor, predeterminado):
+    # Misma convención que Prophet: True/"auto" → orden por defecto, False → sin estacionalidad
+    if valor is False or valor == 0:
+        return 0
+    if valor is True or valor == "auto":
+        return predeterminado
+    return int(valor)
+
+
+class ModeloEstacionalNumpy:
+    def __init__(self, yearly_seasonality="auto", weekly_seasonality="auto", daily_seasonality=False,
+                 changepoint_prior_scale=0.05, seasonality_prior_scale=10.0, n_changepoints=25,
+                 changepoint_range=0.8, interval_width=0.80, **otros):
+        # Los parámetros de Prophet sin equivalente aquí (otros) se ignoran
+        self.orden_anual = _orden(yearly_seasonality, 10)
+        self.orden_semanal = _orden(weekly_seasonality, 3)
+        self.changepoint_prior_scale = changepoint_prior_scale
+        self.seasonality_prior_scale = seasonality_prior_scale
+        self.n_changepoints = n_changepoints
+        self.changepoint_range = changepoint_range
+        self.interval_width = interval_width
+        self.regresores = []
+        self.history = None
+
+    def add_regressor(self, nombre, **_):
+        self.regresores.append(nombre)
+        return self
+
+    def _matriz(self, df):
+        ds = pd.to_datetime(df["ds"]).to_numpy()
+        dias = (ds - np.datetime64("1970-01-01")) / np.timedelta64(1, "D")
+        t = (ds - self.inicio) / self.escala_t
+
+        bloques = [np.ones((len(t), 1)), t[:, None]]
+        if len(self.cambios):
+            bloques.append(np.maximum(t[:, None] - self.cambios[None, :], 0.0))
+        if self.orden_anual:
+            bloques.append(_fourier(dias, 365.25, self.orden_anual))
+        if self.orden_semanal:
+            bloques.append(_fourier(dias, 7.0, self.orden_semanal))
+        if self.regresores:
+            bloques.append((df[self.regresores].to_numpy(dtype=float) - self.media_reg) / self.desv_reg)
+        return np.concatenate(bloques, axis=1)
+
+    def _resolver(self, X, y, penalizacion):
+        # Ridge con penalización distinta por bloque de columnas
+        A = X.T @ X + np.diag(penalizacion)
+        return np.linalg.solve(A, X.T @ y)
+
+    def fit(self, df, **_):
+        df = df.dropna(subset=["y"]).sort_values("ds").reset_index(drop=True)
+        self.history = df
+        ds = df["ds"].to_numpy()
+        self.inicio = ds[0]
+        self.escala_t = max(ds[-1] - ds[0], np.timedelta64(1, "D"))
+
+        # Misma escala que Prophet: y dividido por su máximo absoluto
+        self.y_scale = float(np.abs(df["y"]).max()) or 1.0
+        y = df["y"].to_numpy(dtype=float) / self.y_scale
+
+        # Puntos de cambio equiespaciados en la primera parte de la historia
+        t = (ds - self.inicio) / self.escala_t
+        n = min(self.n_changepoints, max(0, int(len(t) * self.changepoint_range) - 1))
+        self.cambios = np.quantile(t[: int(len(t) * self.changepoint_range)], np.linspace(0, 1, n + 2)[1:-1]) if n else np.empty(0)
+
+        if self.regresores:
+            self.media_reg = df[self.regresores].mean().to_numpy()
+            self.desv_reg = df[self.regresores].std().replace(0, 1).fillna(1).to_numpy()
+
+        X = self._matriz(df)
+        columnas_base = 2
+        columnas_cambio = len(self.cambios)
+        columnas_resto = X.shape[1] - columnas_base - columnas_cambio
+
+        # Primera pasada casi sin penalizar para estimar el ruido; la segunda
+        # aplica los priors de Prophet como penalizaciones ridge (σ²/escala²)
+        beta = self._resolver(X, y, np.full(X.shape[1], 1e-6))
+        sigma2 = max(np.mean((y - X @ beta) ** 2), 1e-12)
+        penalizacion = np.concatenate([
+            np.zeros(columnas_base),
+            np.full(columnas_cambio, sigma2 / self.changepoint_prior_scale ** 2),
+            np.full(columnas_resto, sigma2 / self.seasonality_prior_scale ** 2),
+        ])
+        self.coeficientes = self._resolver(X, y, penalizacion)
+        self.sigma = float(np.std(y - X @ self.coeficientes)) * self.y_scale
+        return self
+
+    def make_future_dataframe(self, periods, freq="D", include_history=True):
+        ultima = self.history["ds"].max()
+        futuras = pd.date_range(start=ultima, periods=periods + 1, freq=freq)[1:]
+        if include_history:
+            futuras = np.concatenate([self.history["ds"].to_numpy(), futuras.to_numpy()])
+        return pd.DataFrame({"ds": pd.to_datetime(futuras)})
+
+    def predict(self, df):
+        X = self._matriz(df)
+        yhat = (X @ self.coeficientes) * self.y_scale
+        tendencia = (X[:, : 2 + len(self.cambios)] @ self.coeficientes[: 2 + len(self.cambios)]) * self.y_scale
+        z = NormalDist().inv_cdf(0.5 + self.interval_width / 2)
+        return pd.DataFrame({
+            "ds": pd.to_datetime(df["ds"]).to_numpy(),
+            "trend": tendencia,
+            "yhat_lower": yhat - z * self.sigma,
+            "yhat_upper": yhat + z * self.sigma,
+            "yhat": yhat,
+        })
+
+
+MOTORES = {
+    "prophet": _crear_prophet,
+    "numpy": ModeloEstacionalNumpy,
+}
+PARAMETROS_ADMITIDOS = {
+    "prophet": None,
+    "numpy": frozenset({
+        "yearly_seasonality", "weekly_seasonality", "changepoint_prior_scale", "seasonality_prior_scale",
+        "n_changepoints", "changepoint_range", "interval_width",
+    }),
+}
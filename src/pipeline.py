@@ -0,0 +1,77 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+from src import instrumentacion
+
+# Ejecutor por etapas: cada etapa declara de qué etapas depende y recibe sus
+# resultados como argumentos posicionales, en ese orden. Las etapas
+# independientes se lanzan a la vez en un pool de procesos; las marcadas como
+# locales (uniones baratas) corren en el proceso principal en cuanto están listas.
+
+
+@dataclass
+class Etapa:
+    nombre: str
+    funcion: Callable
+    dependencias: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    local: bool = False
+
+
+def _cronometrar(funcion, args, kwargs):
+    # Los tramos medidos dentro de la etapa (quizá en otro proceso) vuelven con el resultado
+    with instrumentacion.capturar() as registros:
+        inicio = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        segundos = time.perf_counter() - inicio
+    return resultado, segundos, registros
+
+
+def ejecutar_etapas(etapas, max_procesos=None, informar=print):
+    pendientes = {etapa.nombre: etapa for etapa in etapas}
+    for etapa in etapas:
+        faltantes = [d for d in etapa.dependencias if d not in pendientes]
+        if faltantes:
+            raise ValueError(f"La etapa {etapa.nombre!r} depende de etapas inexistentes: {faltantes}")
+
+    resultados = {}
+    tiempos = {}
+    en_curso = {}
+    inicio_total = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+        while pendientes or en_curso:
+            listas = [
+                etapa for etapa in pendientes.values()
+                if all(d in resultados for d in etapa.dependencias)
+            ]
+            for etapa in listas:
+                del pendientes[etapa.nombre]
+                args = [resultados[d] for d in etapa.dependencias]
+                if etapa.local:
+                    resultados[etapa.nombre], tiempos[etapa.nombre], _ = _cronometrar(etapa.funcion, args, etapa.kwargs)
+                    informar(f"⏱️ {etapa.nombre}: {tiempos[etapa.nombre]:.2f} s")
+                else:
+                    futuro = pool.submit(_cronometrar, etapa.funcion, args, etapa.kwargs)
+                    en_curso[futuro] = etapa.nombre
+
+            if any(etapa.local for etapa in listas):
+                # Una etapa local puede haber desbloqueado otras: volver a revisar
+                continue
+            if not en_curso:
+                if pendientes:
+                    raise ValueError(f"Dependencias circulares entre etapas: {sorted(pendientes)}")
+                break
+
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre = en_curso.pop(futuro)
+                resultados[nombre], tiempos[nombre], registros = futuro.result()
+                instrumentacion.fusionar(registros)
+                informar(f"⏱️ {nombre}: {tiempos[nombre]:.2f} s")
+
+    tiempos["total"] = time.perf_counter() - inicio_total
+    informar(f"⏱️ total: {tiempos['total']:.2f} s")
+    return resultados, tiempos
@@ -1,65 +1,51 @@
-from sklearn.ensemble import RandomForestRegressor
-import pandas as pd
-import numpy as np
-
-def predecir_nivel(forecast, df_original):
-    df = df_original.copy()
-    
-    # Extraer variables estacionales
-    df["mes"] = df["fecha"].dt.month
-    df["semana"] = df["fecha"].dt.isocalendar().week
-    df["año"] = df["fecha"].dt.year
-    df["dias_desde_inicio"] = (df["fecha"] - df["fecha"].min()).dt.days
-
-    # Lags (valores anteriores)
-    df["caudal_lag1"] = df["caudal"].shift(1)
-    df["precipitacion"] = df.get("precipitacion", 0)
-    df["precipitacion_lag1"] = df["precipitacion"].shift(1)
-
-    # Interacciones
-    df["caudal_x_mes"] = df["caudal"] * df["mes"]
-    df["precipitacion_x_semana"] = df["precipitacion"] * df["semana"]
-
-    # Eliminar filas nulas por lags
-    df = df.dropna()
-
-    # Entrenamiento
-    features = ["caudal", "precipitacion", "mes", "semana", "año", "dias_desde_inicio",
-                "caudal_lag1", "precipitacion_lag1", "caudal_x_mes", "precipitacion_x_semana"]
-    X = df[features]
-    y = df["nivel"]
-
-    modelo = RandomForestRegressor(n_estimators=100, random_state=42)
+from src.intervalos import intervalos_bosque
+from src.caracteristicas import matriz_entrenamiento, matriz_forecast
+from src.instrumentacion import medir
+from src.esquema import asignar
+
+# Hiperparámetros del bosque de nivel (también forman parte de la clave del almacén de modelos)
+PARAMETROS_NIVEL = {
+    "n_estimators": 100,
+    "random_state": 42,
+}
+
+
+@medir("nivel_ajuste", filas_entrada=True)
+def ajustar_modelo_nivel(df_original):
+    # Matriz float32 compartida (y en caché) con el resto de usos del mismo df
+    X, y, fecha_inicio = matriz_entrenamiento(df_original)
+
+    # Entrenamiento (sklearn se importa aquí: quien solo lee pronósticos no lo carga)
+    from sklearn.ensemble import RandomForestRegressor
+    modelo = RandomForestRegressor(**PARAMETROS_NIVEL)
     modelo.fit(X, y)
 
-    # Forecast
-    forecast_temp = forecast.copy()
-    forecast_temp = forecast_temp.rename(columns={"yhat": "caudal"})
+    # Fecha de referencia para "dias_desde_inicio" en el forecast
+    return modelo, fecha_inicio
 
-    forecast_temp["mes"] = forecast_temp["ds"].dt.month
-    forecast_temp["semana"] = forecast_temp["ds"].dt.isocalendar().week
-    forecast_temp["año"] = forecast_temp["ds"].dt.year
-    forecast_temp["dias_desde_inicio"] = (forecast_temp["ds"] - df["fecha"].min()).dt.days
 
-    forecast_temp["caudal_lag1"] = forecast_temp["caudal"].shift(1)
-    forecast_temp["precipitacion"] = 0
-    forecast_temp["precipitacion_lag1"] = 0
+@medir("nivel_prediccion", filas=len)
+def aplicar_modelo_nivel(modelo, forecast, fecha_inicio, metodo_intervalo="normal", nivel_confianza=0.95):
+    # Forecast: caudal de Prophet y precipitación 0 en todo el horizonte
+    X = matriz_forecast(forecast["ds"], forecast["yhat"], fecha_inicio)
 
-    forecast_temp["caudal_x_mes"] = forecast_temp["caudal"] * forecast_temp["mes"]
-    forecast_temp["precipitacion_x_semana"] = forecast_temp["precipitacion"] * forecast_temp["semana"]
+    # Predicción central e intervalos de confianza (basados en árboles individuales)
+    # en una sola pasada por bloques: ±z·σ (95% normal) o cuantiles empíricos
+    predicciones, inferior, superior = intervalos_bosque(
+        modelo, X, metodo=metodo_intervalo, nivel=nivel_confianza,
+    )
+    # Columnas nuevas en float32 sobre el mismo forecast (sin copiarlo)
+    asignar(forecast, "nivel_estimado", predicciones)
+    asignar(forecast, "nivel_estimado_lower", inferior)
+    asignar(forecast, "nivel_estimado_upper", superior)
 
-    forecast_temp = forecast_temp.fillna(0)
+    return forecast
 
-    # Predicción central
-    predicciones = modelo.predict(forecast_temp[features])
-    forecast["nivel_estimado"] = predicciones
 
-    # Calcular intervalos de confianza (basado en árboles individuales)
-    todas_predicciones = np.stack([tree.predict(forecast_temp[features]) for tree in modelo.estimators_], axis=0)
-    desviacion = todas_predicciones.std(axis=0)
-    
-    # Intervalo ±1.96 * std (95% confianza normal)
-    forecast["nivel_estimado_lower"] = forecast["nivel_estimado"] - 1.96 * desviacion
-    forecast["nivel_estimado_upper"] = forecast["nivel_estimado"] + 1.96 * desviacion
+def predecir_nivel(forecast, df_original, devolver_modelo=False, metodo_intervalo="normal", nivel_confianza=0.95):
+    modelo, fecha_inicio = ajustar_modelo_nivel(df_original)
+    forecast = aplicar_modelo_nivel(modelo, forecast, fecha_inicio, metodo_intervalo, nivel_confianza)
 
+    if devolver_modelo:
+        return forecast, modelo
     return forecast
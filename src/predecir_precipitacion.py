@@ -1,18 +1,21 @@
-from prophet import Prophet
 import pandas as pd
+from src.motores import crear_modelo, predecir
+from src.instrumentacion import medir
+from src.esquema import compactar
 
-def predecir_precipitacion(df, dias=30):
+@medir("precipitacion", filas=len)
+def predecir_precipitacion(df, dias=30, motor=None):
     df_prep = df[["fecha", "precipitacion"]].copy()
     df_prep.columns = ["ds", "y"]
 
-    modelo = Prophet()
+    modelo = crear_modelo(motor)
     modelo.fit(df_prep)
 
-    future = modelo.make_future_dataframe(periods=dias)
-    forecast = modelo.predict(future)
+    # Solo las fechas futuras y sin intervalos: de aquí solo se usa yhat
+    future = modelo.make_future_dataframe(periods=dias, include_history=False)
+    forecast = predecir(modelo, future, incertidumbre="ninguna")
 
     # Solo devolver fecha y valor estimado
-    forecast = forecast[["ds", "yhat"]]
     forecast = forecast.rename(columns={"yhat": "precipitacion_estimada"})
 
-    return forecast
+    return compactar(forecast)
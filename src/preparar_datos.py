@@ -1,22 +1,44 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
 import pandas as pd
 
-def cargar_y_unir_datos():
-    # Cargar archivos
-    df_caudal = pd.read_csv("datos/caudal.csv")
-    df_nivel = pd.read_csv("datos/nivel.csv")
-    df_precipitacion = pd.read_csv("datos/precipitacion.csv")
+from src.instrumentacion import medir
+
+DIRECTORIO_DATOS = "datos"
+DIRECTORIO_CACHE = "cache"
+FUENTES = {
+    "caudal": "caudal.csv",
+    "nivel": "nivel.csv",
+    "precipitacion": "precipitacion.csv",
+}
+VERSION_CACHE = 3
+
+
+def _leer_fuente(origen, variable):
+    # Cargar archivo
+    df = pd.read_csv(origen)
 
     # Limpiar nombres de columnas
-    for df in [df_caudal, df_nivel, df_precipitacion]:
-        df.columns = df.columns.str.strip().str.lower()
-        df["fecha"] = pd.to_datetime(df["fecha"], errors='coerce')
-        df.drop_duplicates(subset="fecha", inplace=True)
-        df.sort_values("fecha", inplace=True)
+    df.columns = df.columns.str.strip().str.lower()
+    df["fecha"] = pd.to_datetime(df["fecha"], errors='coerce')
+    # Con fechas repetidas gana la última fila: las correcciones se agregan al final del CSV
+    df.drop_duplicates(subset="fecha", keep="last", inplace=True)
+    df.sort_values("fecha", inplace=True)
 
     # Renombrar columnas
-    df_caudal = df_caudal[["fecha", "valor"]].rename(columns={"valor": "caudal"})
-    df_nivel = df_nivel[["fecha", "valor"]].rename(columns={"valor": "nivel"})
-    df_precipitacion = df_precipitacion[["fecha", "valor"]].rename(columns={"valor": "precipitacion"})
+    return df[["fecha", "valor"]].rename(columns={"valor": variable})
+
+
+def _unir_fuentes(directorio=DIRECTORIO_DATOS):
+    df_caudal = _leer_fuente(os.path.join(directorio, FUENTES["caudal"]), "caudal")
+    df_nivel = _leer_fuente(os.path.join(directorio, FUENTES["nivel"]), "nivel")
+    df_precipitacion = _leer_fuente(os.path.join(directorio, FUENTES["precipitacion"]), "precipitacion")
 
     # Merge completo con outer join
     df = pd.merge(df_caudal, df_nivel, on="fecha", how="outer")
@@ -24,7 +46,11 @@ def cargar_y_unir_datos():
 
     # Ordenar por fecha
     df = df.sort_values("fecha").reset_index(drop=True)
-    df.set_index("fecha", inplace=True)
+    return df
+
+
+def _imputar(df):
+    df = df.set_index("fecha")
 
     # Imputar datos de forma segura
     df.interpolate(method="time", inplace=True)  # Interpola suavemente
@@ -38,3 +64,269 @@ def cargar_y_unir_datos():
     df = df.reset_index()
 
     return df
+
+
+# ---------------------------------------------------------------------------
+# Caché compilada: el dataset ya limpio, unido e imputado se guarda como una
+# columna .npy por variable y se abre con memoria mapeada. Solo se reconstruye
+# si cambia el mtime/tamaño de alguna fuente y además cambia su contenido (hash).
+# En crudo/ se guarda también la unión sin imputar, que es lo que necesita la
+# ingesta incremental para reimputar solo la cola.
+# ---------------------------------------------------------------------------
+
+def _hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _firma_fuentes(directorio, con_hash=True):
+    firmas = {}
+    for nombre, archivo in FUENTES.items():
+        ruta = os.path.join(directorio, archivo)
+        estado = os.stat(ruta)
+        firmas[nombre] = {
+            "mtime_ns": estado.st_mtime_ns,
+            "tamano": estado.st_size,
+            "sha256": _hash_archivo(ruta) if con_hash else None,
+        }
+    return firmas
+
+
+def _ruta_cache(directorio, directorio_cache):
+    # Una subcarpeta por directorio de datos, para que varias estaciones no se pisen
+    clave = hashlib.sha1(os.path.abspath(directorio).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directorio_cache, clave)
+
+
+def _cache_vigente(ruta, directorio):
+    try:
+        with open(os.path.join(ruta, "manifiesto.json"), encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if manifiesto.get("version") != VERSION_CACHE:
+        return False
+
+    actualizar = False
+    for nombre, archivo in FUENTES.items():
+        guardada = manifiesto["fuentes"].get(nombre)
+        if guardada is None:
+            return False
+        estado = os.stat(os.path.join(directorio, archivo))
+        if estado.st_mtime_ns == guardada["mtime_ns"] and estado.st_size == guardada["tamano"]:
+            continue
+        # El mtime cambió (p. ej. un checkout o un touch): comprobar el contenido
+        if _hash_archivo(os.path.join(directorio, archivo)) != guardada["sha256"]:
+            return False
+        guardada["mtime_ns"] = estado.st_mtime_ns
+        guardada["tamano"] = estado.st_size
+        actualizar = True
+
+    if actualizar:
+        _escribir_manifiesto(ruta, manifiesto)
+    return True
+
+
+def _escribir_manifiesto(ruta, manifiesto):
+    temporal = os.path.join(ruta, "manifiesto.json.tmp")
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2)
+    os.replace(temporal, os.path.join(ruta, "manifiesto.json"))
+
+
+def _guardar_columnas(ruta, df):
+    os.makedirs(ruta, exist_ok=True)
+    for columna in df.columns:
+        np.save(os.path.join(ruta, f"{columna}.npy"), np.ascontiguousarray(df[columna].to_numpy()))
+
+
+def _leer_columnas(ruta, columnas):
+    # mmap_mode="c": las columnas se leen bajo demanda y quien las modifique
+    # trabaja sobre una copia privada, nunca sobre el archivo
+    return pd.DataFrame({
+        columna: np.load(os.path.join(ruta, f"{columna}.npy"), mmap_mode="c")
+        for columna in columnas
+    }, copy=False)
+
+
+def _guardar_cache(ruta, df, crudo, firmas):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = tempfile.mkdtemp(prefix=".cache-", dir=os.path.dirname(ruta) or ".")
+    try:
+        _guardar_columnas(temporal, df)
+        _guardar_columnas(os.path.join(temporal, "crudo"), crudo)
+        _escribir_manifiesto(temporal, {
+            "version": VERSION_CACHE,
+            "columnas": list(df.columns),
+            "filas": len(df),
+            "fuentes": firmas,
+        })
+        if os.path.isdir(ruta):
+            shutil.rmtree(ruta)
+        os.replace(temporal, ruta)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+
+def _leer_cache(ruta, con_crudo=False):
+    with open(os.path.join(ruta, "manifiesto.json"), encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    df = _leer_columnas(ruta, manifiesto["columnas"])
+    if con_crudo:
+        return df, _leer_columnas(os.path.join(ruta, "crudo"), manifiesto["columnas"])
+    return df
+
+
+@medir("carga_datos", filas=len)
+def cargar_y_unir_datos(directorio=DIRECTORIO_DATOS, usar_cache=True, directorio_cache=DIRECTORIO_CACHE):
+    if not usar_cache:
+        return _imputar(_unir_fuentes(directorio))
+
+    ruta = _ruta_cache(directorio, directorio_cache)
+    if _cache_vigente(ruta, directorio):
+        return _leer_cache(ruta)
+
+    firmas = _firma_fuentes(directorio)
+    crudo = _unir_fuentes(directorio)
+    df = _imputar(crudo)
+    _guardar_cache(ruta, df, crudo, firmas)
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Ingesta incremental: agrega lecturas nuevas a los CSV y actualiza la caché
+# reimputando solo la cola afectada. El resultado es idéntico al de una
+# reconstrucción completa a partir de los CSV ya ampliados.
+# ---------------------------------------------------------------------------
+
+def _formatear_fecha(fecha):
+    if fecha == fecha.normalize():
+        return fecha.strftime("%Y/%m/%d")
+    return fecha.strftime("%Y/%m/%d %H:%M:%S")
+
+
+def _agregar_a_csv(ruta, variable, fechas, valores):
+    with open(ruta, "rb") as f:
+        cabecera = f.readline().decode("utf-8")
+        f.seek(-1, os.SEEK_END)
+        termina_en_salto = f.read(1) == b"\n"
+
+    # Las filas nuevas usan el mismo fin de línea que el archivo (los CSV del repositorio son CRLF)
+    salto = "\r\n" if cabecera.endswith("\r\n") else "\n"
+    relleno = "," * (len(cabecera.split(",")) - 2)
+    texto = "".join(
+        f"{_formatear_fecha(fecha)},{'' if np.isnan(valor) else repr(float(valor))}{relleno}{salto}"
+        for fecha, valor in zip(fechas, valores)
+    )
+    with open(ruta, "a", encoding="utf-8", newline="") as f:
+        if not termina_en_salto:
+            f.write(salto)
+        f.write(texto)
+
+    # Devolver las filas tal como las leerá una reconstrucción completa: el
+    # parser de read_csv no siempre recupera el float exacto de repr()
+    return _leer_fuente(io.StringIO(cabecera + texto), variable)
+
+
+def _reimputar_cola(df_anterior, crudo_anterior, crudo):
+    columnas = [c for c in crudo.columns if c != "fecha"]
+
+    # Última lectura válida de cada variable antes de la ingesta: desde ahí en
+    # adelante la interpolación (y la extrapolación de la cola) puede cambiar
+    ultimas = {}
+    for columna in columnas:
+        validas = np.flatnonzero(crudo_anterior[columna].notna().to_numpy())
+        if len(validas) == 0:
+            return None
+        ultimas[columna] = int(validas[-1])
+    inicio = min(ultimas.values())
+
+    fechas_cola = pd.DatetimeIndex(crudo["fecha"].iloc[inicio:])
+    cola = df_anterior.set_index("fecha").reindex(fechas_cola)
+
+    # Filas de la ventana que ya sobrevivían al dropna o que son nuevas; las
+    # descartadas antes por huecos grandes siguen descartadas
+    conservar = fechas_cola.isin(df_anterior["fecha"])
+    conservar[len(crudo_anterior) - inicio:] = True
+
+    for columna in columnas:
+        desde = ultimas[columna]
+        tramo = pd.Series(crudo[columna].iloc[desde:].to_numpy(), index=pd.DatetimeIndex(crudo["fecha"].iloc[desde:]))
+        tramo = tramo.interpolate(method="time")
+        cola.loc[tramo.index, columna] = tramo.to_numpy()
+
+    cola = cola[conservar].rename_axis("fecha").reset_index()
+    cabeza = df_anterior[df_anterior["fecha"] < fechas_cola[0]]
+    return pd.concat([cabeza, cola], ignore_index=True)
+
+
+def ingerir_nuevos(nuevos, directorio=DIRECTORIO_DATOS, directorio_cache=DIRECTORIO_CACHE, informar=print):
+    # nuevos: DataFrame con "fecha" y cualquiera de caudal/nivel/precipitacion.
+    # Una lectura en una fecha que ya tiene valor lo sustituye (se agrega al CSV y
+    # al leer gana la última fila); las sustituciones se avisan con informar
+    nuevos = nuevos.copy()
+    nuevos["fecha"] = pd.to_datetime(nuevos["fecha"])
+    if nuevos["fecha"].isna().any():
+        raise ValueError("Hay lecturas nuevas sin fecha válida")
+    nuevos = nuevos.drop_duplicates(subset="fecha", keep="last").sort_values("fecha").reset_index(drop=True)
+    variables = [v for v in FUENTES if v in nuevos.columns]
+    if nuevos.empty or not variables:
+        return cargar_y_unir_datos(directorio, directorio_cache=directorio_cache)
+
+    # Asegurar que la caché refleja los CSV actuales antes de agregar nada
+    cargar_y_unir_datos(directorio, directorio_cache=directorio_cache)
+    ruta = _ruta_cache(directorio, directorio_cache)
+    df_anterior, crudo_anterior = _leer_cache(ruta, con_crudo=True)
+
+    anteriores = crudo_anterior.set_index("fecha")
+    for variable in variables:
+        existentes = anteriores[variable].dropna().index
+        sustituidas = nuevos["fecha"][nuevos["fecha"].isin(existentes) & nuevos[variable].notna()]
+        if len(sustituidas):
+            informar(f"⚠️ {variable}: {len(sustituidas)} lectura(s) sustituyen valores ya guardados "
+                     f"({sustituidas.iloc[0].date()} a {sustituidas.iloc[-1].date()})")
+
+    agregadas = [
+        _agregar_a_csv(
+            os.path.join(directorio, FUENTES[variable]),
+            variable,
+            nuevos["fecha"],
+            nuevos[variable].astype(float).to_numpy(),
+        )
+        for variable in variables
+    ]
+
+    # La vía incremental solo vale si lo nuevo va estrictamente después de lo
+    # que ya había; si no (huecos rellenados o valores sustituidos), se
+    # reconstruye todo desde los CSV
+    ultima_fecha = crudo_anterior["fecha"].iloc[-1] if len(crudo_anterior) else pd.NaT
+    if pd.isna(ultima_fecha) or nuevos["fecha"].iloc[0] <= ultima_fecha:
+        return cargar_y_unir_datos(directorio, directorio_cache=directorio_cache)
+
+    filas = agregadas[0]
+    for agregada in agregadas[1:]:
+        filas = pd.merge(filas, agregada, on="fecha", how="outer")
+    filas = filas.reindex(columns=crudo_anterior.columns)
+    crudo = pd.concat([crudo_anterior, filas], ignore_index=True)
+
+    df = _reimputar_cola(df_anterior, crudo_anterior, crudo)
+    if df is None:
+        return cargar_y_unir_datos(directorio, directorio_cache=directorio_cache)
+
+    _guardar_cache(ruta, df, crudo, _firma_fuentes(directorio))
+    return _leer_cache(ruta)
+
+
+if __name__ == "__main__":
+    # Uso: python -m src.preparar_datos lecturas_nuevas.csv
+    # (columnas: fecha y cualquiera de caudal, nivel, precipitacion)
+    import sys
+
+    for archivo in sys.argv[1:]:
+        df = ingerir_nuevos(pd.read_csv(archivo))
+        print(f"{archivo}: {len(df)} filas, última fecha {df['fecha'].iloc[-1].date()}")
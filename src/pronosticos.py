@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from src.preparar_datos import DIRECTORIO_DATOS
+
+# Pronósticos publicados por el modo por lotes de main.py. Cada ejecución deja
+# pronosticos/<versión>/ con el forecast en Parquet, un manifiesto JSON (fecha
+# de creación, huella de los datos, rango, columnas) y, si se pide, los gráficos.
+# pronosticos/ultimo.json apunta a la última versión completa: la app solo lee
+# ese Parquet y nunca entrena.
+
+DIRECTORIO_PRONOSTICOS = "pronosticos"
+ARCHIVO_FORECAST = "forecast.parquet"
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+ARCHIVO_ALERTAS = "alertas.json"  # estado del motor de alertas del último pronóstico publicado
+
+
+def _ruta_ultimo(directorio):
+    return os.path.join(directorio, "ultimo.json")
+
+
+def _sha256(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def publicar_pronostico(forecast, directorio_datos=DIRECTORIO_DATOS, directorio=DIRECTORIO_PRONOSTICOS,
+                        graficos=None, motor=None, conservar=None):
+    # graficos: {nombre_archivo: función(forecast, ruta)} que se ejecutan dentro de la versión
+    # (importación diferida: el servicio de consultas lee este módulo sin cargar sklearn)
+    from src.almacen_modelos import huella_datos
+    from src.motores import incertidumbre_configurada, motor_configurado
+
+    creado = datetime.now(timezone.utc)
+    huella = huella_datos(directorio_datos)
+    version = f"{creado:%Y%m%dT%H%M%S}-{huella[:8]}"
+    os.makedirs(directorio, exist_ok=True)
+
+    # Igual que en el almacén de modelos: se escribe aparte y se renombra al final
+    temporal = tempfile.mkdtemp(prefix=f".{version}-", dir=directorio)
+    try:
+        forecast.to_parquet(os.path.join(temporal, ARCHIVO_FORECAST), index=False)
+        archivos = {"forecast": ARCHIVO_FORECAST}
+        for nombre, graficar in (graficos or {}).items():
+            graficar(forecast, os.path.join(temporal, nombre))
+            archivos[os.path.splitext(nombre)[0]] = nombre
+
+        manifiesto = {
+            "version": version,
+            "creado": creado.isoformat(timespec="seconds"),
+            "huella_datos": huella,
+            "directorio_datos": directorio_datos,
+            "motor": motor_configurado(motor),
+            "incertidumbre": incertidumbre_configurada(),
+            "filas": int(len(forecast)),
+            "columnas": list(map(str, forecast.columns)),
+            "desde": pd.Timestamp(forecast["ds"].min()).isoformat(),
+            "hasta": pd.Timestamp(forecast["ds"].max()).isoformat(),
+            "archivos": archivos,
+            "sha256_forecast": _sha256(os.path.join(temporal, ARCHIVO_FORECAST)),
+        }
+        with open(os.path.join(temporal, ARCHIVO_MANIFIESTO), "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+
+        os.replace(temporal, os.path.join(directorio, version))
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+
+    ruta = _ruta_ultimo(directorio)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+    os.replace(ruta + ".tmp", ruta)
+
+    if conservar:
+        for antigua in versiones(directorio)[:-conservar]:
+            shutil.rmtree(os.path.join(directorio, antigua), ignore_errors=True)
+
+    return manifiesto
+
+
+def versiones(directorio=DIRECTORIO_PRONOSTICOS):
+    # Ordenadas de la más antigua a la más reciente (el nombre empieza por la fecha)
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(
+        nombre for nombre in os.listdir(directorio)
+        if not nombre.startswith(".") and os.path.isfile(os.path.join(directorio, nombre, ARCHIVO_MANIFIESTO))
+    )
+
+
+def version_vigente(directorio=DIRECTORIO_PRONOSTICOS):
+    try:
+        with open(_ruta_ultimo(directorio), encoding="utf-8") as f:
+            version = json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return version if os.path.isdir(os.path.join(directorio, version)) else None
+
+
+def cargar_manifiesto(version, directorio=DIRECTORIO_PRONOSTICOS):
+    with open(os.path.join(directorio, version, ARCHIVO_MANIFIESTO), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cargar_pronostico_publicado(version=None, directorio=DIRECTORIO_PRONOSTICOS, columnas=None):
+    version = version or version_vigente(directorio)
+    if version is None:
+        return None, None
+    forecast = pd.read_parquet(os.path.join(directorio, version, ARCHIVO_FORECAST), columns=columnas)
+    return forecast, cargar_manifiesto(version, directorio)
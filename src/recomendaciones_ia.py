@@ -1,24 +1,212 @@
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from src.contexto_llm import resumir_pronostico
+from src.instrumentacion import tramo
+
 # Cargar las variables del archivo .env
 load_dotenv()
 
-# Configurar la API key de Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# El SDK de Gemini se importa y configura con la API key en la primera llamada
+modelo = None
+
+
+def modelo_gemini():
+    global modelo
+    if modelo is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        modelo = genai.GenerativeModel("models/gemini-2.0-flash")
+    return modelo
+
+
+# ---------------------------------------------------------------------------
+# Cliente LLM: backend intercambiable (Gemini o un stub local para pruebas),
+# llamadas independientes en paralelo con asyncio y caché de respuestas por
+# (hash del prompt, versión del forecast) con caducidad (TTL) y expulsión LRU.
+# Peticiones idénticas simultáneas comparten una sola llamada, y si el backend
+# falla o tarda más de LLM_TIMEOUT segundos se devuelve un aviso (sin cachear).
+# El backend se elige con LLM_BACKEND=gemini|local.
+# ---------------------------------------------------------------------------
+
+RESPUESTA_FALLBACK = "⚠️ No se pudo obtener respuesta del asistente ({motivo}). Inténtalo de nuevo en unos segundos."
+
+class BackendGemini:
+    def __init__(self, modelo_generativo=None):
+        self.modelo = modelo_generativo
+
+    def generar(self, prompt):
+        if self.modelo is None:
+            self.modelo = modelo_gemini()
+        return self.modelo.generate_content(prompt).text.strip()
+
+
+class BackendLocal:
+    # Respuestas deterministas sin red; guarda los prompts recibidos para inspección
+    def __init__(self, respuesta=None, demora=0.0):
+        self.respuesta = respuesta
+        self.demora = demora
+        self.prompts = []
+
+    def generar(self, prompt):
+        self.prompts.append(prompt)
+        if self.demora:
+            time.sleep(self.demora)
+        if self.respuesta is not None:
+            return self.respuesta
+        return f"[respuesta local {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]}]"
+
+
+BACKENDS = {
+    "gemini": BackendGemini,
+    "local": BackendLocal,
+}
+
+
+class CacheRespuestas:
+    def __init__(self, ttl=3600.0, max_entradas=256):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def obtener(self, clave):
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            momento, respuesta = entrada
+            if time.monotonic() - momento > self.ttl:
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return respuesta
+
+    def guardar(self, clave, respuesta):
+        with self._candado:
+            self._entradas[clave] = (time.monotonic(), respuesta)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
 
-modelo = genai.GenerativeModel("models/gemini-2.0-flash")
+    def limpiar(self):
+        with self._candado:
+            self._entradas.clear()
 
-def generar_recomendaciones_operativas(df: pd.DataFrame, estacion="H44 Antisana") -> str:
+
+class ClienteLLM:
+    def __init__(self, backend=None, cache=None, timeout=None):
+        if backend is None:
+            nombre = os.getenv("LLM_BACKEND", "gemini")
+            if nombre not in BACKENDS:
+                raise ValueError(f"Backend LLM desconocido: {nombre!r} (usa uno de {', '.join(BACKENDS)})")
+            backend = BACKENDS[nombre]()
+        self.backend = backend
+        self.cache = cache or CacheRespuestas()
+        self.timeout = float(os.getenv("LLM_TIMEOUT", "60")) if timeout is None else timeout
+        # Hilos propios: asyncio.run espera al ejecutor por defecto al cerrar el
+        # bucle, y una llamada colgada anularía el timeout
+        self._hilos = ThreadPoolExecutor(thread_name_prefix="llm")
+        self._en_curso = {}
+        self._candado = threading.Lock()
+
+    @staticmethod
+    def clave(prompt, version=None):
+        return (hashlib.sha256(prompt.encode("utf-8")).hexdigest(), version)
+
+    async def generar_async(self, prompt, version=None):
+        clave = self.clave(prompt, version)
+        respuesta = self.cache.obtener(clave)
+        if respuesta is not None:
+            return respuesta
+        # El SDK es bloqueante: cada llamada va a su propio hilo
+        llamada = asyncio.get_running_loop().run_in_executor(self._hilos, self._llamar_unico, clave, prompt)
+        try:
+            return await asyncio.wait_for(llamada, self.timeout)
+        except asyncio.TimeoutError:
+            return RESPUESTA_FALLBACK.format(motivo=f"sin respuesta en {self.timeout:g} s")
+        except Exception as e:
+            return RESPUESTA_FALLBACK.format(motivo=f"{type(e).__name__}: {e}")
+
+    def _llamar_unico(self, clave, prompt):
+        # La primera petición llama al backend; las idénticas que llegan mientras
+        # tanto esperan su resultado. La respuesta se cachea aunque quien la pidió
+        # ya se haya rendido por timeout.
+        with self._candado:
+            futuro = self._en_curso.get(clave)
+            if futuro is None:
+                respuesta = self.cache.obtener(clave)
+                if respuesta is not None:
+                    return respuesta
+                futuro = self._en_curso[clave] = Future()
+                propia = True
+            else:
+                propia = False
+        if not propia:
+            return futuro.result()
+        try:
+            respuesta = self._llamar(prompt)
+            self.cache.guardar(clave, respuesta)
+            futuro.set_result(respuesta)
+            return respuesta
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._candado:
+                del self._en_curso[clave]
+
+    def _llamar(self, prompt):
+        with tramo("llm", backend=type(self.backend).__name__):
+            return self.backend.generar(prompt)
+
+    async def generar_varios_async(self, prompts, version=None):
+        return await asyncio.gather(*(self.generar_async(p, version) for p in prompts))
+
+    def generar(self, prompt, version=None):
+        return self.generar_varios([prompt], version)[0]
+
+    def generar_varios(self, prompts, version=None):
+        # Las llamadas independientes salen a la vez: la latencia es la de la más lenta
+        return asyncio.run(self.generar_varios_async(prompts, version))
+
+
+_cliente = None
+
+
+def obtener_cliente():
+    # Un cliente por proceso, así la caché sobrevive a los reruns de Streamlit
+    global _cliente
+    if _cliente is None:
+        _cliente = ClienteLLM()
+    return _cliente
+
+
+def version_forecast(df: pd.DataFrame) -> str:
+    # Cambia solo si cambian las fechas o el nivel estimado
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(df["ds"].to_numpy(dtype="datetime64[ns]")).tobytes())
+    h.update(np.ascontiguousarray(df["nivel_estimado"].to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()[:16]
+
+
+def prompt_recomendaciones_operativas(df: pd.DataFrame, estacion="H44 Antisana") -> str:
     columnas = ["ds", "nivel_estimado"]
     if "precipitacion" in df.columns:
         columnas.append("precipitacion")
 
-    resumen = df[columnas].tail(30).to_string(index=False)
+    resumen = resumir_pronostico(df[columnas].tail(30), presupuesto_tokens=400)
 
-    prompt = f"""
+    return f"""
 Eres un experto en gestión hídrica y control operativo de embalses.
 
 A continuación tienes predicciones para la estación {estacion}, incluyendo nivel de agua estimado (en metros){' y precipitación esperada (en mm)' if 'precipitacion' in df.columns else ''} para los próximos 30 días:
@@ -36,5 +224,7 @@ Con base en estos datos, proporciona **3 a 5 recomendaciones operativas concreta
 Sé claro, específico y profesional.
 """
 
-    respuesta = modelo.generate_content(prompt)
-    return respuesta.text.strip()
+
+def generar_recomendaciones_operativas(df: pd.DataFrame, estacion="H44 Antisana", cliente=None) -> str:
+    cliente = cliente or obtener_cliente()
+    return cliente.generar(prompt_recomendaciones_operativas(df, estacion), version_forecast(df))
@@ -0,0 +1,232 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.pronosticos import DIRECTORIO_PRONOSTICOS, cargar_pronostico_publicado, version_vigente
+from src.instrumentacion import metricas_prometheus, tramo
+
+# Servicio HTTP de solo lectura sobre el último pronóstico publicado por
+# `main.py --lote`. No carga Prophet ni sklearn: solo lee el Parquet una vez por
+# versión y responde desde memoria.
+#   GET /pronostico?desde=2025-01-01&hasta=2025-03-31&columnas=ds,nivel_estimado&formato=csv|json|arrow
+#   GET /version   → manifiesto de la versión servida
+#   GET /salud
+#   GET /metricas  → tramos del servicio en texto de Prometheus (con INSTRUMENTACION=1)
+# El rango se resuelve con búsqueda binaria sobre las fechas ordenadas. Cada
+# respuesta lleva un ETag (versión + consulta) y se guarda ya serializada; con
+# If-None-Match se responde 304. Al publicarse una versión nueva se recarga el
+# Parquet y se vacía la caché; si no se puede leer se responde 503, se sigue
+# con la versión anterior en memoria y se reintenta en la siguiente petición.
+#   python -m src.servicio --puerto 8502
+
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+MAX_RESPUESTAS_CACHE = 512
+
+
+class AlmacenConsultas:
+    def __init__(self, directorio=DIRECTORIO_PRONOSTICOS, max_respuestas=MAX_RESPUESTAS_CACHE):
+        self.directorio = directorio
+        self.max_respuestas = max_respuestas
+        self.version = None
+        self.manifiesto = None
+        self.forecast = None
+        self.fechas = None
+        self._firma_ultimo = None
+        self._respuestas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def _firma(self):
+        # Solo se relee ultimo.json si cambió en disco
+        try:
+            estado = os.stat(os.path.join(self.directorio, "ultimo.json"))
+        except OSError:
+            return None
+        return estado.st_mtime_ns, estado.st_size
+
+    def actualizar(self):
+        firma = self._firma()
+        if firma == self._firma_ultimo and self.forecast is not None:
+            return
+        with self._candado:
+            if firma == self._firma_ultimo and self.forecast is not None:
+                return
+            version = version_vigente(self.directorio)
+            if version is not None and version != self.version:
+                # Si falla la lectura (OSError) no se toca nada y la firma queda
+                # sin actualizar para reintentar
+                forecast, manifiesto = cargar_pronostico_publicado(version, self.directorio)
+                forecast = forecast.sort_values("ds", kind="stable").reset_index(drop=True)
+                self.forecast, self.manifiesto, self.version = forecast, manifiesto, version
+                self.fechas = forecast["ds"].to_numpy(dtype="datetime64[ns]")
+                self._respuestas.clear()
+            self._firma_ultimo = firma
+
+    def instantanea(self):
+        # Versión, manifiesto, datos y fechas de una sola vez: una recarga
+        # concurrente no puede mezclar la versión de una con los datos de otra
+        with self._candado:
+            return self.version, self.manifiesto, self.forecast, self.fechas
+
+    def consultar(self, desde=None, hasta=None, columnas=None, formato="csv"):
+        # Devuelve (versión, etag, tipo, cuerpo); lanza ValueError si la consulta
+        # no es válida y OSError si no se pudo leer la versión publicada
+        self.actualizar()
+        version, _, forecast, fechas = self.instantanea()
+        if forecast is None:
+            raise LookupError("No hay ningún pronóstico publicado")
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconocido: {formato!r} (usa uno de {', '.join(FORMATOS)})")
+        if columnas:
+            desconocidas = [c for c in columnas if c not in forecast.columns]
+            if desconocidas:
+                raise ValueError(f"Columnas desconocidas: {', '.join(desconocidas)}")
+            columnas = list(dict.fromkeys(["ds", *columnas]))
+        else:
+            columnas = list(forecast.columns)
+
+        desde = pd.Timestamp(desde) if desde else None
+        hasta = pd.Timestamp(hasta) if hasta else None
+        clave = (version, desde, hasta, tuple(columnas), formato)
+        with self._candado:
+            if clave in self._respuestas:
+                self._respuestas.move_to_end(clave)
+                return self._respuestas[clave]
+
+        i = 0 if desde is None else np.searchsorted(fechas, desde.to_datetime64(), side="left")
+        j = len(fechas) if hasta is None else np.searchsorted(fechas, hasta.to_datetime64(), side="right")
+        seleccion = forecast.iloc[i:max(i, j)][columnas]
+
+        respuesta = (
+            version,
+            '"' + hashlib.sha1(repr(clave).encode("utf-8")).hexdigest() + '"',
+            FORMATOS[formato],
+            serializar(seleccion, formato),
+        )
+        with self._candado:
+            self._respuestas[clave] = respuesta
+            while len(self._respuestas) > self.max_respuestas:
+                self._respuestas.popitem(last=False)
+        return respuesta
+
+
+def serializar(df, formato):
+    if formato == "csv":
+        return df.to_csv(index=False, date_format="%Y-%m-%d").encode("utf-8")
+    if formato == "json":
+        return df.to_json(orient="records", date_format="iso", date_unit="s").encode("utf-8")
+
+    import pyarrow as pa
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    salida = pa.BufferOutputStream()
+    with pa.ipc.new_stream(salida, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return salida.getvalue().to_pybytes()
+
+
+def crear_manejador(almacen):
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _responder(self, estado, cuerpo=b"", tipo="application/json", etag=None, version=None):
+            self.send_response(estado)
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            version = version or almacen.version
+            if version:
+                self.send_header("X-Version-Pronostico", version)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(cuerpo)
+
+        def _error(self, estado, mensaje):
+            self._responder(estado, json.dumps({"error": mensaje}, ensure_ascii=False).encode("utf-8"))
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parametros = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+            if url.path == "/salud":
+                return self._responder(200, b'{"estado": "ok"}')
+
+            if url.path == "/metricas":
+                return self._responder(200, metricas_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+
+            if url.path == "/version":
+                try:
+                    almacen.actualizar()
+                except OSError as e:
+                    return self._error(503, f"No se pudo leer el pronóstico publicado: {e}")
+                except ValueError as e:
+                    return self._error(500, str(e))
+                version, manifiesto, _, _ = almacen.instantanea()
+                if manifiesto is None:
+                    return self._error(404, "No hay ningún pronóstico publicado")
+                return self._responder(200, json.dumps(manifiesto, ensure_ascii=False).encode("utf-8"), version=version)
+
+            if url.path != "/pronostico":
+                return self._error(404, f"Ruta desconocida: {url.path}")
+
+            columnas = [c for c in parametros.get("columnas", "").split(",") if c]
+            try:
+                with tramo("consulta"):
+                    version, etag, tipo, cuerpo = almacen.consultar(
+                        parametros.get("desde"), parametros.get("hasta"), columnas, parametros.get("formato", "csv"),
+                    )
+            except OSError as e:
+                return self._error(503, f"No se pudo leer el pronóstico publicado: {e}")
+            except LookupError as e:
+                return self._error(404, str(e))
+            except ValueError as e:
+                return self._error(400, str(e))
+
+            if etag in (e.strip() for e in self.headers.get("If-None-Match", "").split(",")):
+                return self._responder(304, etag=etag, tipo=tipo, version=version)
+            return self._responder(200, cuerpo, tipo, etag, version)
+
+        def log_message(self, formato, *args):
+            # Sin un print por petición: los tableros consultan con mucha frecuencia
+            pass
+
+    return Manejador
+
+
+def servir(puerto=8502, host="0.0.0.0", directorio=DIRECTORIO_PRONOSTICOS):
+    almacen = AlmacenConsultas(directorio)
+    servidor = ThreadingHTTPServer((host, puerto), crear_manejador(almacen))
+    servidor.daemon_threads = True
+    return servidor, almacen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP de consulta de pronósticos publicados")
+    parser.add_argument("--puerto", type=int, default=8502)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--directorio", default=DIRECTORIO_PRONOSTICOS)
+    args = parser.parse_args()
+
+    servidor, _ = servir(args.puerto, args.host, args.directorio)
+    print(f"🌐 Sirviendo pronósticos de {args.directorio}/ en http://{args.host}:{args.puerto}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from src.contexto_llm import estimar_tokens, resumir_pronostico, tramos_superacion
+
+
+def _anio_con_tramos():
+    # Un año que cruza el nivel crítico (5 m) en varios tramos
+    rng = np.random.default_rng(0)
+    ds = pd.date_range("2025-01-01", periods=365)
+    nivel = 4.8 + 0.4 * np.sin(np.arange(365) / 60 * 2 * np.pi) + rng.normal(0, 0.02, 365)
+    return pd.DataFrame({"ds": ds, "nivel_estimado": nivel, "precipitacion": rng.gamma(1, 3, 365)})
+
+
+def test_fechas_criticas_sobreviven_con_presupuesto_pequeno():
+    df = _anio_con_tramos()
+    tramos = tramos_superacion(df["ds"].to_numpy(), df["nivel_estimado"].to_numpy(), 5.0)
+    assert len(tramos) > 4
+
+    texto = resumir_pronostico(df, presupuesto_tokens=150)
+    assert estimar_tokens(texto) <= 150
+    # La tabla se pierde antes que cualquier tramo
+    assert "Detalle" not in texto
+    for inicio, fin, _ in tramos:
+        assert f"{pd.Timestamp(inicio):%Y-%m-%d} a {pd.Timestamp(fin):%Y-%m-%d}" in texto
+
+
+def test_tabla_baja_de_detalle_antes_de_quitar_tramos():
+    df = _anio_con_tramos()
+    tramos = tramos_superacion(df["ds"].to_numpy(), df["nivel_estimado"].to_numpy(), 5.0)
+
+    texto = resumir_pronostico(df, presupuesto_tokens=400)
+    assert "Detalle mensual" in texto
+    assert all(f"{pd.Timestamp(inicio):%Y-%m-%d}" in texto for inicio, _, _ in tramos)
+
+
+def test_un_anio_sale_diez_veces_mas_corto():
+    df = _anio_con_tramos()
+    assert len(df.to_string()) >= 10 * len(resumir_pronostico(df))
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from src.escenarios import simular_escenarios
+from src.predecir_nivel import ajustar_modelo_nivel, aplicar_modelo_nivel
+
+
+def _datos(dias=730, horizonte=30):
+    rng = np.random.default_rng(0)
+    fechas = pd.date_range("2020-01-01", periods=dias)
+    t = np.arange(dias)
+    caudal = 1 + 0.5 * np.sin(2 * np.pi * t / 365) + rng.normal(0, 0.05, dias)
+    precipitacion = rng.gamma(1, 2, dias)
+    nivel = 5 + 2 * caudal + 0.05 * precipitacion + rng.normal(0, 0.05, dias)
+    df = pd.DataFrame({"fecha": fechas, "caudal": caudal, "nivel": nivel, "precipitacion": precipitacion})
+
+    # Historia + horizonte, con el caudal del horizonte lejos de 0 desde el primer día
+    forecast = pd.DataFrame({
+        "ds": pd.date_range(fechas[0], periods=dias + horizonte),
+        "yhat": np.concatenate([caudal, caudal[-1] + 0.3 * np.sin(np.arange(horizonte) / 5)]),
+    })
+    return df, forecast
+
+
+def test_escenario_seco_reproduce_predecir_nivel():
+    df, forecast = _datos()
+    modelo, fecha_inicio = ajustar_modelo_nivel(df)
+    esperado = aplicar_modelo_nivel(modelo, forecast.copy(), fecha_inicio)
+    esperado = esperado[esperado["ds"] > df["fecha"].max()].reset_index(drop=True)
+
+    # Sin lluvia en la historia, todos los escenarios son el escenario seco de predecir_nivel
+    seco = df.assign(precipitacion=0.0)
+    resumen = simular_escenarios(modelo, forecast, seco, n_escenarios=20, fecha_inicio=fecha_inicio, n_jobs=1)
+
+    assert (resumen["ds"].to_numpy() == esperado["ds"].to_numpy()).all()
+    np.testing.assert_allclose(resumen["nivel_medio"], esperado["nivel_estimado"], atol=1e-4)
+    np.testing.assert_allclose(resumen["nivel_p05"], resumen["nivel_p95"])
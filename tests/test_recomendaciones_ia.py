@@ -0,0 +1,87 @@
+import threading
+import time
+
+from src.recomendaciones_ia import BackendLocal, CacheRespuestas, ClienteLLM
+
+
+class BackendFallido:
+    def __init__(self):
+        self.llamadas = 0
+
+    def generar(self, prompt):
+        self.llamadas += 1
+        raise ConnectionError("sin red")
+
+
+def test_cache_acierto_y_fallo():
+    backend = BackendLocal()
+    cliente = ClienteLLM(backend)
+    primera = cliente.generar("¿nivel?", "v1")
+    assert cliente.generar("¿nivel?", "v1") == primera
+    assert len(backend.prompts) == 1
+    # Otra versión del forecast u otro prompt no aciertan
+    cliente.generar("¿nivel?", "v2")
+    cliente.generar("¿caudal?", "v1")
+    assert len(backend.prompts) == 3
+
+
+def test_cache_caduca_por_ttl():
+    backend = BackendLocal()
+    cliente = ClienteLLM(backend, CacheRespuestas(ttl=0.05))
+    cliente.generar("¿nivel?")
+    time.sleep(0.1)
+    cliente.generar("¿nivel?")
+    assert len(backend.prompts) == 2
+
+
+def test_cache_expulsa_la_menos_usada():
+    backend = BackendLocal()
+    cliente = ClienteLLM(backend, CacheRespuestas(max_entradas=2))
+    cliente.generar("a")
+    cliente.generar("b")
+    cliente.generar("a")  # acierto: "b" pasa a ser la menos usada
+    cliente.generar("c")
+    assert backend.prompts == ["a", "b", "c"]
+    cliente.generar("a")
+    cliente.generar("b")
+    assert backend.prompts == ["a", "b", "c", "b"]
+
+
+def test_peticiones_identicas_simultaneas_se_llaman_una_vez():
+    backend = BackendLocal(demora=0.2)
+    cliente = ClienteLLM(backend)
+    assert len(set(cliente.generar_varios(["¿nivel?"] * 3, "v1"))) == 1
+    assert len(backend.prompts) == 1
+
+    # También entre hilos, cada uno con su propio bucle (reruns de Streamlit)
+    respuestas = []
+    hilos = [threading.Thread(target=lambda: respuestas.append(cliente.generar("¿caudal?", "v1")))
+             for _ in range(3)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(set(respuestas)) == 1
+    assert backend.prompts.count("¿caudal?") == 1
+
+
+def test_timeout_devuelve_aviso_sin_esperar():
+    backend = BackendLocal(respuesta="lenta", demora=0.5)
+    cliente = ClienteLLM(backend, timeout=0.05)
+    inicio = time.perf_counter()
+    respuesta = cliente.generar("¿nivel?")
+    assert time.perf_counter() - inicio < 0.4
+    assert "No se pudo obtener respuesta" in respuesta
+    # La llamada termina en segundo plano y deja la respuesta en caché
+    time.sleep(0.6)
+    assert cliente.generar("¿nivel?") == "lenta"
+    assert len(backend.prompts) == 1
+
+
+def test_error_del_backend_devuelve_aviso_y_no_se_cachea():
+    backend = BackendFallido()
+    cliente = ClienteLLM(backend)
+    respuesta = cliente.generar("¿nivel?")
+    assert "ConnectionError" in respuesta
+    cliente.generar("¿nivel?")
+    assert backend.llamadas == 2
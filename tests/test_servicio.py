@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from src.servicio import servir
+
+
+def _publicar(directorio, version, forecast, instante):
+    # Una versión a mano, con la estructura de src.pronosticos
+    os.makedirs(directorio / version)
+    forecast.to_parquet(directorio / version / "forecast.parquet", index=False)
+    (directorio / version / "manifiesto.json").write_text(json.dumps({"version": version}), encoding="utf-8")
+    (directorio / "ultimo.json").write_text(json.dumps({"version": version}), encoding="utf-8")
+    os.utime(directorio / "ultimo.json", ns=(instante, instante))
+
+
+def _get(puerto, ruta):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{puerto}{ruta}") as respuesta:
+            return respuesta.status, respuesta.headers, respuesta.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_recarga_fallida_responde_503_y_conserva_la_version(tmp_path):
+    forecast = pd.DataFrame({"ds": pd.date_range("2025-01-01", periods=10), "nivel_estimado": range(10)})
+    _publicar(tmp_path, "v1", forecast, 1_000_000_000)
+
+    servidor, almacen = servir(0, "127.0.0.1", str(tmp_path))
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    puerto = servidor.server_address[1]
+    try:
+        estado, cabeceras, cuerpo = _get(puerto, "/pronostico?desde=2025-01-03&hasta=2025-01-04")
+        assert estado == 200
+        assert cabeceras["X-Version-Pronostico"] == "v1"
+        assert cuerpo.decode("utf-8").splitlines()[1:] == ["2025-01-03,2", "2025-01-04,3"]
+
+        # v2 se publica sin su Parquet: la recarga falla con OSError
+        _publicar(tmp_path, "v2", forecast, 2_000_000_000)
+        os.remove(tmp_path / "v2" / "forecast.parquet")
+        estado, _, cuerpo = _get(puerto, "/pronostico")
+        assert estado == 503
+        assert "error" in json.loads(cuerpo)
+        assert almacen.version == "v1"
+        assert len(almacen.instantanea()[2]) == 10
+
+        # En cuanto el archivo aparece, la siguiente petición lo carga
+        forecast.assign(nivel_estimado=forecast["nivel_estimado"] * 10).to_parquet(
+            tmp_path / "v2" / "forecast.parquet", index=False)
+        estado, cabeceras, cuerpo = _get(puerto, "/pronostico?desde=2025-01-03&hasta=2025-01-03")
+        assert estado == 200
+        assert cabeceras["X-Version-Pronostico"] == "v2"
+        assert cuerpo.decode("utf-8").splitlines()[1:] == ["2025-01-03,20"]
+    finally:
+        servidor.shutdown()
+        servidor.server_close()